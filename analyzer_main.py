@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 # Import from your package
 from src.utils import load_script, save_json
 from src.analyzer import ScriptAnalyzer
+from src.timing import export_trace
 
 def main():
     """
@@ -52,6 +53,8 @@ def main():
     else:
         logging.error("No scenes were extracted. Check logs for details.")
 
+    export_trace("analyze")
+
 
 if __name__ == "__main__":
     main()
@@ -1,28 +1,42 @@
 # main_prompt.py
+import argparse
 import json
 import os
 from src.prompt_generator import PromptGenerator
+from src.scene_stream import JsonlWriter, iter_records
 
 def main():
+    parser = argparse.ArgumentParser(description="Build image prompts from output/scenes.json")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse scenes incrementally and write prompts as JSON Lines as they are built")
+    parser.add_argument("--input", default="output/scenes.json",
+                        help="scenes JSON ({\"Scenes\": [...]}); a JSONL file also works with --stream")
+    parser.add_argument("--output", default=None,
+                        help="default: output/image_prompts.json, or .jsonl with --stream")
+    args = parser.parse_args()
+
     os.makedirs("output", exist_ok=True)
+    generator = PromptGenerator()
+
+    if args.stream:
+        output_file = args.output or "output/image_prompts.jsonl"
+        # One scene and one prompt in memory at a time; each line is
+        # flushed so image generation can follow the file while it grows
+        with JsonlWriter(output_file) as writer:
+            for record in generator.generate_all(iter_records(args.input, key="Scenes")):
+                writer.write(record)
+        print(f" Generated {writer.count} image prompts successfully → {output_file}")
+        return
 
-    input_file = "output/scenes.json"
+    input_file = args.input
 
     with open(input_file, "r") as infile:
         data = json.load(infile)
 
     scenes = data.get("Scenes", [])
-    generator = PromptGenerator()
-    prompts_output = []
-
-    for scene in scenes:
-        prompt_text = generator.generate(scene)
-        prompts_output.append({
-            "scene_id": scene["scene_id"],
-            "image_prompt": prompt_text
-        })
+    prompts_output = list(generator.generate_all(scenes))
 
-    with open("output/image_prompts.json", "w") as outfile:
+    with open(args.output or "output/image_prompts.json", "w") as outfile:
         json.dump(prompts_output, outfile, indent=2)
 
     print(f" Generated {len(prompts_output)} image prompts successfully")
@@ -1,11 +1,21 @@
 import os
 from pathlib import Path
 
-BASE_DIR = Path(__file__).resolve().parent.parent
+# PIPELINE_BASE_DIR relocates every BASE_DIR path (used by src/load_test.py
+# to give each synthetic run its own tree)
+BASE_DIR = Path(os.getenv("PIPELINE_BASE_DIR", Path(__file__).resolve().parent.parent))
 
 # Hugging Face Model
 MODEL_ID = "stabilityai/stable-diffusion-xl-base-1.0"
 
+# Provider endpoints; override to point the pipeline at local stand-ins
+# (src/stub_providers.py). HF_INFERENCE_URL replaces MODEL_ID when set.
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+HF_INFERENCE_URL = os.getenv("HF_INFERENCE_URL")
+GOOGLE_TTS_ENDPOINT = os.getenv(
+    "GOOGLE_TTS_ENDPOINT", "https://texttospeech.googleapis.com/v1/text:synthesize"
+)
+
 # Output settings
 IMAGE_WIDTH = 1024
 IMAGE_HEIGHT = 1024
@@ -15,5 +25,147 @@ SLEEP_BETWEEN_REQUESTS = 8  # seconds (important for free tier)
 
 # Paths
 PROMPT_FILE = BASE_DIR / "output" / "image_prompts.json"
+PROMPT_JSONL = BASE_DIR / "output" / "image_prompts.jsonl"  # prompt_main.py --stream
 OUTPUT_DIR = BASE_DIR / "all_images"
 LOG_FILE = BASE_DIR / "logs" / "generation.log"
+
+# Near-duplicate prompts (src/prompt_similarity.py): a scene whose prompt is
+# at least this similar (estimated Jaccard of content-word shingles) to one
+# that already has an image reuses that image instead of calling the model.
+# A threshold above 1 turns reuse off.
+PROMPT_DEDUP_THRESHOLD = float(os.getenv("PROMPT_DEDUP_THRESHOLD", "0.6"))
+PROMPT_DEDUP_VARY = "crop"   # "copy" the image as is, or "crop" a slightly tighter variant
+PROMPT_INDEX = OUTPUT_DIR / "prompt_index.jsonl"   # prompts of every generated image
+PROMPT_DEDUP_REPORT = BASE_DIR / "output" / "image_dedup_report.json"
+
+# Renderer working resolutions (size each effect scales its frame source to)
+EFFECT_FRAME_SIZES = {
+    "ken_burns": (2400, 2400),
+    "slide_pan": (2600, 1460),
+    "rotate_zoom": (2400, 2400),
+    "cinematic_overlay": (2400, 2400),
+    "still": (IMAGE_WIDTH, IMAGE_HEIGHT),
+}
+
+# Pre-sized frames are cached next to the source image in this format
+# (uncompressed, because ffmpeg's `-loop 1` re-reads the file every frame)
+PREPARED_IMAGE_FORMAT = "bmp"
+
+# Pipeline timing traces (src/timing.py)
+TRACE_DIR = BASE_DIR / "output" / "traces"
+
+# FFmpeg job supervision (src/ffmpeg_progress.py)
+FFMPEG_STALL_TIMEOUT = 60    # seconds without progress before a job is killed
+FFMPEG_TIMEOUT = None        # hard limit per attempt in seconds, None = no limit
+FFMPEG_RETRIES = 1           # extra attempts after a killed (hung) encode
+
+# Still-image scene encode (create_scene_videos.py fast path)
+STILL_FPS = 24
+STILL_KEYFRAME_INTERVAL = 10  # seconds between keyframes, nothing moves
+STILL_RENDER_JOBS = max(1, (os.cpu_count() or 2) // 2)
+
+# Final video renditions (stitch_final_video.py --renditions NAME ...)
+# size: output WxH (None = keep scene size), crop: centre crop aspect "W:H",
+# subtitle_style: libass force_style for that rendition's burned subtitles
+RENDITIONS = {
+    "1080p": {"size": (1920, 1080), "crop": None, "crf": 18, "subtitle_style": None},
+    "720p": {"size": (1280, 720), "crop": None, "crf": 21, "subtitle_style": None},
+    "vertical": {
+        "size": (1080, 1920),
+        "crop": "9:16",
+        "crf": 20,
+        "subtitle_style": "FontSize=10,MarginV=40,Outline=1",
+    },
+}
+
+# Distributed scene rendering (src/render_queue.py)
+# The queue database must live on storage every worker node can reach
+RENDER_QUEUE_DB = BASE_DIR / "output" / "render_queue.db"
+RENDER_LEASE_SECONDS = 120     # a job is re-queued if not heartbeated for this long
+RENDER_MAX_ATTEMPTS = 3
+
+# LLM narration (src/narration_llm.py, improve_scenes.py --llm)
+# NARRATION_API_BASE can point at a local OpenAI-compatible mock server
+NARRATION_API_BASE = os.getenv("NARRATION_API_BASE", OPENROUTER_API_BASE)
+NARRATION_MODEL = "allenai/molmo-2-8b:free"
+NARRATION_BATCH_SIZE = 20          # scenes per request
+NARRATION_CONCURRENCY = 4          # batches in flight
+NARRATION_ATTEMPTS = 3             # tries per batch when rate limited (rate: PROVIDER_QUOTAS)
+NARRATION_CACHE = BASE_DIR / "output" / "narration_cache.json"
+
+# Cost-aware scene scheduling (src/scheduler.py)
+# Render cost model per kind: seconds = overhead + rate * audio seconds.
+# These priors are used until timing history has been recorded.
+RENDER_COST_PRIORS = {
+    "ken_burns": (1.0, 1.5),
+    "slide_pan": (1.0, 1.5),
+    "rotate_zoom": (1.0, 2.5),
+    "cinematic_overlay": (1.0, 1.8),
+    "still": (0.5, 0.1),
+}
+RENDER_HISTORY = BASE_DIR / "output" / "render_history.json"
+RENDER_HISTORY_DECAY = 0.8   # weight kept by older runs each time the model is refit
+
+# Host-wide provider quotas shared by every pipeline process (src/quota.py)
+QUOTA_DB = Path(os.getenv("QUOTA_DB", Path.home() / ".cache" / "scene_pipeline" / "quota.db"))
+QUOTA_SCALE = float(os.getenv("QUOTA_SCALE", "1"))   # multiplies every budget (load tests)
+PROVIDER_QUOTAS = {
+    # requests per minute, and how many may be sent back to back
+    "hf": {"per_minute": 60 / SLEEP_BETWEEN_REQUESTS * QUOTA_SCALE, "burst": 1},
+    "tts": {"per_minute": 300 * QUOTA_SCALE, "burst": 10},
+    "openrouter": {"per_minute": 20 * QUOTA_SCALE, "burst": 2},
+}
+QUOTA_BACKOFF_SECONDS = 30   # pause for every process after a 429 without Retry-After
+
+# Narration loudness normalization (src/loudness.py)
+LOUDNESS_TARGET_LUFS = -16.0     # integrated loudness every scene is brought to
+TRUE_PEAK_CEILING_DBTP = -1.5    # gain is limited so no scene peaks above this
+
+# Keyword rules for background audio and voice style presets (src/scene_presets.py);
+# part of the code base, so not relocated with BASE_DIR
+SCENE_PRESETS_FILE = Path(os.getenv(
+    "SCENE_PRESETS_FILE", Path(__file__).resolve().parent.parent / "config" / "scene_presets.json"
+))
+
+# Review preview (src/preview_render.py): whole video at low resolution
+PREVIEW_SETTINGS = {"size": (854, 480), "fps": 12, "preset": "ultrafast", "crf": 30}
+
+# Script revisions (src/scene_revisions.py)
+REVISION_MATCH_THRESHOLD = 0.6   # text similarity for an edited scene to align with its old version
+
+# Background ambience (src/ambience.py): loops per improve_scenes preset in
+# AMBIENCE_DIR/<preset>/ (or AMBIENCE_DIR/<preset>.wav), decoded once to
+# AMBIENCE_CACHE_DIR. Scenes whose preset has no loops get no bed.
+AMBIENCE_DIR = Path(os.getenv("AMBIENCE_DIR", BASE_DIR / "assets" / "ambience"))
+AMBIENCE_CACHE_DIR = BASE_DIR / "output" / "ambience_cache"
+AMBIENCE_LEVEL_DBFS = -32.0      # RMS level of the bed
+AMBIENCE_DUCK_DB = -9.0          # extra attenuation while narration is speaking
+AMBIENCE_FADE_S = 1.0            # bed fade at clip edges / crossfade between presets
+AMBIENCE_LOOP_CROSSFADE_S = 0.5  # crossfade at loop seams
+
+# Scratch workspace for intermediates (src/workspace.py): scene clips and the
+# narration stay in the shared project tree; the concat list and temp audio
+# go to a RAM-backed directory when it has room, to disk otherwise.
+# WORKSPACE_RAM_DIR="" keeps everything on disk.
+WORKSPACE_JOB = os.getenv("PIPELINE_JOB")   # default: derived from BASE_DIR
+WORKSPACE_RAM_DIR = os.getenv("WORKSPACE_RAM_DIR", "/dev/shm/scene_pipeline")
+WORKSPACE_DISK_DIR = BASE_DIR / "output" / "scratch"
+WORKSPACE_RAM_RESERVE_MB = 1024          # RAM left free for the encoders themselves
+
+# Per-host encoder profile (python -m src.encoder_tuning): x264 preset,
+# encoder threads and parallel jobs per render workload, the combination
+# with the most throughput at ENCODER_TARGET quality on this host. Render
+# stages use ENCODER_DEFAULTS until the host has been calibrated.
+ENCODER_PROFILE_DIR = Path(os.getenv(
+    "ENCODER_PROFILE_DIR", Path.home() / ".cache" / "scene_pipeline" / "encoder_profiles"
+))
+# Minimum SSIM and PSNR against a lossless encode of the same sample, and the
+# largest output allowed relative to the default preset's (at a fixed CRF the
+# faster presets keep quality by spending more bits)
+ENCODER_TARGET = {"ssim": 0.97, "psnr_db": 38.0, "size_ratio": 1.3}
+ENCODER_DEFAULTS = {
+    # threads None = x264 decides
+    "still": {"preset": "medium", "threads": None, "jobs": STILL_RENDER_JOBS},
+    "effect": {"preset": "medium", "threads": None, "jobs": os.cpu_count() or 2},
+    "stitch": {"preset": "medium", "threads": None, "jobs": 1},
+}
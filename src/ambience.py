@@ -0,0 +1,356 @@
+"""
+ambience.py
+===========
+
+Background Ambience Mixing
+
+Mixes each scene's narration with a looped ambience bed for the
+`background_audio` preset improve_scenes.py assigned it, in NumPy, and hands
+the result straight to the encode the renderers already run: per-scene clips
+read it from ffmpeg's stdin, the video-only narration track
+(src/narration_track.py) writes it in place of the plain narration. No
+intermediate audio files and no extra ffmpeg pass per scene.
+
+Library
+-------
+Loops live in AMBIENCE_DIR/<preset>/ (any format ffmpeg reads) or as
+AMBIENCE_DIR/<preset>.<ext>, where <preset> is a BACKGROUND_AUDIO_PRESETS
+key ("village", "field", ...). All loops of a preset are decoded once per
+sample rate and channel count, joined with crossfades into one seamless
+loop, leveled to AMBIENCE_LEVEL_DBFS and cached as a .npy file in
+AMBIENCE_CACHE_DIR; later runs memory-map the cache.
+
+Mix
+---
+- The bed is read from the loop at the scene's position on the timeline,
+  so consecutive scenes with the same preset continue one bed. Where the
+  preset changes the two beds crossfade (equal power, AMBIENCE_FADE_S,
+  centred on the cut); at clip edges the bed fades from/to silence.
+- Ducking: the narration's level in 20 ms windows marks speech, widened by
+  a look-ahead and a release hold and smoothed into a gain curve that dips
+  the bed by AMBIENCE_DUCK_DB under the voice.
+- The scene's loudness gain (src/loudness.py) is applied to the narration
+  in the same pass.
+"""
+
+import glob
+import hashlib
+import os
+import struct
+import subprocess
+import threading
+import wave
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.Config import (
+    AMBIENCE_CACHE_DIR,
+    AMBIENCE_DIR,
+    AMBIENCE_DUCK_DB,
+    AMBIENCE_FADE_S,
+    AMBIENCE_LEVEL_DBFS,
+    AMBIENCE_LOOP_CROSSFADE_S,
+)
+from src.improve_scenes import BACKGROUND_AUDIO_PRESETS
+from src.loudness import read_pcm, to_float
+from src.timing import span
+
+#: Extensions picked up as ambience loops
+LOOP_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".m4a")
+
+#: Ducking analysis window, speech threshold and timing
+DUCK_WINDOW_S = 0.02
+DUCK_THRESHOLD_DBFS = -45.0
+DUCK_LOOKAHEAD_S = 0.1
+DUCK_RELEASE_S = 0.4
+DUCK_SMOOTH_S = 0.15
+
+#: background_audio description -> preset key
+_PRESET_KEYS = {description: key for key, description in BACKGROUND_AUDIO_PRESETS.items()}
+
+#: WAV sample width in bytes -> numpy sample type
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def preset_key(background_audio: Optional[str]) -> Optional[str]:
+    """
+    Preset key of a scene's `background_audio` value (the preset's
+    description, as improve_scenes.py writes it, or the key itself).
+    """
+    if not background_audio:
+        return None
+    if background_audio in BACKGROUND_AUDIO_PRESETS:
+        return background_audio
+    return _PRESET_KEYS.get(background_audio)
+
+
+def equal_power(t: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (fade_in, fade_out) gains for positions `t` in [0, 1] of a crossfade.
+    """
+    return np.sin(t * np.pi / 2), np.cos(t * np.pi / 2)
+
+
+def crossfade_join(a: np.ndarray, b: np.ndarray, overlap: int) -> np.ndarray:
+    overlap = min(overlap, len(a), len(b))
+    if overlap == 0:
+        return np.concatenate([a, b])
+    fade_in, fade_out = equal_power(np.linspace(0, 1, overlap)[:, None])
+    return np.concatenate([a[:-overlap], a[-overlap:] * fade_out + b[:overlap] * fade_in, b[overlap:]])
+
+
+def seamless(loop: np.ndarray, overlap: int) -> np.ndarray:
+    """
+    Fold the loop's tail into its head so it repeats without a click.
+    """
+    overlap = min(overlap, len(loop) // 2)
+    if overlap == 0:
+        return loop
+    fade_in, fade_out = equal_power(np.linspace(0, 1, overlap)[:, None])
+    out = loop[:-overlap].copy()
+    out[:overlap] = loop[:overlap] * fade_in + loop[-overlap:] * fade_out
+    return out
+
+
+def decode(path: str, rate: int, channels: int) -> np.ndarray:
+    """
+    Decode any audio file to a (frames, channels) float32 array with ffmpeg.
+    """
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-f", "f32le", "-ac", str(channels),
+           "-ar", str(rate), "pipe:1"]
+    data = subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+    return np.frombuffer(data, dtype="<f4").reshape(-1, channels)
+
+
+class AmbienceLibrary:
+    """
+    Ambience loops per preset, decoded once and kept in memory (and on disk)
+    per (preset, rate, channels).
+    """
+
+    def __init__(self, root=AMBIENCE_DIR, cache_dir=AMBIENCE_CACHE_DIR):
+        self.root = str(root)
+        self.cache_dir = str(cache_dir)
+        self._loops: Dict[Tuple[str, int, int], Optional[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def files(self, preset: str):
+        paths = glob.glob(os.path.join(self.root, preset, "*")) + \
+            glob.glob(os.path.join(self.root, f"{preset}.*"))
+        return sorted(p for p in paths if p.lower().endswith(LOOP_EXTENSIONS))
+
+    def has(self, preset: Optional[str]) -> bool:
+        return bool(preset) and bool(self.files(preset))
+
+    def loop(self, preset: str, rate: int, channels: int) -> Optional[np.ndarray]:
+        """
+        The preset's seamless, leveled loop as (frames, channels) float32,
+        or None if the library has no loops for it.
+        """
+        key = (preset, rate, channels)
+        with self._lock:
+            if key not in self._loops:
+                self._loops[key] = self._load(preset, rate, channels)
+            return self._loops[key]
+
+    def _load(self, preset, rate, channels):
+        files = self.files(preset)
+        if not files:
+            return None
+
+        state = [[f, os.path.getsize(f), os.path.getmtime(f)] for f in files]
+        digest = hashlib.sha1(repr(
+            [state, rate, channels, AMBIENCE_LEVEL_DBFS, AMBIENCE_LOOP_CROSSFADE_S]
+        ).encode("utf-8")).hexdigest()[:12]
+        cache_path = os.path.join(self.cache_dir, f"{preset}.{rate}x{channels}.{digest}.npy")
+        if os.path.exists(cache_path):
+            return np.load(cache_path, mmap_mode="r")
+
+        with span("ambience_decode", stage="audio", preset=preset, files=len(files)):
+            overlap = int(AMBIENCE_LOOP_CROSSFADE_S * rate)
+            loop = None
+            for path in files:
+                clip = decode(path, rate, channels)
+                loop = clip if loop is None else crossfade_join(loop, clip, overlap)
+            if not len(loop):
+                return None
+            loop = seamless(loop.astype(np.float32), overlap)
+
+            rms = float(np.sqrt(np.mean(np.square(loop, dtype=np.float64))))
+            if rms > 0:
+                loop *= np.float32(10 ** (AMBIENCE_LEVEL_DBFS / 20) / rms)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, loop)
+        os.replace(tmp_path, cache_path)
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{preset}.{rate}x{channels}.*.npy")):
+            if stale != cache_path:
+                os.remove(stale)
+        return loop
+
+
+_library: Optional[AmbienceLibrary] = None
+
+
+def library() -> AmbienceLibrary:
+    global _library
+    if _library is None:
+        _library = AmbienceLibrary()
+    return _library
+
+
+def scene_ambience(scene: Dict) -> Optional[str]:
+    """
+    Preset key of a manifest scene's ambience, if the library has loops
+    for it.
+    """
+    preset = preset_key(scene.get("background_audio"))
+    return preset if library().has(preset) else None
+
+
+def duck_gain(narration: np.ndarray, rate: int, duck_db: float = AMBIENCE_DUCK_DB) -> np.ndarray:
+    """
+    Per-sample bed gain: 1.0 in pauses, `duck_db` under speech, with
+    smooth attack and release.
+    """
+    frames = narration.shape[0]
+    if frames == 0:
+        return np.ones(0)
+    window = max(1, int(DUCK_WINDOW_S * rate))
+    windows = -(-frames // window)
+    mono = narration.mean(axis=1) if narration.ndim == 2 else narration
+    padded = np.zeros(windows * window)
+    padded[:frames] = mono
+    power = np.square(padded).reshape(windows, window).mean(axis=1)
+    with np.errstate(divide="ignore"):
+        speech = 10 * np.log10(power) > DUCK_THRESHOLD_DBFS
+
+    # Widen speech by the look-ahead before and the release after it
+    ahead = int(round(DUCK_LOOKAHEAD_S / DUCK_WINDOW_S))
+    release = int(round(DUCK_RELEASE_S / DUCK_WINDOW_S))
+    counts = np.concatenate([[0], np.cumsum(speech)])
+    lo = np.clip(np.arange(windows) - release, 0, windows)
+    hi = np.clip(np.arange(windows) + ahead + 1, 0, windows)
+    active = counts[hi] - counts[lo] > 0
+
+    gain = np.where(active, 10 ** (duck_db / 20), 1.0)
+    smooth = max(1, int(round(DUCK_SMOOTH_S / DUCK_WINDOW_S)))
+    if smooth > 1:
+        gain = np.convolve(np.pad(gain, smooth // 2, mode="edge"), np.ones(smooth) / smooth,
+                           mode="valid")[:windows]
+    centres = (np.arange(windows) + 0.5) * window
+    return np.interp(np.arange(frames), centres, gain)
+
+
+def bed(preset: str, start: int, frames: int, rate: int, channels: int,
+        previous: Optional[str] = None, following: Optional[str] = None) -> np.ndarray:
+    """
+    Ambience bed for timeline samples [start, start + frames).
+
+    `previous` / `following` are the presets of the neighbouring scenes:
+    None fades from/to silence (clip edges), another preset crossfades to
+    its bed, the same preset continues seamlessly.
+    """
+    out = np.zeros((frames, channels), dtype=np.float32)
+    loop = library().loop(preset, rate, channels)
+    if loop is not None and frames:
+        out += loop[(start + np.arange(frames)) % len(loop)]
+
+    half = min(int(AMBIENCE_FADE_S * rate / 2), frames // 2)
+    if half == 0:
+        return out
+
+    for edge, neighbour in (("in", previous), ("out", following)):
+        if neighbour == preset:
+            continue
+        other = library().loop(neighbour, rate, channels) if neighbour else None
+        if other is None:
+            # Fade from/to silence over the half window
+            t = np.linspace(0, 1, half)[:, None] if edge == "in" else np.linspace(1, 0, half)[:, None]
+            own, theirs = equal_power(t)[0], 0.0
+        else:
+            # One half of an equal-power crossfade centred on the cut
+            t = np.linspace(0.5, 1, half) if edge == "in" else np.linspace(0, 0.5, half)
+            fade_in, fade_out = equal_power(t[:, None])
+            own, theirs = (fade_in, fade_out) if edge == "in" else (fade_out, fade_in)
+        positions = start + (np.arange(half) if edge == "in" else frames - half + np.arange(half))
+        region = slice(0, half) if edge == "in" else slice(frames - half, frames)
+        out[region] = out[region] * own
+        if other is not None:
+            out[region] += other[positions % len(other)] * theirs
+    return out
+
+
+def mix(narration: np.ndarray, rate: int, preset: Optional[str], gain_db: Optional[float] = None,
+        start: int = 0, previous: Optional[str] = None, following: Optional[str] = None) -> np.ndarray:
+    """
+    Narration (frames, channels) floats with loudness gain applied and the
+    ducked ambience bed added, clipped to [-1, 1].
+    """
+    out = narration * 10 ** (gain_db / 20) if gain_db else narration.astype(np.float64)
+    if preset:
+        ambience = bed(preset, start, out.shape[0], rate, out.shape[1], previous, following)
+        out = out + ambience * duck_gain(out, rate)[:, None]
+    return np.clip(out, -1.0, 1.0)
+
+
+def from_float(x: np.ndarray, sample_width: int) -> np.ndarray:
+    """
+    [-1, 1] floats back to integer PCM of `sample_width` bytes.
+    """
+    sample_type = SAMPLE_TYPES.get(sample_width)
+    if sample_type is None:
+        raise ValueError(f"cannot mix {8 * sample_width}-bit PCM")
+    if sample_type is np.uint8:
+        return np.clip(np.rint(x * 128.0 + 128.0), 0, 255).astype(np.uint8)
+    info = np.iinfo(sample_type)
+    return np.clip(np.rint(x * (info.max + 1)), info.min, info.max).astype(sample_type)
+
+
+class MixedAudio:
+    """
+    A scene's mixed audio as 16-bit PCM, ready to be piped into ffmpeg.
+    """
+
+    def __init__(self, samples: np.ndarray, rate: int):
+        self.samples = samples
+        self.rate = rate
+        self.channels = samples.shape[1]
+        self.data = from_float(samples, 2).astype("<i2").tobytes()
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[0] / self.rate
+
+    def input_args(self):
+        """
+        ffmpeg input options reading this audio from stdin.
+        """
+        return ["-f", "s16le", "-ar", str(self.rate), "-ac", str(self.channels), "-i", "pipe:0"]
+
+
+def mix_scene(audio_path: str, preset: Optional[str], gain_db: Optional[float] = None,
+              scene: Optional[int] = None) -> Optional[MixedAudio]:
+    """
+    Mix one scene's narration WAV with its ambience for a standalone clip
+    (bed fades in and out with the clip). Returns None when there is no
+    ambience to add, the file is not a WAV, or the mix fails (unsupported
+    PCM, unreadable WAV or loop), so callers keep their plain narration
+    input.
+    """
+    if not preset or not audio_path.lower().endswith(".wav"):
+        return None
+    try:
+        with span("ambience_mix", stage="render", scene=scene, preset=preset) as s:
+            samples, rate = read_pcm(audio_path)
+            mixed = mix(to_float(samples), rate, preset, gain_db)
+            result = MixedAudio(mixed, rate)
+            s.set(audio_s=round(result.duration, 3))
+    except (subprocess.CalledProcessError, OSError, EOFError, ValueError, struct.error,
+            wave.Error) as e:
+        print(f" Ambience mix failed for scene {scene} ({type(e).__name__}: {e}), "
+              f"using the plain narration")
+        return None
+    return result
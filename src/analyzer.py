@@ -5,7 +5,10 @@ import logging
 from openai import OpenAI
 from dotenv import load_dotenv
 from json_repair import repair_json
+from src.Config import OPENROUTER_API_BASE
 from src.prompt import PromptBuilder
+from src.quota import acquire, backoff, is_rate_limited, retry_after
+from src.timing import span
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -36,7 +39,7 @@ class ScriptAnalyzer:
             raise ValueError("OPENROUTER_API_KEY is missing in .env")
 
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=OPENROUTER_API_BASE,
             api_key=self.api_key
         )
         self.model = model
@@ -52,13 +55,19 @@ class ScriptAnalyzer:
         logging.info("Extracting image-based scenes from script...")
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.2
-            )
-            result_text = response.choices[0].message.content
+            # Shared OpenRouter budget across every pipeline process on this host
+            acquire("openrouter")
+            with span("llm_call", stage="analyze", model=self.model) as s:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.2
+                )
+                result_text = response.choices[0].message.content
+                s.set(response_chars=len(result_text or ""))
         except Exception as e:
+            if is_rate_limited(e):
+                backoff("openrouter", retry_after(e))
             logging.error(f"LLM API call failed: {e}")
             return {"Scenes": []}
 
@@ -0,0 +1,282 @@
+"""
+benchmark_render.py
+===================
+
+Render Benchmark Suite
+
+Times the FFmpeg effects in `scene_video_ffmpeg_with_animation.py` and the
+still-image paths in `create_scene_videos.py` (MoviePy and direct FFmpeg)
+against the sample assets in `all_images/` and `audio/`, sweeping frame
+rate, output resolution, x264 preset and thread count. FFmpeg effects are timed twice per setting: once
+reading the raw PNG and once reading the frame pre-sized by
+`preprocess_images.py`, so the report shows the decode and scale time the
+preprocessing stage saves.
+
+Every case runs in its own child process and reports:
+- wall_s           wall-clock seconds
+- realtime_factor  seconds of video produced per wall-clock second
+- cpu_s            user + system CPU seconds of the render process
+- peak_rss_mb      peak resident memory of the render process
+
+Usage:
+    python -m src.benchmark_render --fps 24 30 --sizes 1920x1080 1280x720 \\
+        --presets medium veryfast --threads 0 2
+"""
+
+import argparse
+import itertools
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.Config import EFFECT_FRAME_SIZES
+from src.create_scene_videos import still_command
+from src.preprocess_images import frame_source, prepare_image
+from src.scene_video_ffmpeg_with_animation import IMAGE_DIR, effects
+from src.timing import wait_rusage
+from src.utils import save_json, wav_duration
+
+AUDIO_DIR = "audio"
+BENCHMARK_JSON = "output/benchmarks/render_benchmark.json"
+
+#: Names used for the still-image paths of create_scene_videos.py in results
+MOVIEPY = "moviepy"
+STILL_FFMPEG = "still_ffmpeg"
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    """
+    Parse a `WIDTHxHEIGHT` command-line value.
+    """
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def encoder_args(preset: Optional[str], threads: Optional[int]) -> List[str]:
+    """
+    x264 options inserted in front of the output path of an effect command.
+    """
+    args = []
+    if preset:
+        args += ["-preset", preset]
+    if threads is not None:
+        args += ["-threads", str(threads)]
+    return args
+
+
+def measure(cmd: List[str]) -> Dict:
+    """
+    Run `cmd` to completion and return its wall time, CPU time and peak RSS.
+
+    CPU and memory cover only the render process (see `timing.wait_rusage`).
+    """
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, cpu_s, peak_rss_mb = wait_rusage(proc)
+        wall_s = round(time.perf_counter() - start, 3)
+
+        error = None
+        if proc.returncode != 0:
+            stderr.seek(0)
+            error = stderr.read().decode(errors="replace").strip()[-500:]
+
+    return {
+        "ok": proc.returncode == 0,
+        "wall_s": wall_s,
+        "cpu_s": cpu_s,
+        "peak_rss_mb": peak_rss_mb,
+        "error": error,
+    }
+
+
+def ffmpeg_command(effect, image, audio, output, duration,
+                   fps, size, preset, threads) -> List[str]:
+    """
+    Build an effect command with quiet logging and the swept x264 options.
+    """
+    cmd = effect(image, audio, output, duration, fps=fps, size=size)
+    return [cmd[0], "-loglevel", "error"] + cmd[1:-1] + encoder_args(preset, threads) + [cmd[-1]]
+
+
+def moviepy_command(image, audio, output, duration,
+                    fps, size, preset, threads) -> List[str]:
+    """
+    Run `create_scene_videos.render_scene` in a fresh interpreter.
+    """
+    call = (
+        "from src.create_scene_videos import render_scene; "
+        f"render_scene({image!r}, {audio!r}, {output!r}, fps={fps!r}, "
+        f"preset={(preset or 'medium')!r}, threads={threads!r}, "
+        f"size={size!r}, max_duration={duration!r})"
+    )
+    return [sys.executable, "-c", call]
+
+
+def run_benchmark(
+    scene: int = 1,
+    duration: float = 5.0,
+    effect_names: Optional[List[str]] = None,
+    fps_values: Tuple[int, ...] = (30,),
+    sizes: Tuple[Tuple[int, int], ...] = ((1920, 1080),),
+    presets: Tuple[Optional[str], ...] = (None,),
+    threads_values: Tuple[Optional[int], ...] = (None,),
+    include_moviepy: bool = True,
+) -> Dict:
+    """
+    Sweep every combination of settings and return the JSON report.
+    """
+    scene_key = f"scene_{scene:02d}"
+    image_path = os.path.join(IMAGE_DIR, f"{scene_key}.png")
+    audio_path = os.path.join(AUDIO_DIR, f"{scene_key}.wav")
+
+    duration = min(duration, wav_duration(audio_path)) if duration else wav_duration(audio_path)
+    selected = [e for e in effects if not effect_names or e.__name__ in effect_names]
+
+    report = {
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "scene": scene_key,
+        "media_duration_s": round(duration, 3),
+        "prepare": None,
+        "results": [],
+        "prepared_savings": [],
+    }
+
+    workdir = tempfile.mkdtemp(prefix="render_bench_")
+    try:
+        # Work on a copy so the timed preprocessing never hits the real cache
+        source = os.path.join(workdir, f"{scene_key}.png")
+        shutil.copy(image_path, source)
+        frame_sizes = [EFFECT_FRAME_SIZES[e.__name__] for e in selected]
+        if include_moviepy:
+            frame_sizes.append(EFFECT_FRAME_SIZES["still"])
+        prepared = prepare_image(source, frame_sizes)
+        report["prepare"] = {"decode_s": prepared["decode_s"], "scale_s": prepared["scale_s"]}
+
+        output = os.path.join(workdir, "out.mp4")
+        sweep = list(itertools.product(fps_values, sizes, presets, threads_values))
+
+        for effect in selected:
+            for fps, size, preset, threads in sweep:
+                timings = {}
+                for label, image in (
+                    ("raw", source),
+                    ("prepared", frame_source(source, effect.__name__)),
+                ):
+                    cmd = ffmpeg_command(effect, image, audio_path, output, duration,
+                                         fps, size, preset, threads)
+                    result = measure(cmd)
+                    timings[label] = result
+                    report["results"].append(
+                        _result(effect.__name__, label, fps, size, preset, threads, duration, result)
+                    )
+                    print(
+                        f" {effect.__name__:<18} {label:<8} {fps}fps {size[0]}x{size[1]} "
+                        f"preset={preset} threads={threads} → {result['wall_s']}s"
+                    )
+
+                if timings["raw"]["ok"] and timings["prepared"]["ok"]:
+                    report["prepared_savings"].append({
+                        "effect": effect.__name__,
+                        "fps": fps,
+                        "size": f"{size[0]}x{size[1]}",
+                        "preset": preset,
+                        "threads": threads,
+                        "wall_saved_s": round(timings["raw"]["wall_s"] - timings["prepared"]["wall_s"], 3),
+                        "cpu_saved_s": _diff(timings["raw"]["cpu_s"], timings["prepared"]["cpu_s"]),
+                    })
+
+        if include_moviepy:
+            for fps, size, preset, threads in sweep:
+                cmd = moviepy_command(frame_source(source, "still"), audio_path, output,
+                                      duration, fps, size, preset, threads)
+                result = measure(cmd)
+                report["results"].append(
+                    _result(MOVIEPY, "prepared", fps, size, preset, threads, duration, result)
+                )
+                print(
+                    f" {MOVIEPY:<18} {fps}fps {size[0]}x{size[1]} "
+                    f"preset={preset} threads={threads} → {result['wall_s']}s"
+                )
+
+                cmd = still_command(frame_source(source, "still"), audio_path, output,
+                                    fps=fps, preset=preset or "medium", threads=threads,
+                                    duration=duration, size=size)
+                result = measure([cmd[0], "-loglevel", "error"] + cmd[1:])
+                report["results"].append(
+                    _result(STILL_FFMPEG, "prepared", fps, size, preset, threads, duration, result)
+                )
+                print(
+                    f" {STILL_FFMPEG:<18} {fps}fps {size[0]}x{size[1]} "
+                    f"preset={preset} threads={threads} → {result['wall_s']}s"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def _result(renderer, source, fps, size, preset, threads, duration, result) -> Dict:
+    realtime = round(duration / result["wall_s"], 3) if result["ok"] and result["wall_s"] else None
+    return {
+        "renderer": renderer,
+        "source": source,
+        "fps": fps,
+        "size": f"{size[0]}x{size[1]}",
+        "preset": preset,
+        "threads": threads,
+        **result,
+        "realtime_factor": realtime,
+    }
+
+
+def _diff(a, b):
+    if a is None or b is None:
+        return None
+    return round(a - b, 3)
+
+
+def main():
+    names = [e.__name__ for e in effects]
+
+    parser = argparse.ArgumentParser(description="Benchmark scene renderers")
+    parser.add_argument("--scene", type=int, default=1, help="sample scene number")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds of each scene to render (0 = full audio)")
+    parser.add_argument("--effects", nargs="+", choices=names, default=names)
+    parser.add_argument("--fps", nargs="+", type=int, default=[30])
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(1920, 1080)])
+    parser.add_argument("--presets", nargs="+", default=[None],
+                        help="x264 presets (default: renderer default)")
+    parser.add_argument("--threads", nargs="+", type=int, default=[None],
+                        help="encoder threads, 0 = auto")
+    parser.add_argument("--no-moviepy", action="store_true",
+                        help="skip the still-image paths (MoviePy and FFmpeg)")
+    parser.add_argument("--output", default=BENCHMARK_JSON)
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        scene=args.scene,
+        duration=args.duration,
+        effect_names=args.effects,
+        fps_values=tuple(args.fps),
+        sizes=tuple(args.sizes),
+        presets=tuple(args.presets),
+        threads_values=tuple(args.threads),
+        include_moviepy=not args.no_moviepy,
+    )
+    save_json(args.output, report)
+    print(f" Benchmark report → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,80 @@
 import os
 import json
-from moviepy import ImageClip, AudioFileClip, CompositeVideoClip
+import argparse
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from moviepy import ImageClip, AudioFileClip, AudioArrayClip, CompositeVideoClip, afx
+
+from src.Config import STILL_FPS, STILL_KEYFRAME_INTERVAL
+from src.ambience import mix_scene, scene_ambience
+from src.encoder_tuning import encoder_settings
+from src.ffmpeg_progress import run_ffmpeg
+from src.loudness import scene_gain
+from src.preprocess_images import frame_source, prepare_images
+from src.scheduler import CostModel, audio_seconds, schedule
+from src.timing import export_trace, span
+from src.utils import is_up_to_date, read_stamp, write_stamp
+from src.workspace import workspace
 
 SCENES_JSON = "output/scenes_with_audio.json"
 IMAGE_DIR = "all_images"
 AUDIO_DIR = "audio"
 OUTPUT_DIR = "output/scene_videos"
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-with open(SCENES_JSON, "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-#  Your JSON: {"Scenes": [ ... ]}
-scenes = data["Scenes"]
-
-for scene in scenes:
-    # scene_id is INT → convert to zero-padded string
-    scene_num = int(scene["scene_id"])
-    scene_id = f"scene_{scene_num:02d}"
-
-    image_path = os.path.join(IMAGE_DIR, f"{scene_id}.png")
 
-    # audio_file already contains correct path
-    audio_path = scene["audio_file"].replace("\\", "/")
+def still_command(image_path, audio_path, output_path,
+                  fps=STILL_FPS, preset="medium", threads=None, duration=None,
+                  size=None, gain_db=None, audio_input=None):
+    """
+    FFmpeg command that encodes a still image + narration directly.
 
-    output_path = os.path.join(OUTPUT_DIR, f"{scene_id}.mp4")
+    The image is looped at `fps` with x264's stillimage tuning and a
+    keyframe only every STILL_KEYFRAME_INTERVAL seconds, so the encoder
+    spends almost nothing on the repeated frames. `gain_db` is the scene's
+    loudness normalization (src/loudness.py). `audio_input` replaces
+    `-i audio_path` with other input options, e.g. the ambience mix on
+    stdin (src/ambience.py), which already has the gain applied.
+    """
+    # libx264 + yuv420p needs even dimensions
+    scale = f"scale={size[0]}:{size[1]}" if size else "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+    cmd = [
+        "ffmpeg", "-y",
+        "-loop", "1", "-framerate", str(fps), "-i", image_path,
+        *(audio_input or ["-i", audio_path]),
+        "-map", "0:v", "-map", "1:a",
+        "-vf", scale,
+        "-c:v", "libx264", "-tune", "stillimage", "-preset", preset,
+        "-g", str(int(fps * STILL_KEYFRAME_INTERVAL)),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-shortest",
+    ]
+    if gain_db:
+        cmd += ["-af", f"volume={gain_db:.2f}dB"]
+    if threads is not None:
+        cmd += ["-threads", str(threads)]
+    if duration:
+        cmd += ["-t", f"{duration:.3f}"]
+    # Explicit container: the output is a temporary ".part" file
+    return cmd + ["-f", "mp4", output_path]
 
-    if not os.path.exists(image_path):
-        print(f" Missing image: {image_path}")
-        continue
 
-    if not os.path.exists(audio_path):
-        print(f" Missing audio: {audio_path}")
-        continue
-
-    print(f" Rendering {scene_id}")
-
-    audio = AudioFileClip(audio_path)
+def render_scene(image_path, audio_path, output_path,
+                 fps=24, preset="medium", threads=None, size=None,
+                 max_duration=None, gain_db=None, mixed=None):
+    """
+    Render one still image + narration clip with MoviePy. `mixed` is the
+    scene's ambience mix (src/ambience.py), used instead of the WAV.
+    """
+    if mixed is not None:
+        audio = AudioArrayClip(mixed.samples, fps=mixed.rate)
+    else:
+        audio = AudioFileClip(audio_path)
+    if max_duration and audio.duration > max_duration:
+        audio = audio.subclipped(0, max_duration)
+    if gain_db and mixed is None:
+        audio = audio.with_effects([afx.MultiplyVolume(10 ** (gain_db / 20))])
     duration = audio.duration
 
     clip = (
@@ -45,21 +82,194 @@ for scene in scenes:
         .with_duration(duration)
         .with_audio(audio)
     )
+    if size:
+        clip = clip.resized(new_size=size)
 
     final = CompositeVideoClip([clip])
 
+    # Per-output temp audio so concurrent renders never share a file
+    temp_audio = workspace().temp_path(
+        f"{os.path.splitext(os.path.basename(output_path))[0]}.{os.getpid()}.temp.m4a"
+    )
+
     final.write_videofile(
     output_path,
-    fps=24,
+    fps=fps,
     codec="libx264",
     audio=True,                 # 🔥 REQUIRED
     audio_codec="aac",          # 🔥 REQUIRED
-    temp_audiofile="temp.m4a",  # 🔥 IMPORTANT for Windows
+    temp_audiofile=temp_audio,  # 🔥 IMPORTANT for Windows
     remove_temp=True,
-    preset="medium"
+    preset=preset,
+    threads=threads
 )
 
     final.close()
     audio.close()
 
-    print(f" Created {scene_id}")
+
+def clip_stamp(route, gain_db=None, ambience=None):
+    """
+    What a clip was rendered with; --incremental only keeps clips whose
+    stamp still matches.
+    """
+    return {"route": route, "gain_db": gain_db, "ambience": ambience}
+
+
+def keep_clip(output_path, route, gain_db=None, ambience=None):
+    """
+    Record a finished clip and its stamp in the workspace. Returns the
+    clip's size.
+    """
+    write_stamp(output_path, **clip_stamp(route, gain_db, ambience))
+    workspace().record("scene_videos", f"{output_path}.json")
+    return workspace().record("scene_videos", output_path)
+
+
+def render_scene_fast(scene_num, image_path, audio_path, output_path,
+                      queued_at=None, live=True, gain_db=None, ambience=None):
+    """
+    Encode a scene with FFmpeg directly; fall back to MoviePy if that fails.
+    With an `ambience` preset the narration is mixed with its bed in memory
+    and piped into the same encode.
+
+    Returns the route that produced the clip ("ffmpeg" or "moviepy").
+    """
+    if os.path.exists(f"{output_path}.json"):
+        # The clip is about to be replaced; a failed render must not look current
+        os.remove(f"{output_path}.json")
+    # None for an unreadable WAV header: the encode then ends with -shortest
+    duration = audio_seconds(audio_path)
+    part_path = f"{output_path}.{os.getpid()}.part"
+    mixed = mix_scene(audio_path, ambience, gain_db, scene=scene_num)
+    # This host's calibrated x264 settings (src/encoder_tuning.py)
+    settings = encoder_settings("still")
+
+    try:
+        run_ffmpeg(
+            still_command(image_path, audio_path, part_path, duration=duration,
+                          preset=settings["preset"], threads=settings["threads"],
+                          gain_db=None if mixed else gain_db,
+                          audio_input=mixed.input_args() if mixed else None),
+            "still_encode", stage="render", scene=scene_num,
+            duration=duration, queued_at=queued_at, live=live,
+            input_data=mixed.data if mixed else None,
+        )
+        os.replace(part_path, output_path)
+        keep_clip(output_path, "ffmpeg", gain_db, ambience)
+        return "ffmpeg"
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        print(f" FFmpeg still encode failed for scene {scene_num} ({e}), using MoviePy")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    with span("moviepy_encode", stage="render", scene=scene_num) as s:
+        render_scene(image_path, audio_path, output_path, preset=settings["preset"],
+                     threads=settings["threads"], gain_db=gain_db, mixed=mixed)
+        s.set(bytes_written=keep_clip(output_path, "moviepy", gain_db, ambience))
+    return "moviepy"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render still-image scene videos")
+    parser.add_argument("--moviepy", action="store_true",
+                        help="render every scene through MoviePy (old route)")
+    parser.add_argument("--jobs", type=int, default=encoder_settings("still")["jobs"],
+                        help="concurrent FFmpeg encodes (default: this host's encoder profile)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip scenes whose clip is newer than its image and audio and "
+                             "was rendered by this route with the scene's gain and ambience")
+    args = parser.parse_args()
+
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    #  Your JSON: {"Scenes": [ ... ]}
+    scenes = data["Scenes"]
+    # Clips are intermediates, tracked in the workspace ledger
+    workspace().stage_dir(OUTPUT_DIR, "scene_videos")
+    gains = {int(scene["scene_id"]): scene_gain(scene) for scene in scenes}
+    ambiences = {int(scene["scene_id"]): scene_ambience(scene) for scene in scenes}
+
+    # Normalize every image to the output frame once, in parallel
+    prepare_images({
+        os.path.join(IMAGE_DIR, f"scene_{int(s['scene_id']):02d}.png"): ["still"]
+        for s in scenes
+    })
+
+    # Clips from the other route are rendered again by --incremental
+    route = "moviepy" if args.moviepy else "ffmpeg"
+    jobs, failed = [], []
+    for scene in scenes:
+        # scene_id is INT → convert to zero-padded string
+        scene_num = int(scene["scene_id"])
+        scene_id = f"scene_{scene_num:02d}"
+
+        image_path = os.path.join(IMAGE_DIR, f"{scene_id}.png")
+
+        # audio_file already contains correct path
+        audio_path = scene["audio_file"].replace("\\", "/")
+
+        output_path = os.path.join(OUTPUT_DIR, f"{scene_id}.mp4")
+
+        if not os.path.exists(image_path):
+            print(f" Missing image: {image_path}")
+            continue
+
+        if not os.path.exists(audio_path):
+            print(f" Missing audio: {audio_path}")
+            continue
+
+        if (args.incremental and is_up_to_date(output_path, image_path, audio_path)
+                and read_stamp(output_path) == clip_stamp(route, gains[scene_num],
+                                                          ambiences[scene_num])):
+            print(f" Unchanged {scene_id}, skipping")
+            continue
+
+        jobs.append((scene_num, frame_source(image_path, "still"), audio_path, output_path))
+
+    if args.moviepy:
+        for scene_num, image_path, audio_path, output_path in jobs:
+            print(f" Rendering scene_{scene_num:02d}")
+            with span("moviepy_encode", stage="render", scene=scene_num) as s:
+                mixed = mix_scene(audio_path, ambiences[scene_num], gains[scene_num], scene=scene_num)
+                render_scene(image_path, audio_path, output_path, gain_db=gains[scene_num],
+                             mixed=mixed)
+                s.set(bytes_written=keep_clip(output_path, "moviepy", gains[scene_num],
+                                              ambiences[scene_num]))
+            print(f" Created scene_{scene_num:02d}")
+    else:
+        # Longest scenes first, so no long encode is left running alone at the end
+        model = CostModel()
+        durations = {job[0]: audio_seconds(job[2]) for job in jobs}
+        jobs, eta = schedule(jobs, lambda job: model.predict("still", durations[job[0]]), args.jobs)
+        print(f" Rendering {len(jobs)} scenes on {args.jobs} workers, ETA {eta:.0f}s")
+
+        queued_at = time.time()
+        live = args.jobs == 1
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {
+                pool.submit(model.timed, "still", durations[job[0]], render_scene_fast,
+                            *job, queued_at=queued_at, live=live,
+                            gain_db=gains[job[0]], ambience=ambiences[job[0]]): job[0]
+                for job in jobs
+            }
+            for future, scene_num in futures.items():
+                try:
+                    route = future.result()
+                except Exception as e:
+                    # Both routes failed: report it and keep the other scenes
+                    print(f" Failed scene_{scene_num:02d}: {e}")
+                    failed.append(scene_num)
+                    continue
+                print(f" Created scene_{scene_num:02d} ({route})")
+        print(f" Rendered in {time.time() - queued_at:.0f}s (predicted {eta:.0f}s)")
+        model.save()
+
+    export_trace("scene_videos")
+    if failed:
+        raise SystemExit(f" {len(failed)} scene(s) failed to render: {failed}")
+
+
+if __name__ == "__main__":
+    main()
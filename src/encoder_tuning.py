@@ -0,0 +1,431 @@
+"""
+encoder_tuning.py
+=================
+
+Per-Host Encoder Calibration
+
+The render stages encode with x264 at a preset, a thread count and a
+number of parallel jobs. The best combination depends on the host: its
+core count, its cache and memory bandwidth, and the ffmpeg build. The
+calibration finds the combination for each workload by encoding a short
+sample from `all_images/` and `audio/`:
+
+- still   create_scene_videos.py still-image encode (jobs: --jobs)
+- effect  scene_video_ffmpeg_with_animation.py Ken Burns encode, video only
+          (jobs: render_queue.py local --workers)
+- stitch  stitch_final_video.py re-encode of an animated clip at the
+          default rendition's CRF (always one job)
+
+Each workload is first encoded losslessly as a reference. Then every x264
+preset is encoded and scored against that reference with ffmpeg's
+ssim and psnr filters, and its file size is compared with the default
+preset's: at a fixed CRF a faster preset holds quality by spending more
+bits. The two fastest presets that reach ENCODER_TARGET then go through a
+sweep of encoder threads and parallel jobs, keeping threads x jobs within
+the core count. Each combination runs REPEATS times and counts its fastest
+run. The winner is the combination with the most seconds of video encoded
+per wall-clock second.
+
+The result is saved to ENCODER_PROFILE_DIR/<hostname>.json. From then on,
+encoder_settings() returns it to the render stages in place of
+ENCODER_DEFAULTS. A profile made on a host with a different core count is
+ignored.
+
+Usage:
+    python -m src.encoder_tuning                   # calibrate and save
+    python -m src.encoder_tuning --show            # print this host's profile
+    python -m src.encoder_tuning --workloads still --presets veryfast fast medium
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from src.Config import ENCODER_DEFAULTS, ENCODER_PROFILE_DIR, ENCODER_TARGET
+from src.utils import save_json, wav_duration
+
+WORKLOADS = ("still", "effect", "stitch")
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow")
+
+#: Presets reaching the target that go on to the thread/job sweep
+SWEEP_PRESETS = 2
+
+#: Runs per combination; the fastest counts, the others absorb host noise
+REPEATS = 3
+
+_SSIM = re.compile(r"SSIM .*All:([\d.]+)")
+_PSNR = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+_profile = None
+_profile_loaded = False
+
+
+# ---------------------------------------------------------------------------
+# Profile lookup (used by the render stages)
+# ---------------------------------------------------------------------------
+
+def profile_path(host: Optional[str] = None):
+    return ENCODER_PROFILE_DIR / f"{host or socket.gethostname()}.json"
+
+
+def load_profile() -> Optional[Dict]:
+    """
+    This host's calibration profile, None if it has not been calibrated or
+    the profile was made with a different core count.
+    """
+    global _profile, _profile_loaded
+    if _profile_loaded:
+        return _profile
+    _profile_loaded = True
+
+    path = profile_path()
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f" Encoder profile {path} is unreadable ({e}): using defaults (re-run src.encoder_tuning)")
+        return None
+    if profile.get("cpu_count") != os.cpu_count():
+        print(f" Encoder profile {path} was made for {profile.get('cpu_count')} cores, "
+              f"this host has {os.cpu_count()}: using defaults (re-run src.encoder_tuning)")
+        return None
+    _profile = profile
+    return _profile
+
+
+def encoder_settings(workload: str) -> Dict:
+    """
+    {"preset", "threads", "jobs"} for `workload`: this host's profile, or
+    ENCODER_DEFAULTS where it has no entry.
+    """
+    settings = dict(ENCODER_DEFAULTS[workload])
+    profile = load_profile()
+    if profile:
+        tuned = profile["workloads"].get(workload, {})
+        settings.update({key: tuned[key] for key in ("preset", "threads", "jobs") if key in tuned})
+    return settings
+
+
+def x264_args(preset: Optional[str], threads: Optional[int]) -> List[str]:
+    """
+    ffmpeg output options for `preset` and `threads` (None: leave to x264).
+    """
+    args = []
+    if preset:
+        args += ["-preset", preset]
+    if threads is not None:
+        args += ["-threads", str(threads)]
+    return args
+
+
+# ---------------------------------------------------------------------------
+# Calibration
+# ---------------------------------------------------------------------------
+
+def thread_job_combinations(cpu_count: int, parallel: bool) -> List[Tuple[Optional[int], int]]:
+    """
+    (threads, jobs) pairs to sweep: x264's own choice of threads, or powers
+    of two, with threads x jobs no more than the core count.
+    """
+    powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cpu_count]
+    jobs_values = powers if parallel else [1]
+    combos = [(None, jobs) for jobs in jobs_values]
+    combos += [(threads, jobs) for threads in powers for jobs in jobs_values
+               if threads * jobs <= cpu_count]
+    return combos
+
+
+def quality(distorted: str, reference: str) -> Dict:
+    """
+    SSIM (all planes) and PSNR (average, dB) of `distorted` against
+    `reference`, from ffmpeg's ssim and psnr filters.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", distorted, "-i", reference,
+        "-lavfi", "[0:v]split[a][b];[1:v]split[c][d];[a][c]ssim;[b][d]psnr",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    ssim, psnr = _SSIM.search(result.stderr), _PSNR.search(result.stderr)
+    if result.returncode != 0 or not ssim or not psnr:
+        raise RuntimeError(f"quality measurement failed: {result.stderr.strip()[-300:]}")
+    return {"ssim": float(ssim.group(1)), "psnr_db": float(psnr.group(1))}
+
+
+def meets_target(row: Dict, target: Dict = ENCODER_TARGET) -> bool:
+    """
+    True if `row` reaches every minimum in `target` and stays within its
+    size_ratio (a maximum).
+    """
+    for metric, limit in target.items():
+        if metric == "size_ratio":
+            if row.get(metric) is not None and row[metric] > limit:
+                return False
+        elif row[metric] < limit:
+            return False
+    return True
+
+
+def run_parallel(cmds: List[List[str]]) -> Optional[float]:
+    """
+    Run `cmds` at the same time; wall seconds until the last one finishes,
+    None if any failed.
+    """
+    start = time.perf_counter()
+    procs = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) for cmd in cmds]
+    failed = None
+    for proc in procs:
+        _, stderr = proc.communicate()
+        if proc.returncode != 0 and failed is None:
+            failed = stderr.decode(errors="replace").strip()[-300:]
+    if failed:
+        print(f"   encode failed: {failed}")
+        return None
+    return time.perf_counter() - start
+
+
+class Calibration:
+    """
+    Sample encodes for one calibration run, in a temporary directory.
+    """
+
+    def __init__(self, image: str, audio: str, duration: float, workdir: str,
+                 repeats: int = REPEATS):
+        self.image = image
+        self.audio = audio
+        self.duration = duration
+        self.workdir = workdir
+        self.repeats = repeats
+        self._references: Dict[str, str] = {}
+
+    def command(self, workload: str, output: str, preset: Optional[str],
+                threads: Optional[int], lossless: bool = False) -> List[str]:
+        # The render stages' own command builders with the encoder options
+        # under test, never this host's saved profile
+        from src.create_scene_videos import still_command
+        from src.scene_video_ffmpeg_with_animation import FPS, ken_burns
+        from src.stitch_final_video import DEFAULT_RENDITION
+
+        if lossless:
+            encoder = ["-preset", "ultrafast", "-qp", "0"]
+        else:
+            encoder = x264_args(preset, threads)
+
+        if workload == "still":
+            cmd = still_command(self.image, self.audio, output, duration=self.duration)
+        elif workload == "effect":
+            cmd = ken_burns(self.image, None, output, self.duration, fps=FPS, encoder=encoder)
+            return [cmd[0], "-loglevel", "error"] + cmd[1:]
+        elif workload == "stitch":
+            cmd = [
+                "ffmpeg", "-y", "-i", self.reference("effect"),
+                "-c:v", "libx264", "-crf", str(DEFAULT_RENDITION["crf"]),
+                "-pix_fmt", "yuv420p", "-an", output,
+            ]
+        else:
+            raise ValueError(f"Unknown workload {workload!r}")
+        return [cmd[0], "-loglevel", "error"] + cmd[1:-1] + encoder + [cmd[-1]]
+
+    def reference(self, workload: str) -> str:
+        """
+        Lossless encode of the workload's sample (for stitch: its input).
+        """
+        if workload == "stitch":
+            return self.reference("effect")
+        if workload not in self._references:
+            path = os.path.join(self.workdir, f"{workload}_reference.mp4")
+            if run_parallel([self.command(workload, path, None, None, lossless=True)]) is None:
+                raise RuntimeError(f"lossless {workload} reference encode failed")
+            self._references[workload] = path
+        return self._references[workload]
+
+    def encode(self, workload: str, preset: str, threads: Optional[int], jobs: int) -> Optional[Dict]:
+        """
+        Encode the sample `jobs` times at once, `repeats` times over;
+        throughput in seconds of video per wall-clock second of the fastest
+        run, and the quality of the first copy.
+        """
+        outputs = [os.path.join(self.workdir, f"{workload}_{i}.mp4") for i in range(jobs)]
+        cmds = [self.command(workload, out, preset, threads) for out in outputs]
+        walls = [run_parallel(cmds) for _ in range(self.repeats)]
+        if None in walls:
+            return None
+        wall = min(walls)
+        return {
+            "preset": preset,
+            "threads": threads,
+            "jobs": jobs,
+            "wall_s": round(wall, 3),
+            "realtime_factor": round(jobs * self.duration / wall, 3),
+            "bytes": os.path.getsize(outputs[0]),
+            **quality(outputs[0], self.reference(workload)),
+        }
+
+
+def calibrate_workload(calibration: Calibration, workload: str, presets=PRESETS,
+                       target: Dict = ENCODER_TARGET) -> Dict:
+    """
+    Sweep one workload. Returns {"best": row, "results": [rows]}.
+    """
+    cpu_count = os.cpu_count() or 1
+    calibration.reference(workload)
+
+    # Presets at x264's own threading, one job: quality, size and base speed
+    rows = []
+    for preset in presets:
+        row = calibration.encode(workload, preset, None, 1)
+        if row:
+            rows.append(row)
+    if not rows:
+        raise RuntimeError(f"every {workload} encode failed")
+
+    # Sizes relative to the default preset, or to the smallest encode
+    default = ENCODER_DEFAULTS[workload]["preset"]
+    baseline = next((r["bytes"] for r in rows if r["preset"] == default),
+                    min(r["bytes"] for r in rows))
+    for row in rows:
+        row["size_ratio"] = round(row["bytes"] / baseline, 3)
+        print(f"  {workload:<7} {row['preset']:<10} threads=auto jobs=1  "
+              f"{row['realtime_factor']:>7.2f}x  SSIM {row['ssim']:.4f}  PSNR {row['psnr_db']:.2f} dB  "
+              f"size {row['size_ratio']:.2f}x")
+
+    passing = sorted((r for r in rows if meets_target(r, target)),
+                     key=lambda r: r["realtime_factor"], reverse=True)
+    if not passing:
+        best = max(rows, key=lambda r: r["ssim"])
+        print(f"  {workload}: no preset reaches {target}, using the best quality ({best['preset']})")
+        passing = [best]
+
+    # Threads and parallel jobs for the fastest presets that are good enough
+    for preset in [r["preset"] for r in passing[:SWEEP_PRESETS]]:
+        for threads, jobs in thread_job_combinations(cpu_count, parallel=workload != "stitch"):
+            if threads is None and jobs == 1:
+                continue
+            row = calibration.encode(workload, preset, threads, jobs)
+            if row:
+                row["size_ratio"] = round(row["bytes"] / baseline, 3)
+                rows.append(row)
+                print(f"  {workload:<7} {preset:<10} threads={threads or 'auto'} jobs={jobs}  "
+                      f"{row['realtime_factor']:>7.2f}x")
+
+    candidates = [r for r in rows if r["preset"] in {p["preset"] for p in passing[:SWEEP_PRESETS]}]
+    best = max(candidates, key=lambda r: r["realtime_factor"])
+    return {"best": best, "results": rows}
+
+
+def ffmpeg_version() -> Optional[str]:
+    try:
+        output = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    except OSError:
+        return None
+    return output.splitlines()[0] if output else None
+
+
+def calibrate(scene: int = 1, duration: float = 3.0, workloads=WORKLOADS, presets=PRESETS,
+              target: Dict = ENCODER_TARGET, repeats: int = REPEATS) -> Dict:
+    """
+    Calibrate `workloads` on a sample of scene `scene` and return the
+    profile (not saved).
+    """
+    from src.scene_video_ffmpeg_with_animation import IMAGE_DIR
+
+    scene_key = f"scene_{scene:02d}"
+    image = os.path.join(IMAGE_DIR, f"{scene_key}.png")
+    audio = os.path.join("audio", f"{scene_key}.wav")
+    for path in (image, audio):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Calibration sample not found: {path}")
+    duration = min(duration, wav_duration(audio))
+
+    profile = {
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+        "ffmpeg": ffmpeg_version(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sample": {"scene": scene_key, "duration_s": round(duration, 3), "repeats": repeats},
+        "target": target,
+        "workloads": {},
+        "results": {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix="encoder_calibration_")
+    try:
+        calibration = Calibration(image, audio, duration, workdir, repeats)
+        for workload in workloads:
+            print(f" Calibrating {workload} ({len(presets)} presets, {os.cpu_count()} cores)")
+            result = calibrate_workload(calibration, workload, presets, target)
+            best = result["best"]
+            profile["workloads"][workload] = {key: best[key] for key in (
+                "preset", "threads", "jobs", "realtime_factor", "ssim", "psnr_db", "size_ratio"
+            )}
+            profile["results"][workload] = result["results"]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return profile
+
+
+def print_profile(profile: Dict) -> None:
+    print(f" Encoder profile for {profile['host']} ({profile['cpu_count']} cores, {profile['created']})")
+    for workload, best in profile["workloads"].items():
+        print(f"  {workload:<7} preset={best['preset']:<10} threads={best['threads'] or 'auto':<5} "
+              f"jobs={best['jobs']:<3} {best['realtime_factor']:>7.2f}x  "
+              f"SSIM {best['ssim']:.4f}  PSNR {best['psnr_db']:.2f} dB  "
+              f"size {best.get('size_ratio', 1):.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate x264 settings for this host")
+    parser.add_argument("--scene", type=int, default=1, help="sample scene number")
+    parser.add_argument("--duration", type=float, default=3.0, help="sample seconds")
+    parser.add_argument("--repeats", type=int, default=REPEATS,
+                        help="runs per combination, the fastest counts")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--presets", nargs="+", choices=PRESETS, default=list(PRESETS))
+    parser.add_argument("--min-ssim", type=float, default=ENCODER_TARGET["ssim"])
+    parser.add_argument("--min-psnr", type=float, default=ENCODER_TARGET["psnr_db"])
+    parser.add_argument("--max-size-ratio", type=float, default=ENCODER_TARGET["size_ratio"],
+                        help="largest output allowed relative to the default preset's")
+    parser.add_argument("--show", action="store_true", help="print the saved profile and exit")
+    args = parser.parse_args()
+
+    if args.show:
+        profile = load_profile()
+        if profile:
+            print_profile(profile)
+        else:
+            print(f" No usable encoder profile at {profile_path()}: render stages use ENCODER_DEFAULTS")
+        return
+
+    profile = calibrate(args.scene, args.duration, tuple(args.workloads), tuple(args.presets),
+                        {"ssim": args.min_ssim, "psnr_db": args.min_psnr,
+                         "size_ratio": args.max_size_ratio}, max(1, args.repeats))
+
+    # Workloads not calibrated this time keep their earlier result
+    path = profile_path()
+    previous = load_profile()
+    if previous:
+        for workload in WORKLOADS:
+            if workload not in profile["workloads"] and workload in previous.get("workloads", {}):
+                profile["workloads"][workload] = previous["workloads"][workload]
+                profile["results"][workload] = previous.get("results", {}).get(workload, [])
+
+    save_json(str(path), profile)
+    print_profile(profile)
+    print(f" Encoder profile → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+ffmpeg_progress.py
+==================
+
+Supervised FFmpeg Runner with Live Progress
+
+Runs an ffmpeg command with `-progress pipe:1` and parses the key=value
+blocks it emits into live fps, speed and ETA for the job. A job that stops
+advancing for `FFMPEG_STALL_TIMEOUT` seconds, or runs past `FFMPEG_TIMEOUT`,
+is killed and retried up to `FFMPEG_RETRIES` times.
+
+The final throughput numbers (frames, average fps, speed, attempts, stalls)
+are stored on the job's timing span, so they end up in the trace report
+written by `timing.export_trace`.
+"""
+
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.Config import FFMPEG_RETRIES, FFMPEG_STALL_TIMEOUT, FFMPEG_TIMEOUT
+from src.timing import file_size, poll_rusage, span
+
+#: Seconds between live status lines
+REPORT_INTERVAL = 1.0
+
+#: Set by cancel_encodes(): running encodes are killed, new ones refused
+_cancelled = threading.Event()
+
+
+class Cancelled(Exception):
+    """
+    The encode was killed by cancel_encodes(). Not a CalledProcessError, so
+    the renderers do not fall back to another route.
+    """
+
+
+def cancel_encodes() -> None:
+    """
+    Kill the encodes running in this process (e.g. when a render queue
+    worker has lost its job's lease) until allow_encodes() is called.
+    """
+    _cancelled.set()
+
+
+def allow_encodes() -> None:
+    _cancelled.clear()
+
+
+class Progress:
+    """
+    Latest state parsed from one ffmpeg `-progress` stream.
+    """
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.out_time = 0.0
+        self.total_size = 0
+        self.finished = False
+        self.updated_at = time.time()
+
+    def update(self, fields: Dict[str, str]) -> None:
+        """
+        Apply one complete progress block. Only advancing output time (or
+        frame count) counts as progress for stall detection.
+        """
+        frame = _to_int(fields.get("frame"), self.frame)
+        out_time = _to_int(fields.get("out_time_us"), None)
+        out_time = out_time / 1e6 if out_time is not None else self.out_time
+
+        if frame > self.frame or out_time > self.out_time:
+            self.updated_at = time.time()
+
+        self.frame = frame
+        self.out_time = max(out_time, 0.0)
+        self.fps = _to_float(fields.get("fps"), self.fps)
+        self.speed = _to_float(fields.get("speed", "").rstrip("x"), self.speed)
+        self.total_size = _to_int(fields.get("total_size"), self.total_size)
+        self.finished = fields.get("progress") == "end"
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.duration:
+            return None
+        return min(self.out_time / self.duration * 100, 100.0)
+
+    @property
+    def eta(self) -> Optional[float]:
+        if not self.duration or self.speed <= 0:
+            return None
+        return max(self.duration - self.out_time, 0.0) / self.speed
+
+    def status_line(self, label: str) -> str:
+        parts = [f" {label}"]
+        if self.percent is not None:
+            parts.append(f"{self.percent:5.1f}%")
+        parts.append(f"fps={self.fps:.1f} speed={self.speed:.2f}x")
+        if self.eta is not None:
+            parts.append(f"eta={self.eta:.1f}s")
+        return " ".join(parts)
+
+
+def _to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _read_progress(stream, progress: Progress) -> None:
+    """
+    Reader thread: collect key=value lines until each `progress=` line.
+    """
+    fields: Dict[str, str] = {}
+    for raw in iter(stream.readline, b""):
+        key, _, value = raw.decode(errors="replace").strip().partition("=")
+        if not key:
+            continue
+        fields[key] = value
+        if key == "progress":
+            progress.update(fields)
+            fields = {}
+
+
+def with_progress(cmd: List[str]) -> List[str]:
+    """
+    Insert the progress options right after the ffmpeg executable.
+    """
+    return [cmd[0], "-hide_banner", "-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+
+def _write_input(stream, data: bytes) -> None:
+    """
+    Writer thread: feed `data` to ffmpeg's stdin, then close it.
+    """
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        # ffmpeg exited (or was killed) early; its return code tells why
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+def _attempt(cmd, label, duration, timeout, stall_timeout, live, input_data=None):
+    """
+    Run one attempt. Returns (returncode, progress, wall_s, cpu_s,
+    peak_rss_mb, killed_after) where `killed_after` is the limit (seconds)
+    that fired if the job was killed as hung, else None.
+    """
+    progress = Progress(duration)
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=stderr,
+            stdin=subprocess.PIPE if input_data is not None else None,
+        )
+        reader = threading.Thread(target=_read_progress, args=(proc.stdout, progress), daemon=True)
+        reader.start()
+        if input_data is not None:
+            threading.Thread(target=_write_input, args=(proc.stdin, input_data), daemon=True).start()
+
+        started = time.time()
+        last_report = 0.0
+        killed_after = None
+        while True:
+            done = poll_rusage(proc)
+            if done:
+                break
+
+            if _cancelled.is_set():
+                proc.kill()
+                poll_rusage(proc, block=True)
+                raise Cancelled(f"{label} cancelled")
+
+            now = time.time()
+            if stall_timeout and now - progress.updated_at > stall_timeout:
+                killed_after = stall_timeout
+            elif timeout and now - started > timeout:
+                killed_after = timeout
+            if killed_after:
+                proc.kill()
+                done = poll_rusage(proc, block=True)
+                break
+
+            if live and now - last_report >= REPORT_INTERVAL:
+                print(progress.status_line(label), end="\r", file=sys.stderr, flush=True)
+                last_report = now
+            time.sleep(0.2)
+
+        wall_s = time.time() - started
+        reader.join(timeout=1)
+        proc.stdout.close()
+
+        if live:
+            print(progress.status_line(label), file=sys.stderr, flush=True)
+
+        if done[0] != 0 and not killed_after:
+            stderr.seek(0)
+            tail = stderr.read().decode(errors="replace").strip()[-800:]
+            if tail:
+                print(tail, file=sys.stderr)
+
+    returncode, cpu_s, peak_rss_mb = done
+    return returncode, progress, wall_s, cpu_s, peak_rss_mb, killed_after
+
+
+def run_ffmpeg(
+    cmd: List[str],
+    name: str = "ffmpeg_encode",
+    stage: Optional[str] = None,
+    scene: Optional[int] = None,
+    duration: Optional[float] = None,
+    queued_at: Optional[float] = None,
+    timeout: Optional[float] = FFMPEG_TIMEOUT,
+    stall_timeout: Optional[float] = FFMPEG_STALL_TIMEOUT,
+    retries: int = FFMPEG_RETRIES,
+    live: bool = True,
+    input_data: Optional[bytes] = None,
+) -> None:
+    """
+    Run an ffmpeg command with progress reporting, stall detection and
+    retry of hung encodes. The output path is the last argument of `cmd`.
+    `input_data` is written to ffmpeg's stdin (for a `-i pipe:0` input),
+    again on every attempt.
+
+    Raises
+    ------
+    Cancelled
+        When cancel_encodes() was called before or during the encode.
+    subprocess.TimeoutExpired
+        When every attempt was killed as hung.
+    subprocess.CalledProcessError
+        When ffmpeg exits with an error (errors are not retried).
+    """
+    label = name if scene is None else f"scene_{scene:02d}"
+    if _cancelled.is_set():
+        raise Cancelled(f"{label} cancelled")
+    full_cmd = with_progress(cmd)
+
+    with span(name, stage=stage, scene=scene, queued_at=queued_at) as s:
+        cpu_total = 0.0
+        for attempt in range(1, retries + 2):
+            returncode, progress, wall_s, cpu_s, peak_rss_mb, killed_after = _attempt(
+                full_cmd, label, duration, timeout, stall_timeout, live, input_data
+            )
+            cpu_total += cpu_s or 0.0
+            s.set(
+                attempts=attempt,
+                stalled=attempt - 1 + int(bool(killed_after)),
+                returncode=returncode,
+                frames=progress.frame,
+                out_time_s=round(progress.out_time, 3),
+                avg_fps=round(progress.frame / wall_s, 2) if wall_s > 0 else None,
+                speed=progress.speed,
+                cpu_s=round(cpu_total, 3) if cpu_s is not None else None,
+                peak_rss_mb=peak_rss_mb,
+                bytes_written=file_size(cmd[-1]),
+            )
+
+            if not killed_after:
+                break
+            print(f" {label} stalled at {progress.out_time:.1f}s, killed "
+                  f"(attempt {attempt}/{retries + 1})", file=sys.stderr)
+        else:
+            raise subprocess.TimeoutExpired(cmd, killed_after)
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
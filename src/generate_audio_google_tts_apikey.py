@@ -5,14 +5,22 @@ from io import BytesIO
 import requests
 from pydub import AudioSegment
 
+from src.Config import GOOGLE_TTS_ENDPOINT
+from src.quota import acquire, backoff, is_rate_limited, retry_after
+from src.timing import export_trace, file_size, span
+from src.utils import read_stamp, text_digest, wav_duration, write_stamp
+
 
 API_KEY = os.getenv("GOOGLE_CLOUD_API_KEY")
-TTS_ENDPOINT = "https://texttospeech.googleapis.com/v1/text:synthesize"
+TTS_ENDPOINT = GOOGLE_TTS_ENDPOINT
 
 LANGUAGE_CODE = "en-US"
 VOICE_NAME = "en-US-Neural2-D"
 AUDIO_FORMAT = "wav"
 
+#: Attempts per scene when the TTS quota is exceeded (HTTP 429)
+MAX_ATTEMPTS = 3
+
 AUDIO_DIR = "audio"
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
@@ -34,11 +42,20 @@ def synthesize_scene_audio(text: str, output_path: str) -> float:
         }
     }
 
-    response = requests.post(
-        f"{TTS_ENDPOINT}?key={API_KEY}",
-        json=payload
-    )
-    response.raise_for_status()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        # Shared TTS budget across every pipeline process on this host
+        acquire("tts")
+        response = requests.post(
+            f"{TTS_ENDPOINT}?key={API_KEY}",
+            json=payload
+        )
+        try:
+            response.raise_for_status()
+            break
+        except requests.HTTPError as e:
+            if not is_rate_limited(e) or attempt == MAX_ATTEMPTS:
+                raise
+            backoff("tts", retry_after(e))
 
     # 1 Decode Base64 audio
     audio_base64 = response.json()["audioContent"]
@@ -64,7 +81,8 @@ def generate_audio_from_scenes(input_json: str, output_json: str) -> None:
     with open(input_json, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    scenes = data["Scenes"]
+    # improve_scenes.py writes "scenes", older manifests use "Scenes"
+    scenes = data.get("Scenes") or data.get("scenes")
 
     for scene in scenes:
         scene_id = scene["scene_id"]
@@ -74,12 +92,24 @@ def generate_audio_from_scenes(input_json: str, output_json: str) -> None:
             AUDIO_DIR, f"scene_{scene_id:02d}.wav"
         )
 
+        # Kept from an earlier run (or carried over by scene_revisions.py),
+        # but only if it was spoken from this narration
+        if (os.path.exists(output_audio)
+                and read_stamp(output_audio).get("text") == text_digest(narration)):
+            print(f"Scene {scene_id} audio is up to date. Skipping.")
+            scene["audio_file"] = output_audio
+            scene["audio_duration"] = round(wav_duration(output_audio), 2)
+            continue
+
         print(f"🎙 Generating audio for Scene {scene_id}")
 
-        duration = synthesize_scene_audio(
-            narration,
-            output_audio
-        )
+        with span("tts_request", stage="tts", scene=scene_id) as s:
+            duration = synthesize_scene_audio(
+                narration,
+                output_audio
+            )
+            s.set(bytes_written=file_size(output_audio), audio_s=duration)
+        write_stamp(output_audio, text=text_digest(narration))
 
         scene["audio_file"] = output_audio
         scene["audio_duration"] = duration
@@ -88,6 +118,7 @@ def generate_audio_from_scenes(input_json: str, output_json: str) -> None:
         json.dump({"Scenes": scenes}, f, indent=2)
 
     print(f"\n Audio generation completed → {output_json}")
+    export_trace("tts")
 
 
 if __name__ == "__main__":
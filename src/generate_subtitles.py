@@ -1,40 +1,102 @@
-import json
-from datetime import timedelta
+import argparse
+import os
 import re
+from contextlib import ExitStack
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from src.scene_stream import iter_records
+
+# Unwanted repetitive phrases, removed in one scan of the text
+REMOVE_PHRASES = [
+    "unfolding quietly",
+    "slowly unfolding",
+    "fading into silence"
+]
+_REMOVE_PATTERN = re.compile("|".join(re.escape(p) for p in REMOVE_PHRASES))
+_CHUNK_PATTERN = re.compile(r"[,.]")
+
+# Cue timing line of an SRT file
+_SRT_TIMING = re.compile(
+    r"^(\d{2,}):([0-5]\d):([0-5]\d),(\d{3}) --> (\d{2,}):([0-5]\d):([0-5]\d),(\d{3})$"
+)
+
+# Timestamps are compared in milliseconds, the SRT resolution
+TIME_TOLERANCE_MS = 1
+
+# Validation problems printed before the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1920
+PlayResY: 1080
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,54,&H00FFFFFF,&H000000FF,&H00000000,&H64000000,0,0,0,0,100,100,0,0,1,2,1,2,60,60,60,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+class Cue(NamedTuple):
+    index: int
+    start: float
+    end: float
+    text: str
+    scene_id: Optional[int] = None
+
+
+def _milliseconds(seconds: float) -> int:
+    # Rounded once, so a cue's end and the next cue's start stay identical
+    return int(round(seconds * 1000))
+
+
+def _clock(seconds: float):
+    total_ms = _milliseconds(seconds)
+    hours, rest = divmod(total_ms, 3600 * 1000)
+    minutes, rest = divmod(rest, 60 * 1000)
+    secs, milliseconds = divmod(rest, 1000)
+    return hours, minutes, secs, milliseconds
 
 
 def format_srt_time(seconds: float) -> str:
     """
     Convert seconds to SRT time format: HH:MM:SS,mmm
     """
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    milliseconds = int((seconds - total_seconds) * 1000)
+    hours, minutes, secs, milliseconds = _clock(seconds)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
 
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
 
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+def format_vtt_time(seconds: float) -> str:
+    """
+    Convert seconds to WebVTT time format: HH:MM:SS.mmm
+    """
+    hours, minutes, secs, milliseconds = _clock(seconds)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+
+
+def format_ass_time(seconds: float) -> str:
+    """
+    Convert seconds to ASS time format: H:MM:SS.cc
+    """
+    centiseconds = int(round(_milliseconds(seconds) / 10))
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    secs, centis = divmod(rest, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centis:02d}"
 
 
 def split_into_phrases(text: str, max_words=7):
     """
     Split text into readable phrases
     """
-    # Remove unwanted repetitive phrases
-    REMOVE_PHRASES = [
-        "unfolding quietly",
-        "slowly unfolding",
-        "fading into silence"
-    ]
-    for p in REMOVE_PHRASES:
-        text = text.replace(p, "")
-
-    text = text.strip()
+    text = _REMOVE_PATTERN.sub("", text).strip()
 
     # Split by punctuation first
-    chunks = re.split(r"[,.]", text)
+    chunks = _CHUNK_PATTERN.split(text)
     phrases = []
 
     for chunk in chunks:
@@ -50,18 +112,18 @@ def split_into_phrases(text: str, max_words=7):
     return phrases
 
 
-def generate_srt_from_scenes(input_json: str, output_srt: str):
+def iter_scenes(input_json: str) -> Iterator[dict]:
     """
-    Generate phrase-by-phrase SRT file from scenes JSON
+    Scenes of a manifest ("scenes" or "Scenes") or JSONL file, one at a time.
     """
-    with open(input_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    return iter_records(input_json, key=("scenes", "Scenes"))
 
-    scenes = data.get("scenes") or data.get("Scenes")
-    if not scenes:
-        raise ValueError("No scenes found in JSON")
 
-    srt_blocks = []
+def iter_cues(scenes: Iterable[dict]) -> Iterator[Cue]:
+    """
+    Phrase-by-phrase cues for a scene stream; each scene's audio_duration
+    is shared evenly between its phrases.
+    """
     subtitle_index = 1
     current_time = 0.0
 
@@ -77,59 +139,237 @@ def generate_srt_from_scenes(input_json: str, output_srt: str):
             ""
         ).strip()
 
-        if not text:
-            current_time += duration
-            continue
-
-        phrases = split_into_phrases(text)
+        phrases = split_into_phrases(text) if text else []
 
         if not phrases:
             current_time += duration
             continue
 
         phrase_duration = duration / len(phrases)
+        scene_end = current_time + duration
 
-        for phrase in phrases:
+        for i, phrase in enumerate(phrases):
             start = current_time
-            end = start + phrase_duration
+            # The last phrase ends exactly on the scene boundary
+            end = scene_end if i == len(phrases) - 1 else start + phrase_duration
+            yield Cue(subtitle_index, start, end, phrase, scene.get("scene_id"))
+            subtitle_index += 1
+            current_time = end
 
-            srt_blocks.append(str(subtitle_index))
-            srt_blocks.append(
-                f"{format_srt_time(start)} --> {format_srt_time(end)}"
+
+def _ass_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("{", "(").replace("}", ")").replace("\n", "\\N")
+
+
+class SubtitleWriter:
+    """
+    Writes cues to a subtitle file as they arrive, in the format of its
+    extension: .srt, .vtt or .ass.
+    """
+
+    FORMATS = (".srt", ".vtt", ".ass")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower()
+        if self.format not in self.FORMATS:
+            raise ValueError(f"Unsupported subtitle format: {path}")
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "w", encoding="utf-8", newline="\n")
+        if self.format == ".vtt":
+            self._file.write("WEBVTT\n\n")
+        elif self.format == ".ass":
+            self._file.write(ASS_HEADER)
+        return self
+
+    def write(self, cue: Cue) -> None:
+        if self.format == ".srt":
+            # Blocks are separated, not terminated, by a blank line
+            separator = "\n" if self.count else ""
+            self._file.write(
+                f"{separator}{cue.index}\n"
+                f"{format_srt_time(cue.start)} --> {format_srt_time(cue.end)}\n"
+                f"{cue.text}\n"
+            )
+        elif self.format == ".vtt":
+            self._file.write(
+                f"{format_vtt_time(cue.start)} --> {format_vtt_time(cue.end)}\n"
+                f"{cue.text}\n\n"
             )
-            srt_blocks.append(phrase)
-            srt_blocks.append("")
+        else:
+            self._file.write(
+                f"Dialogue: 0,{format_ass_time(cue.start)},{format_ass_time(cue.end)},"
+                f"Default,,0,0,0,,{_ass_text(cue.text)}\n"
+            )
+        self.count += 1
 
-            subtitle_index += 1
-            current_time = end
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        return False
+
+
+def generate_subtitles(input_json: str, outputs: List[str]) -> int:
+    """
+    Stream the scenes of `input_json` into cues and write them to every
+    path in `outputs` (SRT, WebVTT or ASS by extension) in one pass.
+    Returns the number of cues.
+    """
+    with ExitStack() as stack:
+        writers = [stack.enter_context(SubtitleWriter(path)) for path in outputs]
+        count = 0
+        for cue in iter_cues(iter_scenes(input_json)):
+            for writer in writers:
+                writer.write(cue)
+            count += 1
+
+    if not count:
+        raise ValueError("No scenes found in JSON")
+    return count
 
-    with open(output_srt, "w", encoding="utf-8", newline="\n") as f:
-        f.write("\n".join(srt_blocks))
+
+def generate_srt_from_scenes(input_json: str, output_srt: str):
+    """
+    Generate phrase-by-phrase SRT file from scenes JSON
+    """
+    count = generate_subtitles(input_json, [output_srt])
 
     print(f" Phrase-by-phrase subtitles generated → {output_srt}")
-    print(f" Total subtitle entries: {subtitle_index - 1}")
+    print(f" Total subtitle entries: {count}")
 
 
-def validate_srt_file(srt_file: str):
-    with open(srt_file, "r", encoding="utf-8") as f:
-        lines = f.read().strip().split("\n")
+def _parse_timing(match) -> tuple:
+    values = [int(v) for v in match.groups()]
+    start = ((values[0] * 60 + values[1]) * 60 + values[2]) * 1000 + values[3]
+    end = ((values[4] * 60 + values[5]) * 60 + values[6]) * 1000 + values[7]
+    return start, end
 
-    if not lines[0].isdigit():
-        print(" Invalid SRT: Missing index")
-        return False
 
-    if "-->" not in lines[1]:
-        print(" Invalid SRT: Missing timestamp")
+def _scene_spans(scenes_json: str) -> Iterator[tuple]:
+    """
+    (start_ms, end_ms) of every scene that gets cues, in timeline order.
+    """
+    current_time = 0.0
+    for scene in iter_scenes(scenes_json):
+        duration = scene.get("audio_duration", 0)
+        if duration <= 0:
+            continue
+        start, current_time = current_time, current_time + duration
+        text = (scene.get("narration") or scene.get("description") or scene.get("text") or "").strip()
+        if text and split_into_phrases(text):
+            yield _milliseconds(start), _milliseconds(current_time)
+
+
+def validate_srt_file(srt_file: str, scenes_json: Optional[str] = None,
+                      max_errors: int = MAX_REPORTED_ERRORS):
+    """
+    Check every cue of an SRT file in one pass, holding one cue at a time:
+
+    - blocks of index, timing line and at least one text line
+    - indices 1, 2, 3, ...
+    - end after start, and each cue starting at or after the previous end
+      (monotonic, non-overlapping)
+    - with `scenes_json`, every cue inside the span of a scene's
+      audio_duration on the timeline, and no cue past the last scene
+    """
+    errors = 0
+
+    def error(line_no, message):
+        nonlocal errors
+        errors += 1
+        if errors <= max_errors:
+            print(f" Invalid SRT line {line_no}: {message}")
+
+    spans = _scene_spans(scenes_json) if scenes_json else None
+    span = next(spans, None) if spans else None
+
+    expected_index = 1
+    previous_end = 0
+    state = "index"   # index -> timing -> text -> (blank) index
+    cues = 0
+    line_no = 0
+
+    with open(srt_file, "r", encoding="utf-8-sig") as f:
+        for line_no, raw in enumerate(f, start=1):
+            line = raw.rstrip("\r\n")
+
+            if state == "index":
+                if not line.strip():
+                    continue
+                if not line.strip().isdigit():
+                    error(line_no, f"expected cue index, found {line!r}")
+                    state = "skip"
+                    continue
+                if int(line) != expected_index:
+                    error(line_no, f"cue index {line}, expected {expected_index}")
+                expected_index = int(line) + 1
+                state = "timing"
+
+            elif state == "timing":
+                match = _SRT_TIMING.match(line.strip())
+                if not match:
+                    error(line_no, f"expected 'HH:MM:SS,mmm --> HH:MM:SS,mmm', found {line!r}")
+                    state = "skip"
+                    continue
+                start, end = _parse_timing(match)
+                if end <= start:
+                    error(line_no, "cue ends before it starts")
+                if start < previous_end - TIME_TOLERANCE_MS:
+                    error(line_no, f"cue starts {previous_end - start} ms before the previous one ends")
+                previous_end = max(previous_end, end)
+
+                if spans is not None:
+                    # Scenes and cues both run forward: advance to the cue's scene
+                    while span is not None and start >= span[1] - TIME_TOLERANCE_MS:
+                        span = next(spans, None)
+                    if span is None:
+                        error(line_no, "cue starts after the last scene ends")
+                    elif start < span[0] - TIME_TOLERANCE_MS or end > span[1] + TIME_TOLERANCE_MS:
+                        error(line_no, f"cue {start}-{end} ms crosses its scene {span[0]}-{span[1]} ms")
+                cues += 1
+                state = "text"
+
+            elif state == "text":
+                if not line.strip():
+                    error(line_no, "cue has no text")
+                    state = "index"
+                else:
+                    state = "more_text"
+
+            else:
+                # "more_text" or "skip": read to the end of the block
+                if not line.strip():
+                    state = "index"
+
+    if state in ("timing", "text"):
+        error(line_no, "file ends inside a cue")
+    if cues == 0 and errors == 0:
+        error(line_no, "no cues")
+
+    if errors:
+        if errors > max_errors:
+            print(f" ... {errors - max_errors} more problems")
+        print(f" SRT validation failed: {errors} problems in {cues} cues")
         return False
 
-    print(" SRT format validated successfully")
+    print(f" SRT format validated successfully ({cues} cues)")
     return True
 
 
 if __name__ == "__main__":
-    generate_srt_from_scenes(
-        input_json="output/scenes_with_audio.json",
-        output_srt="output/subtitles2.srt"
-    )
-
-    validate_srt_file("output/subtitles2.srt")
+    parser = argparse.ArgumentParser(description="Generate and validate phrase-by-phrase subtitles")
+    parser.add_argument("--input", default="output/scenes_with_audio.json",
+                        help="scenes JSON or JSONL")
+    parser.add_argument("--output", nargs="+", default=["output/subtitles2.srt"],
+                        help="subtitle files to write from the same cues (.srt, .vtt, .ass)")
+    args = parser.parse_args()
+
+    count = generate_subtitles(args.input, args.output)
+    print(f" Phrase-by-phrase subtitles generated → {', '.join(args.output)}")
+    print(f" Total subtitle entries: {count}")
+
+    for path in args.output:
+        if path.lower().endswith(".srt"):
+            validate_srt_file(path, scenes_json=args.input)
@@ -1,20 +1,27 @@
 import os
-import json
 import time
 import logging
+from pathlib import Path
 from huggingface_hub import InferenceClient
 from PIL import Image
 
 # ✅ CORRECT IMPORT
 from src.Config import (
     MODEL_ID,
+    HF_INFERENCE_URL,
     IMAGE_WIDTH,
     IMAGE_HEIGHT,
-    SLEEP_BETWEEN_REQUESTS,
     PROMPT_FILE,
+    PROMPT_JSONL,
     OUTPUT_DIR,
     LOG_FILE,
+    SLEEP_BETWEEN_REQUESTS,
+    PROMPT_DEDUP_REPORT,
 )
+from src.prompt_similarity import DedupReport, PromptIndex, reuse_image
+from src.scene_stream import follow_jsonl, iter_json_array, part_path
+from src.quota import acquire, backoff, is_rate_limited, retry_after
+from src.timing import export_trace, file_size, span
 
 # -----------------------------
 # Setup folders
@@ -39,20 +46,36 @@ if not HF_TOKEN:
     raise ValueError("HF_TOKEN not found. Set environment variable.")
 
 client = InferenceClient(
-    model=MODEL_ID,
+    model=HF_INFERENCE_URL or MODEL_ID,
     token=HF_TOKEN
 )
 
 # -----------------------------
 # Load prompts
 # -----------------------------
-if not PROMPT_FILE.exists():
-    raise FileNotFoundError(f"Prompt file not found: {PROMPT_FILE}")
+def _mtime(path):
+    return path.stat().st_mtime if path.exists() else 0.0
 
-with open(PROMPT_FILE, "r", encoding="utf-8") as f:
-    scenes = json.load(f)
 
-print(f"Total scenes found: {len(scenes)}")
+# Prefer the streamed JSONL prompts (prompt_main.py --stream) when they are
+# newer, following the file while prompt_main.py is still writing it
+jsonl_mtime = max(_mtime(PROMPT_JSONL), _mtime(Path(part_path(PROMPT_JSONL))))
+if jsonl_mtime and jsonl_mtime >= _mtime(PROMPT_FILE):
+    print(f"Streaming prompts from {PROMPT_JSONL}")
+    scenes = follow_jsonl(PROMPT_JSONL)
+elif PROMPT_FILE.exists():
+    print(f"Reading prompts from {PROMPT_FILE}")
+    scenes = iter_json_array(PROMPT_FILE)
+else:
+    raise FileNotFoundError(f"Prompt file not found: {PROMPT_FILE}")
+
+# -----------------------------
+# Near-duplicate prompts
+# -----------------------------
+# Images generated by earlier scenes and earlier runs, by prompt similarity
+index = PromptIndex()
+report = DedupReport()
+print(f"Prompt index: {index.cached} cached images")
 
 # -----------------------------
 # Generate images
@@ -62,25 +85,58 @@ for scene in scenes:
     prompt = scene["image_prompt"]
 
     output_path = OUTPUT_DIR / f"scene_{scene_id:02d}.png"
+    signature = index.signature(prompt)
 
     if output_path.exists():
         print(f"Scene {scene_id} already exists. Skipping.")
+        # Images from before the index existed become reusable too
+        if not index.indexed(output_path):
+            index.add(output_path, signature, scene_id)
+        continue
+
+    found = index.match(signature)
+    if found:
+        match, score = found
+        with span("image_reuse", stage="image", scene=scene_id, similarity=round(score, 3)) as s:
+            reuse_image(match["image"], output_path)
+            s.set(bytes_written=file_size(str(output_path)))
+        report.add_reuse(scene_id, output_path, match, score)
+        print(f"Scene {scene_id} reuses {match['image']} (similarity {score:.2f})")
+        logging.info(f"Scene {scene_id} reused {match['image']} (similarity {score:.2f})")
         continue
 
     try:
+        # Shared HF budget across every pipeline process on this host
+        waited = acquire("hf")
         print(f"Generating Scene {scene_id}...")
-        image = client.text_to_image(
-            prompt,
-            width=IMAGE_WIDTH,
-            height=IMAGE_HEIGHT
-        )
+        with span("image_request", stage="image", scene=scene_id, quota_wait_s=round(waited, 2)) as s:
+            image = client.text_to_image(
+                prompt,
+                width=IMAGE_WIDTH,
+                height=IMAGE_HEIGHT
+            )
 
-        image.save(output_path)
+            image.save(output_path)
+            s.set(bytes_written=file_size(str(output_path)))
+        index.add(output_path, signature, scene_id)
+        report.generated += 1
         logging.info(f"Scene {scene_id} generated successfully")
 
-        time.sleep(SLEEP_BETWEEN_REQUESTS)
-
     except Exception as e:
         logging.error(f"Scene {scene_id} failed: {str(e)}")
         print(f"Error in Scene {scene_id}: {e}")
-        time.sleep(30)
+        if is_rate_limited(e):
+            # Pause HF for every process, not just this one
+            backoff("hf", retry_after(e))
+        else:
+            time.sleep(30)
+
+summary = report.write(PROMPT_DEDUP_REPORT, SLEEP_BETWEEN_REQUESTS)
+print(
+    f"Images: {summary['generated']} generated, {summary['reused']} reused "
+    f"({summary['reused_within_job']} within this job, {summary['reused_from_cache']} from the cache): "
+    f"{summary['calls_saved']} model calls and ~{summary['seconds_saved']:.0f}s saved "
+    f"→ {PROMPT_DEDUP_REPORT}"
+)
+
+export_trace("image_generation")
@@ -43,27 +43,24 @@ scenes_enhanced.json
 }
 """
 
+import argparse
 import json
 from typing import Dict, List
 
+from src.scene_presets import load_presets
+
 
 #: Average narration speed (words per second)
 WORDS_PER_SECOND = 2.2
 
+#: Keyword preset tables (config/scene_presets.json, see src/scene_presets.py)
+PRESETS = load_presets()
+
 #: Default voice style used when no special rule is applied
-DEFAULT_VOICE_STYLE = {
-    "tone": "calm, narrative",
-    "pace": "moderate",
-    "emotion": "neutral"
-}
+DEFAULT_VOICE_STYLE = PRESETS["voice_style"].presets[PRESETS["voice_style"].default]
 
 #: Background audio presets inferred from scene context
-BACKGROUND_AUDIO_PRESETS = {
-    "village": "ambient village sounds, light wind",
-    "field": "soft wind, distant birds",
-    "indoor": "subtle room tone",
-    "default": "soft ambient atmosphere"
-}
+BACKGROUND_AUDIO_PRESETS = PRESETS["background_audio"].presets
 
 
 def estimate_audio_duration(text: str, words_per_second: float = WORDS_PER_SECOND) -> float:
@@ -90,8 +87,8 @@ def generate_narration(description: str) -> str:
     """
     Generate an improved narration sentence from a scene description.
 
-    This function currently performs lightweight rewriting.
-    It can later be replaced with an LLM-based narration generator.
+    This function performs lightweight rewriting. It is also the fallback
+    for scenes the LLM narration generator (`--llm`) cannot narrate.
 
     Parameters
     ----------
@@ -125,50 +122,46 @@ def infer_background_audio(description: str) -> str:
     str
         Background audio description.
     """
-    desc_lower = description.lower()
+    return infer_background_audios([description])[0]
 
-    if "village" in desc_lower or "houses" in desc_lower:
-        return BACKGROUND_AUDIO_PRESETS["village"]
-    if "field" in desc_lower or "earth" in desc_lower:
-        return BACKGROUND_AUDIO_PRESETS["field"]
-    if "house" in desc_lower or "room" in desc_lower:
-        return BACKGROUND_AUDIO_PRESETS["indoor"]
 
-    return BACKGROUND_AUDIO_PRESETS["default"]
+def infer_background_audios(descriptions: List[str]) -> List[str]:
+    """
+    Background audio for a whole scene list, classified in one pass.
+    """
+    table = PRESETS["background_audio"]
+    return [table.presets[name] for name in table.preset_names(descriptions)]
 
 
-def infer_voice_style(scene_id: int) -> Dict[str, str]:
+def infer_voice_style(scene_id: int, description: str = "") -> Dict[str, str]:
     """
-    Assign voice style parameters based on scene order.
+    Assign voice style parameters from description keywords, falling back
+    to the per-scene overrides (the opening scenes) and the default style.
 
     Parameters
     ----------
     scene_id : int
         Scene identifier.
+    description : str
+        Scene description text.
 
     Returns
     -------
     dict
         Voice style dictionary containing tone, pace, and emotion.
     """
-    if scene_id == 1:
-        return {
-            "tone": "calm, contemplative",
-            "pace": "slow",
-            "emotion": "peaceful"
-        }
-    if scene_id == 2:
-        return {
-            "tone": "gentle, narrative",
-            "pace": "moderate",
-            "emotion": "empathetic"
-        }
+    return infer_voice_styles([scene_id], [description])[0]
 
-    return DEFAULT_VOICE_STYLE
 
+def infer_voice_styles(scene_ids: List[int], descriptions: List[str]) -> List[Dict[str, str]]:
+    """
+    Voice styles for a whole scene list, classified in one pass.
+    """
+    table = PRESETS["voice_style"]
+    return [dict(table.presets[name]) for name in table.preset_names(descriptions, scene_ids)]
 
 
-def improve_scenes(input_path: str, output_path: str) -> None:
+def improve_scenes(input_path: str, output_path: str, use_llm: bool = False) -> None:
     """
     Enhance scenes with narration and audio metadata.
 
@@ -178,6 +171,9 @@ def improve_scenes(input_path: str, output_path: str) -> None:
         Path to the input scenes JSON file.
     output_path : str
         Path to save the enhanced scenes JSON file.
+    use_llm : bool
+        Write narration with batched LLM calls (src/narration_llm.py)
+        instead of the rule-based rewrite.
 
     Returns
     -------
@@ -186,10 +182,34 @@ def improve_scenes(input_path: str, output_path: str) -> None:
     with open(input_path, "r", encoding="utf-8") as file:
         data = json.load(file)
 
+    scene_ids = [scene["scene_id"] for scene in data["Scenes"]]
+    descriptions = [scene["description"] for scene in data["Scenes"]]
+    styles = dict(zip(scene_ids, infer_voice_styles(scene_ids, descriptions)))
+    backgrounds = dict(zip(scene_ids, infer_background_audios(descriptions)))
+
+    if use_llm:
+        from src.narration_llm import NarrationGenerator
+
+        generator = NarrationGenerator(fallback=generate_narration)
+        narrations = generator.generate([
+            {
+                "scene_id": scene["scene_id"],
+                "description": scene["description"],
+                "voice_style": styles[scene["scene_id"]],
+            }
+            for scene in data["Scenes"]
+        ])
+        print(f"✔ Narration: {generator.stats}")
+    else:
+        narrations = {
+            scene["scene_id"]: generate_narration(scene["description"])
+            for scene in data["Scenes"]
+        }
+
     enhanced_scenes: List[Dict] = []
 
     for scene in data["Scenes"]:
-        narration = generate_narration(scene["description"])
+        narration = narrations[scene["scene_id"]]
         duration = estimate_audio_duration(narration)
 
         enhanced_scene = {
@@ -200,8 +220,8 @@ def improve_scenes(input_path: str, output_path: str) -> None:
             # Audio-related enhancements
             "narration": narration,
             "audio_duration": duration,
-            "voice_style": infer_voice_style(scene["scene_id"]),
-            "background_audio": infer_background_audio(scene["description"])
+            "voice_style": styles[scene["scene_id"]],
+            "background_audio": backgrounds[scene["scene_id"]]
         }
 
         enhanced_scenes.append(enhanced_scene)
@@ -213,7 +233,13 @@ def improve_scenes(input_path: str, output_path: str) -> None:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enhance scenes with narration and audio metadata")
+    parser.add_argument("--llm", action="store_true",
+                        help="generate narration with batched LLM calls")
+    args = parser.parse_args()
+
     improve_scenes(
         input_path="output/scenes.json",
-        output_path="output/scenes_enhanced.json"
+        output_path="output/scenes_enhanced.json",
+        use_llm=args.llm
     )
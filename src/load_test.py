@@ -0,0 +1,266 @@
+"""
+load_test.py
+============
+
+Offline Pipeline Load Test
+
+Runs N synthetic scripts through the pipeline against the local stub
+providers (src/stub_providers.py), K scripts at a time, and reports:
+
+- throughput    scripts and scenes per minute
+- latency       p50/p95/p99/max per provider request, from each run's traces
+- stages        wall time, CPU seconds and peak RSS of every stage process
+- providers     requests, 500s and 429s the stubs served
+
+Every script runs in its own directory (PIPELINE_BASE_DIR) with its own
+quota database, so nothing touches the real outputs or the host-wide quota.
+Unrecognised options are passed to the stub server, e.g. `--image-rps 0.5`.
+
+Usage:
+    python -m src.load_test --scripts 8 --concurrency 4 --stages analyze prompts images tts
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from src.timing import wait_rusage
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "output", "load_tests")
+
+#: Pipeline stages in order, as commands run from the script's directory
+STAGES = {
+    "analyze": [os.path.join(REPO_DIR, "analyzer_main.py")],
+    "prompts": [os.path.join(REPO_DIR, "prompt_main.py")],
+    "images": ["-m", "src.image_generation"],
+    "improve": ["-m", "src.improve_scenes"],
+    "tts": ["-m", "src.generate_audio_google_tts_apikey"],
+    "subtitles": ["-m", "src.generate_subtitles"],
+    "render": ["-m", "src.scene_video_ffmpeg_with_animation"],
+    "stitch": ["-m", "src.stitch_final_video"],
+}
+
+#: Trace span name -> provider, for request latencies
+REQUEST_SPANS = {"llm_call": "llm", "image_request": "image", "tts_request": "tts"}
+
+_WORDS = (
+    "village river morning storm child farmer market lantern road hill field "
+    "old quiet bright distant narrow golden broken small crowded silent "
+    "walks waits watches carries opens crosses remembers builds"
+).split()
+
+
+def synthetic_script(sentences: int, rng: random.Random) -> str:
+    lines = []
+    for _ in range(sentences):
+        words = rng.sample(_WORDS, rng.randint(8, 14))
+        lines.append(" ".join(words).capitalize() + ".")
+    return "Synthetic Script\n\n" + " ".join(lines) + "\n"
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+    return {"count": len(values), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99),
+            "max": round(values[-1], 3)}
+
+
+def run_script(index: int, run_dir: str, stages: List[str], env: Dict[str, str],
+               sentences: int, seed: int) -> Dict:
+    """
+    Run one synthetic script through `stages`, stopping at the first failure.
+    """
+    work_dir = os.path.join(run_dir, f"script_{index:03d}")
+    os.makedirs(os.path.join(work_dir, "input"), exist_ok=True)
+    with open(os.path.join(work_dir, "input", "script"), "w", encoding="utf-8") as f:
+        f.write(synthetic_script(sentences, random.Random(seed + index)))
+
+    script_env = dict(env, PIPELINE_BASE_DIR=work_dir,
+                      QUOTA_DB=os.path.join(run_dir, "quota.db"))
+    result = {"script": index, "ok": True, "stages": {}}
+    started = time.time()
+    with open(os.path.join(work_dir, "pipeline.log"), "wb") as log:
+        for stage in stages:
+            stage_started = time.time()
+            proc = subprocess.Popen([sys.executable] + STAGES[stage], cwd=work_dir,
+                                    env=script_env, stdout=log, stderr=subprocess.STDOUT)
+            returncode, cpu_s, peak_rss_mb = wait_rusage(proc)
+            result["stages"][stage] = {
+                "wall_s": round(time.time() - stage_started, 3),
+                "cpu_s": cpu_s,
+                "peak_rss_mb": peak_rss_mb,
+                "returncode": returncode,
+            }
+            if returncode != 0:
+                result["ok"] = False
+                result["failed_stage"] = stage
+                break
+    result["wall_s"] = round(time.time() - started, 3)
+
+    scenes_json = os.path.join(work_dir, "output", "scenes.json")
+    if os.path.exists(scenes_json):
+        with open(scenes_json, "r", encoding="utf-8") as f:
+            result["scenes"] = len(json.load(f).get("Scenes", []))
+
+    result["requests"] = {}
+    for trace_path in glob.glob(os.path.join(work_dir, "output", "traces", "*.trace.json")):
+        with open(trace_path, "r", encoding="utf-8") as f:
+            spans = json.load(f)["spans"]
+        for s in spans:
+            provider = REQUEST_SPANS.get(s["name"])
+            if provider:
+                entry = result["requests"].setdefault(provider, {"latency": [], "errors": 0})
+                entry["latency"].append(s["work_s"])
+                entry["errors"] += 1 if s.get("error") else 0
+    return result
+
+
+def wait_for_stub(url: str, timeout: float = 15.0) -> None:
+    deadline = time.time() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=2).read()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def build_report(results: List[Dict], wall_s: float, stub_stats: Dict) -> Dict:
+    done = [r for r in results if r["ok"]]
+    scenes = sum(r.get("scenes", 0) for r in done)
+    stages = {}
+    for r in results:
+        for stage, stats in r["stages"].items():
+            entry = stages.setdefault(stage, {"wall": [], "cpu_s": 0.0, "peak_rss_mb": 0.0, "failed": 0})
+            entry["wall"].append(stats["wall_s"])
+            entry["cpu_s"] += stats["cpu_s"] or 0.0
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], stats["peak_rss_mb"] or 0.0)
+            entry["failed"] += 1 if stats["returncode"] else 0
+
+    requests = {}
+    for r in results:
+        for provider, entry in r["requests"].items():
+            merged = requests.setdefault(provider, {"latency": [], "errors": 0})
+            merged["latency"] += entry["latency"]
+            merged["errors"] += entry["errors"]
+
+    return {
+        "scripts": len(results),
+        "succeeded": len(done),
+        "failed": {r["script"]: r.get("failed_stage") for r in results if not r["ok"]},
+        "wall_s": round(wall_s, 2),
+        "scripts_per_min": round(len(done) / wall_s * 60, 2) if wall_s else None,
+        "scenes_per_min": round(scenes / wall_s * 60, 2) if wall_s else None,
+        "script_wall_s": percentiles([r["wall_s"] for r in results]),
+        "stages": {
+            stage: {
+                "wall_s": percentiles(entry["wall"]),
+                "cpu_s": round(entry["cpu_s"], 2),
+                "peak_rss_mb": round(entry["peak_rss_mb"], 1),
+                "failed": entry["failed"],
+            }
+            for stage, entry in stages.items()
+        },
+        "requests": {
+            provider: {**percentiles(entry["latency"]), "errors": entry["errors"]}
+            for provider, entry in requests.items()
+        },
+        "stub": stub_stats,
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n Scripts: {report['succeeded']}/{report['scripts']} succeeded in {report['wall_s']}s "
+          f"({report['scripts_per_min']} scripts/min, {report['scenes_per_min']} scenes/min)")
+    for script, stage in report["failed"].items():
+        print(f"   script {script} failed at {stage}")
+    print(" Stages:")
+    for stage, entry in report["stages"].items():
+        wall = entry["wall_s"]
+        print(f"   {stage:<10} p50 {wall['p50']:>7}s  p95 {wall['p95']:>7}s  "
+              f"cpu {entry['cpu_s']:>7}s  peak rss {entry['peak_rss_mb']:>6} MB")
+    print(" Requests:")
+    for provider, entry in report["requests"].items():
+        stub = report["stub"].get(provider, {})
+        print(f"   {provider:<6} n={entry['count']:<5} p50 {entry['p50']}s  p95 {entry['p95']}s  "
+              f"p99 {entry['p99']}s  max {entry['max']}s  client errors {entry['errors']}  "
+              f"stub 500s {stub.get('errors', 0)}  429s {stub.get('throttled', 0)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test the pipeline against local stub providers "
+                    "(other options are passed to src.stub_providers)")
+    parser.add_argument("--scripts", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--sentences", type=int, default=6, help="sentences (scenes) per script")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota-scale", type=float, default=1.0,
+                        help="multiply the provider budgets of Config.PROVIDER_QUOTAS")
+    parser.add_argument("--seed", type=int, default=0)
+    args, stub_args = parser.parse_known_args()
+
+    stages = [stage for stage in STAGES if stage in args.stages]
+    run_dir = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(run_dir, exist_ok=True)
+
+    url = f"http://127.0.0.1:{args.port}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "src.stub_providers", "--port", str(args.port)] + stub_args,
+        cwd=REPO_DIR,
+    )
+    try:
+        wait_for_stub(url)
+        env = dict(
+            os.environ,
+            PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            OPENROUTER_API_BASE=f"{url}/v1",
+            HF_INFERENCE_URL=f"{url}/hf/stub-model",
+            GOOGLE_TTS_ENDPOINT=f"{url}/v1/text:synthesize",
+            OPENROUTER_API_KEY="stub",
+            HF_TOKEN="stub",
+            GOOGLE_CLOUD_API_KEY="stub",
+            QUOTA_SCALE=str(args.quota_scale),
+        )
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(
+                lambda i: run_script(i, run_dir, stages, env, args.sentences, args.seed),
+                range(1, args.scripts + 1),
+            ))
+        wall_s = time.time() - started
+
+        with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+            stub_stats = json.load(response)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report = build_report(results, wall_s, stub_stats)
+    report["settings"] = {**vars(args), "stages": stages, "stub_args": stub_args}
+    with open(os.path.join(run_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\n Report → {os.path.join(run_dir, 'report.json')}")
+
+
+if __name__ == "__main__":
+    main()
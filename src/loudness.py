@@ -0,0 +1,271 @@
+"""
+loudness.py
+===========
+
+Narration Loudness Analysis
+
+Measures every scene WAV once with NumPy and stores a normalization gain in
+the scene manifest, instead of running ffmpeg `loudnorm` twice per file.
+The renderers apply the gain inside the encode they already do, so leveling
+costs no extra pass over the audio.
+
+Per scene:
+- integrated loudness (LUFS), ITU-R BS.1770: K-weighting, 400 ms blocks
+  with 75% overlap, absolute gate at -70 LUFS and relative gate at -10 LU
+- true peak (dBTP), from 4x oversampling
+- gain_db, bringing the scene to LOUDNESS_TARGET_LUFS without its true peak
+  exceeding TRUE_PEAK_CEILING_DBTP
+
+The PCM is memory-mapped and processed as whole arrays: K-weighting is
+applied as the filters' frequency response on one FFT of the file, block
+energies come from one cumulative sum, and oversampling is FFT zero-padding.
+
+Usage:
+    python -m src.loudness            # updates output/scenes_with_audio.json
+"""
+
+import json
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.Config import LOUDNESS_TARGET_LUFS, TRUE_PEAK_CEILING_DBTP
+from src.timing import export_trace, span
+
+SCENES_JSON = "output/scenes_with_audio.json"
+
+#: BS.1770 gating block and hop, in seconds
+BLOCK_S = 0.4
+HOP_S = 0.1
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+#: Oversampling factor for the true-peak estimate
+TRUE_PEAK_OVERSAMPLE = 4
+
+#: Zero padding after the signal so the filters' decay does not wrap around
+FILTER_TAIL_S = 0.5
+
+_PCM_DTYPES = {(1, 8): "u1", (1, 16): "<i2", (1, 32): "<i4", (3, 32): "<f4", (3, 64): "<f8"}
+
+
+def read_pcm(path: str) -> Tuple[np.ndarray, int]:
+    """
+    Memory-map a WAV file's samples.
+
+    Returns
+    -------
+    (samples, rate)
+        `samples` is a read-only (frames, channels) array in the file's
+        sample format.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a WAV with 8/16/32-bit integer or float samples.
+    """
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path}: not a WAV file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path}: no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size + size % 2)
+                tag, channels, rate = struct.unpack("<HHI", body[:8])
+                bits = struct.unpack("<H", body[14:16])[0]
+                if tag == 0xFFFE:
+                    # WAVE_FORMAT_EXTENSIBLE: real format is in the sub-format GUID
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"{path}: no fmt chunk")
+    tag, channels, rate, bits = fmt
+    dtype = _PCM_DTYPES.get((tag, bits))
+    if dtype is None:
+        raise ValueError(f"{path}: unsupported sample format (tag {tag}, {bits} bit)")
+
+    frames = min(size, os.path.getsize(path) - offset) // (channels * bits // 8)
+    samples = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, channels))
+    return samples, rate
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    """
+    Samples scaled to [-1, 1] floats.
+    """
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float64) - 128.0) / 128.0
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float64) / float(np.iinfo(samples.dtype).max + 1)
+    return samples.astype(np.float64)
+
+
+def _biquad_response(b, a, w: np.ndarray) -> np.ndarray:
+    z = np.exp(-1j * w)
+    return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+
+def k_weighting_response(rate: int, w: np.ndarray) -> np.ndarray:
+    """
+    Complex response of the BS.1770 K-weighting filter (high shelf then
+    high pass) at angular frequencies `w`, designed for `rate`.
+    """
+    # Stage 1: high shelf (+4 dB above ~1.7 kHz)
+    gain_db, q, fc = 3.99984385397, 0.7071752369554193, 1681.9744509555319
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * fc / rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    shelf_b = (
+        A * ((A + 1) + (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha),
+        -2 * A * ((A - 1) + (A + 1) * cos_w0),
+        A * ((A + 1) + (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha),
+    )
+    shelf_a = (
+        (A + 1) - (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha,
+        2 * ((A - 1) - (A + 1) * cos_w0),
+        (A + 1) - (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha,
+    )
+
+    # Stage 2: high pass (RLB weighting, ~38 Hz)
+    q, fc = 0.5003270373253953, 38.13547087613982
+    w0 = 2 * np.pi * fc / rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    pass_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    pass_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    return _biquad_response(shelf_b, shelf_a, w) * _biquad_response(pass_b, pass_a, w)
+
+
+def integrated_loudness(x: np.ndarray, rate: int) -> float:
+    """
+    Gated integrated loudness in LUFS of a (frames, channels) float signal.
+    Returns -inf for silence.
+    """
+    frames = x.shape[0]
+    if frames == 0:
+        return float("-inf")
+    n_fft = 1 << int(np.ceil(np.log2(frames + int(FILTER_TAIL_S * rate))))
+    w = 2 * np.pi * np.arange(n_fft // 2 + 1) / n_fft
+    spectrum = np.fft.rfft(x, n_fft, axis=0) * k_weighting_response(rate, w)[:, None]
+    weighted = np.fft.irfft(spectrum, n_fft, axis=0)[:frames]
+
+    # Mean square of every 400 ms block (100 ms hop) from one cumulative sum
+    block = int(round(BLOCK_S * rate))
+    hop = int(round(HOP_S * rate))
+    energy = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(weighted ** 2, axis=0)])
+    if frames < block:
+        starts = np.array([0])
+        block = frames
+    else:
+        starts = np.arange(0, frames - block + 1, hop)
+    z = (energy[starts + block] - energy[starts]) / max(block, 1)
+
+    # Mono/stereo channels all weigh 1.0 (no surround in narration)
+    block_power = z.sum(axis=1)
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+
+    gated = block_loudness > ABSOLUTE_GATE_LUFS
+    if not gated.any():
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(block_power[gated].mean()) + RELATIVE_GATE_LU
+    gated &= block_loudness > relative_gate
+    return float(-0.691 + 10 * np.log10(block_power[gated].mean()))
+
+
+def true_peak(x: np.ndarray) -> float:
+    """
+    True peak in dBTP, from FFT oversampling by TRUE_PEAK_OVERSAMPLE.
+    """
+    frames = x.shape[0]
+    if frames == 0:
+        return float("-inf")
+    spectrum = np.fft.rfft(x, axis=0)
+    upsampled = np.fft.irfft(spectrum, frames * TRUE_PEAK_OVERSAMPLE, axis=0) * TRUE_PEAK_OVERSAMPLE
+    peak = max(float(np.abs(upsampled).max()), float(np.abs(x).max()))
+    return float(20 * np.log10(peak)) if peak > 0 else float("-inf")
+
+
+def analyze(path: str,
+            target_lufs: float = LOUDNESS_TARGET_LUFS,
+            ceiling_dbtp: float = TRUE_PEAK_CEILING_DBTP) -> Dict[str, Optional[float]]:
+    """
+    Loudness, true peak and normalization gain of one WAV file.
+    """
+    samples, rate = read_pcm(path)
+    x = to_float(samples)
+    loudness = integrated_loudness(x, rate)
+    peak = true_peak(x)
+
+    if np.isinf(loudness):
+        gain = 0.0
+    else:
+        gain = min(target_lufs - loudness, ceiling_dbtp - peak)
+    return {
+        "integrated_lufs": None if np.isinf(loudness) else round(loudness, 2),
+        "true_peak_dbtp": None if np.isinf(peak) else round(peak, 2),
+        "gain_db": round(gain, 2),
+    }
+
+
+def scene_gain(scene: Dict) -> Optional[float]:
+    """
+    Normalization gain stored on a manifest scene, if it was analyzed.
+    """
+    gain = (scene.get("loudness") or {}).get("gain_db")
+    return gain or None
+
+
+def analyze_scenes(scenes_json: str = SCENES_JSON) -> None:
+    """
+    Analyze every scene's audio_file and write the results into the
+    manifest as scene["loudness"].
+    """
+    with open(scenes_json, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    for scene in data["Scenes"]:
+        audio_path = scene["audio_file"].replace("\\", "/")
+        scene_num = int(scene["scene_id"])
+        if not os.path.exists(audio_path):
+            print(f" Missing audio: {audio_path}")
+            continue
+        try:
+            with span("loudness", stage="audio", scene=scene_num) as s:
+                scene["loudness"] = analyze(audio_path)
+                s.set(**scene["loudness"])
+        except ValueError as e:
+            print(f" Skipping scene_{scene_num:02d}: {e}")
+            continue
+        print(
+            f" scene_{scene_num:02d} {scene['loudness']['integrated_lufs']} LUFS, "
+            f"peak {scene['loudness']['true_peak_dbtp']} dBTP → gain {scene['loudness']['gain_db']:+.2f} dB"
+        )
+
+    tmp_path = f"{scenes_json}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, scenes_json)
+    print(f" Loudness written to {scenes_json}")
+
+
+if __name__ == "__main__":
+    analyze_scenes()
+    export_trace("loudness")
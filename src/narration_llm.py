@@ -0,0 +1,243 @@
+"""
+narration_llm.py
+================
+
+Batched LLM Narration Generator
+
+Rewrites scene descriptions into narration with an OpenAI-compatible chat
+endpoint. Instead of one call per scene, scenes are sent in batches of
+`NARRATION_BATCH_SIZE` and the model must answer with a JSON object that
+follows `NARRATION_SCHEMA`. Batches run concurrently (`NARRATION_CONCURRENCY`)
+and draw on the host-wide "openrouter" quota (src/quota.py); a batch that is
+rate limited pauses the provider and is retried.
+
+Results are cached on disk per (description, voice style), so re-running
+the pipeline only sends new or edited scenes. Any scene the model skips or
+answers badly, or whose batch fails, gets the rule-based narration instead.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from dotenv import load_dotenv
+from json_repair import repair_json
+from openai import OpenAI
+
+from src.Config import (
+    NARRATION_API_BASE,
+    NARRATION_ATTEMPTS,
+    NARRATION_BATCH_SIZE,
+    NARRATION_CACHE,
+    NARRATION_CONCURRENCY,
+    NARRATION_MODEL,
+)
+from src.quota import acquire, backoff, is_rate_limited, retry_after
+from src.timing import span
+
+load_dotenv()
+
+#: Response format every batch must follow
+NARRATION_SCHEMA = {
+    "name": "scene_narrations",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "narrations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "scene_id": {"type": "integer"},
+                        "narration": {"type": "string"},
+                    },
+                    "required": ["scene_id", "narration"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["narrations"],
+        "additionalProperties": False,
+    },
+}
+
+SYSTEM_PROMPT = (
+    "You write voice-over narration for a documentary-style video. For every "
+    "scene you receive, write one or two spoken sentences that narrate the "
+    "description in the given voice style. Do not describe the camera. Reply "
+    "only with JSON: {\"narrations\": [{\"scene_id\": <int>, \"narration\": <str>}]} "
+    "containing one entry per scene."
+)
+
+
+def cache_key(description: str, style: Dict[str, str]) -> str:
+    raw = json.dumps([description.strip(), style], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class NarrationGenerator:
+    """
+    Generates narration for many scenes with batched, rate-limited LLM calls.
+
+    Parameters
+    ----------
+    fallback : callable
+        Rule-based narration (description -> text) used for failed scenes.
+    """
+
+    def __init__(
+        self,
+        fallback: Callable[[str], str],
+        model: str = NARRATION_MODEL,
+        base_url: str = NARRATION_API_BASE,
+        batch_size: int = NARRATION_BATCH_SIZE,
+        concurrency: int = NARRATION_CONCURRENCY,
+        attempts: int = NARRATION_ATTEMPTS,
+        cache_path=NARRATION_CACHE,
+    ):
+        api_key = os.getenv("OPENROUTER_API_KEY")
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY is missing in .env")
+
+        # No client-side retries: 429s are retried through the shared quota
+        self.client = OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+        self.model = model
+        self.fallback = fallback
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.cache_path = str(cache_path)
+        self.cache = self._load_cache()
+        self.stats = {"cached": 0, "generated": 0, "fallback": 0, "requests": 0}
+
+    def _load_cache(self) -> Dict[str, str]:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable narration cache: {e}")
+            return {}
+
+    def _save_cache(self) -> None:
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.cache, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def _request(self, batch: List[Dict]) -> Dict[int, str]:
+        """
+        Send one batch. Returns {scene_id: narration} for the valid entries.
+        """
+        payload = [
+            {
+                "scene_id": scene["scene_id"],
+                "description": scene["description"],
+                "voice_style": scene["voice_style"],
+            }
+            for scene in batch
+        ]
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps({"scenes": payload}, ensure_ascii=False)},
+        ]
+
+        acquire("openrouter")
+        with span("llm_call", stage="narration", model=self.model, scenes=len(batch)) as s:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.4,
+                response_format={"type": "json_schema", "json_schema": NARRATION_SCHEMA},
+            )
+            result_text = response.choices[0].message.content or ""
+            s.set(response_chars=len(result_text))
+
+        try:
+            result = json.loads(result_text)
+        except json.JSONDecodeError:
+            result = json.loads(repair_json(result_text))
+
+        expected = {scene["scene_id"] for scene in batch}
+        narrations = {}
+        items = result.get("narrations", []) if isinstance(result, dict) else []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            scene_id = item.get("scene_id")
+            text = item.get("narration")
+            if scene_id in expected and isinstance(text, str) and text.strip():
+                narrations[scene_id] = text.strip()
+        return narrations
+
+    def _run_batch(self, batch: List[Dict]) -> Dict[int, str]:
+        ids = [scene["scene_id"] for scene in batch]
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return self._request(batch)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.attempts:
+                    logging.error(f"Narration batch {ids[0]}-{ids[-1]} failed: {e}")
+                    return {}
+                # Pauses every process; the retry waits in acquire()
+                backoff("openrouter", retry_after(e))
+                logging.warning(f"Narration batch {ids[0]}-{ids[-1]} rate limited, "
+                                f"retrying (attempt {attempt + 1}/{self.attempts})")
+        return {}
+
+    def generate(self, scenes: List[Dict]) -> Dict[int, str]:
+        """
+        Narration for every scene.
+
+        Parameters
+        ----------
+        scenes : list of dict
+            Each with "scene_id", "description" and "voice_style".
+
+        Returns
+        -------
+        dict
+            {scene_id: narration}, one entry per input scene.
+        """
+        narrations: Dict[int, str] = {}
+        pending: List[Dict] = []
+        for scene in scenes:
+            cached = self.cache.get(cache_key(scene["description"], scene["voice_style"]))
+            if cached:
+                narrations[scene["scene_id"]] = cached
+                self.stats["cached"] += 1
+            else:
+                pending.append(scene)
+
+        batches = [
+            pending[i:i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        if batches:
+            logging.info(
+                f"Generating narration for {len(pending)} scenes in {len(batches)} batches "
+                f"({self.stats['cached']} cached)"
+            )
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(self._run_batch, batches))
+            self.stats["requests"] += len(batches)
+
+            for batch, generated in zip(batches, results):
+                for scene in batch:
+                    text = generated.get(scene["scene_id"])
+                    if text:
+                        self.cache[cache_key(scene["description"], scene["voice_style"])] = text
+                        self.stats["generated"] += 1
+                    else:
+                        text = self.fallback(scene["description"])
+                        self.stats["fallback"] += 1
+                    narrations[scene["scene_id"]] = text
+            self._save_cache()
+
+        return narrations
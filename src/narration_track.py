@@ -0,0 +1,168 @@
+"""
+narration_track.py
+==================
+
+Lossless Narration Track Builder
+
+In video-only mode the scene renderer writes clips without audio, and the
+scene WAVs are joined here into a single PCM track that is encoded to AAC
+exactly once, when `stitch_final_video.py` muxes it with the video. That
+skips one AAC encode per scene plus the decode/re-encode in the stitch, and
+avoids the encoder priming gaps that build up at every scene join.
+
+Each scene's audio is padded with silence or trimmed to the length of its
+video clip (a whole number of frames), using cumulative sample positions so
+rounding never drifts over hundreds of scenes. A scene's loudness gain
+(src/loudness.py) is applied to its samples while they are copied, and a
+scene with an ambience preset is mixed with its bed (src/ambience.py) at
+its position on the timeline, so beds run on across scenes with the same
+preset and crossfade where it changes.
+"""
+
+import os
+import wave
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.ambience import SAMPLE_TYPES, from_float, mix
+from src.loudness import to_float
+
+#: Frames copied per read, keeps memory flat for long scenes
+CHUNK_FRAMES = 1 << 16
+
+
+def clip_list_path(narration_path: str) -> str:
+    """
+    Where the clips a narration track was built for are listed, in
+    playback order: next to the track, as `<name>.json`.
+    """
+    return f"{os.path.splitext(narration_path)[0]}.json"
+
+
+def scene_frames(duration: float, fps: int) -> int:
+    """
+    Number of video frames a scene of `duration` seconds is rendered to.
+    """
+    return max(1, round(duration * fps))
+
+
+def apply_gain(data: bytes, sample_width: int, gain_db: float) -> bytes:
+    """
+    Scale PCM bytes by `gain_db`, clipping to the sample range.
+    """
+    sample_type = SAMPLE_TYPES.get(sample_width)
+    if sample_type is None:
+        raise ValueError(f"cannot apply gain to {8 * sample_width}-bit PCM")
+
+    samples = np.frombuffer(data, dtype=sample_type).astype(np.float64)
+    factor = 10 ** (gain_db / 20)
+    if sample_type is np.uint8:
+        # 8-bit PCM is unsigned around 128
+        scaled = (samples - 128.0) * factor + 128.0
+    else:
+        scaled = samples * factor
+    info = np.iinfo(sample_type)
+    return np.clip(np.rint(scaled), info.min, info.max).astype(sample_type).tobytes()
+
+
+def build_narration_track(
+    segments: Iterable[Tuple[str, int, Optional[float], Optional[str]]],
+    output_path: str,
+    fps: int
+) -> float:
+    """
+    Concatenate scene WAVs into one PCM WAV aligned to the video frames.
+
+    Parameters
+    ----------
+    segments : iterable of (wav_path, video_frames, gain_db, ambience)
+        Scene audio files in playback order with their clip lengths,
+        loudness gains (None for no change) and ambience presets (None for
+        no bed).
+    output_path : str
+        Path of the narration WAV to write.
+    fps : int
+        Frame rate the clips were rendered at.
+
+    Returns
+    -------
+    float
+        Length of the written track in seconds.
+
+    Raises
+    ------
+    ValueError
+        If the scene WAVs do not share channels, sample width and rate, or
+        a gain or ambience is given for 24-bit PCM.
+    """
+    segments = list(segments)
+    if not segments:
+        return 0.0
+
+    params = None
+    written = 0
+    total_video_frames = 0
+
+    presets = [segment[3] for segment in segments]
+
+    with wave.open(output_path, "wb") as out:
+        for index, (wav_path, frames, gain_db, ambience) in enumerate(segments):
+            with wave.open(wav_path, "rb") as src:
+                scene_params = (src.getnchannels(), src.getsampwidth(), src.getframerate())
+                if params is None:
+                    params = scene_params
+                    out.setnchannels(params[0])
+                    out.setsampwidth(params[1])
+                    out.setframerate(params[2])
+                elif scene_params != params:
+                    raise ValueError(
+                        f"{wav_path}: format {scene_params} does not match {params}"
+                    )
+
+                channels, sample_width, rate = params
+                frame_bytes = channels * sample_width
+
+                # Where this scene must end on the shared timeline
+                total_video_frames += frames
+                target = round(total_video_frames * rate / fps) - written
+
+                if ambience and target > 0:
+                    # Whole scene at once: ducking looks at the narration around
+                    # every sample, and the bed depends on its timeline position
+                    sample_type = SAMPLE_TYPES.get(sample_width)
+                    if sample_type is None:
+                        raise ValueError(f"cannot mix {8 * sample_width}-bit PCM")
+                    narration = np.zeros((target, channels))
+                    data = src.readframes(target)
+                    read = len(data) // frame_bytes
+                    narration[:read] = to_float(
+                        np.frombuffer(data, dtype=sample_type).reshape(-1, channels)
+                    )
+                    mixed = mix(
+                        narration, rate, ambience, gain_db, start=written,
+                        previous=presets[index - 1] if index > 0 else None,
+                        following=presets[index + 1] if index + 1 < len(presets) else None,
+                    )
+                    out.writeframes(from_float(mixed, sample_width).tobytes())
+                    written += target
+                    continue
+
+                remaining = target
+                while remaining > 0:
+                    data = src.readframes(min(CHUNK_FRAMES, remaining))
+                    if not data:
+                        break
+                    if gain_db:
+                        data = apply_gain(data, sample_width, gain_db)
+                    out.writeframes(data)
+                    remaining -= len(data) // frame_bytes
+
+                if remaining > 0:
+                    # 8-bit PCM is unsigned, silence is 0x80
+                    silence = b"\x80" if sample_width == 1 else b"\x00"
+                    out.writeframes(silence * (remaining * frame_bytes))
+
+                written += target
+
+    return written / params[2]
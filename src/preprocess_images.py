@@ -0,0 +1,225 @@
+"""
+preprocess_images.py
+====================
+
+Image Pre-Sizing Stage for the Scene Renderers
+
+The FFmpeg effects in `scene_video_ffmpeg_with_animation.py` upscale every
+1024x1024 scene image to their working resolution (2400x2400 or 2600x1460)
+inside each encode, and because of `-loop 1` that decode and scale is
+repeated for every output frame. This module does the work once per image
+with Pillow, in parallel across cores, and caches the result next to the
+source image:
+
+    all_images/scene_01.png
+    all_images/scene_01.2400x2400.bmp
+    all_images/scene_01.2600x1460.bmp
+
+A cached frame is reused as long as it is newer than its source image.
+A working size the source image already has (the "still" route) gets no
+copy: renderers read the PNG itself.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from src.Config import EFFECT_FRAME_SIZES, PREPARED_IMAGE_FORMAT
+from src.timing import file_size, record
+
+#: Source images produced by image_generation.py
+SOURCE_IMAGE_PATTERN = re.compile(r"^scene_\d+\.png$")
+
+#: Same kernel as FFmpeg's default `scale` filter
+RESAMPLE = Image.BICUBIC
+
+
+def prepared_image_path(image_path: str, size: Tuple[int, int]) -> str:
+    """
+    Return the cache path of `image_path` pre-sized to `size`.
+    """
+    root, _ = os.path.splitext(image_path)
+    width, height = size
+    return f"{root}.{width}x{height}.{PREPARED_IMAGE_FORMAT}"
+
+
+def is_prepared(image_path: str, size: Tuple[int, int]) -> bool:
+    """
+    True if a cached frame exists for `size` and is newer than the source.
+    """
+    cached = prepared_image_path(image_path, size)
+    if not os.path.exists(cached):
+        return False
+    return os.path.getmtime(cached) >= os.path.getmtime(image_path)
+
+
+def source_size(image_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Size of `image_path` from its header (nothing is decoded), or None if
+    it cannot be read.
+    """
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError:
+        return None
+
+
+def frame_source(image_path: str, effect: str) -> str:
+    """
+    Return the image a renderer should read for `effect`.
+
+    Falls back to the original image when no fresh cached frame exists,
+    so callers never depend on the preprocessing stage having run, and
+    when the original already has the working size.
+    """
+    size = EFFECT_FRAME_SIZES.get(effect)
+    if size and tuple(size) != source_size(image_path) and is_prepared(image_path, size):
+        return prepared_image_path(image_path, size)
+    return image_path
+
+
+def prepare_image(image_path: str, sizes: Iterable[Tuple[int, int]]) -> Dict:
+    """
+    Decode `image_path` once and write one cached frame per size.
+
+    Parameters
+    ----------
+    image_path : str
+        Source scene image.
+    sizes : iterable of (width, height)
+        Working resolutions to produce.
+
+    Returns
+    -------
+    dict
+        Per-image stats: decode and scale seconds spent here, plus the
+        cached paths that were written or reused.
+    """
+    stats = {
+        "image": image_path,
+        "pid": os.getpid(),
+        "started_at": time.time(),
+        "finished_at": None,
+        "decode_s": 0.0,
+        "scale_s": 0.0,
+        "written": [],
+        "cached": [],
+    }
+
+    original = source_size(image_path)
+    pending = []
+    for size in dict.fromkeys(tuple(s) for s in sizes):
+        if size == original:
+            # Read as is by frame_source()
+            continue
+        if is_prepared(image_path, size):
+            stats["cached"].append(prepared_image_path(image_path, size))
+        else:
+            pending.append(size)
+
+    if not pending:
+        stats["finished_at"] = time.time()
+        return stats
+
+    start = time.perf_counter()
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+    stats["decode_s"] = round(time.perf_counter() - start, 4)
+
+    for size in pending:
+        start = time.perf_counter()
+        frame = img if img.size == size else img.resize(size, RESAMPLE)
+        stats["scale_s"] += time.perf_counter() - start
+
+        output_path = prepared_image_path(image_path, size)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        frame.save(tmp_path, format=PREPARED_IMAGE_FORMAT)
+        os.replace(tmp_path, output_path)
+        stats["written"].append(output_path)
+
+    stats["scale_s"] = round(stats["scale_s"], 4)
+    stats["finished_at"] = time.time()
+    return stats
+
+
+def prepare_images(
+    jobs: Dict[str, Iterable[str]],
+    workers: Optional[int] = None
+) -> List[Dict]:
+    """
+    Pre-size many images in parallel.
+
+    Parameters
+    ----------
+    jobs : dict
+        Maps each source image path to the effect names it will be
+        rendered with (keys of `EFFECT_FRAME_SIZES`).
+    workers : int, optional
+        Process count, defaults to the number of CPU cores.
+
+    Returns
+    -------
+    list of dict
+        Stats from `prepare_image`, one entry per image.
+    """
+    tasks = []
+    for image_path, effects in jobs.items():
+        sizes = [EFFECT_FRAME_SIZES[e] for e in effects if e in EFFECT_FRAME_SIZES]
+        if sizes and os.path.exists(image_path):
+            tasks.append((image_path, sizes))
+
+    if not tasks:
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    queued_at = time.time()
+    if workers == 1 or len(tasks) == 1:
+        results = [prepare_image(path, sizes) for path, sizes in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(prepare_image, path, sizes) for path, sizes in tasks]
+            results = [future.result() for future in futures]
+
+    for stats in results:
+        s = record(
+            "prepare_image", stats["started_at"], stats["finished_at"],
+            stage="preprocess", queued_at=queued_at, image=stats["image"],
+            bytes_written=sum(file_size(path) for path in stats["written"]),
+        )
+        s.pid = stats["pid"]
+    return results
+
+
+def summarize(stats: List[Dict]) -> Dict:
+    """
+    Aggregate per-image stats into a single report.
+    """
+    return {
+        "images": len(stats),
+        "frames_written": sum(len(s["written"]) for s in stats),
+        "frames_cached": sum(len(s["cached"]) for s in stats),
+        "decode_s": round(sum(s["decode_s"] for s in stats), 4),
+        "scale_s": round(sum(s["scale_s"] for s in stats), 4),
+    }
+
+
+if __name__ == "__main__":
+    from src.Config import OUTPUT_DIR
+
+    images = sorted(
+        str(OUTPUT_DIR / name)
+        for name in os.listdir(OUTPUT_DIR)
+        if SOURCE_IMAGE_PATTERN.match(name)
+    )
+    report = summarize(prepare_images({path: list(EFFECT_FRAME_SIZES) for path in images}))
+
+    print(
+        f" Prepared {report['frames_written']} frames "
+        f"({report['frames_cached']} cached) for {report['images']} images "
+        f"in {report['decode_s'] + report['scale_s']:.2f}s"
+    )
@@ -0,0 +1,220 @@
+"""
+preview_render.py
+=================
+
+Fast Review Preview
+
+Renders the whole video at PREVIEW_SETTINGS (480p, 12 fps, x264 ultrafast)
+so reviewers can check scene order, timing and subtitles long before the
+full-quality render and stitch.
+
+- Every scene becomes a short video-only segment: the image scaled and
+  cropped to the preview frame with a fade in/out instead of the animated
+  effects. A scene with no image yet gets a grey placeholder of the right
+  length, so timing stays reviewable.
+- Segments are cached under a key of their inputs (image and audio file
+  state, duration, settings), so a refresh only re-renders scenes that
+  changed.
+- One final pass concatenates the segments, burns the subtitles and muxes
+  the narration track (loudness gains and ambience applied).
+
+Usage:
+    python -m src.preview_render            # → output/preview/preview.mp4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.Config import PREVIEW_SETTINGS, STILL_RENDER_JOBS
+from src.ambience import scene_ambience
+from src.ffmpeg_progress import run_ffmpeg
+from src.generate_subtitles import SubtitleWriter, iter_cues
+from src.loudness import scene_gain
+from src.narration_track import build_narration_track, scene_frames
+from src.timing import export_trace, span
+from src.utils import wav_duration
+
+SCENES_JSON = "output/scenes_with_audio.json"
+IMAGE_DIR = "all_images"
+PREVIEW_DIR = "output/preview"
+SEGMENT_DIR = os.path.join(PREVIEW_DIR, "segments")
+PREVIEW_VIDEO = os.path.join(PREVIEW_DIR, "preview.mp4")
+PREVIEW_SRT = os.path.join(PREVIEW_DIR, "preview.srt")
+PREVIEW_NARRATION = os.path.join(PREVIEW_DIR, "narration.wav")
+CONCAT_FILE = os.path.join(PREVIEW_DIR, "segments.txt")
+
+#: Fade length at scene boundaries, in seconds
+FADE_S = 0.4
+
+
+def _file_state(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def segment_key(image_path, audio_path, duration, settings=PREVIEW_SETTINGS):
+    """
+    Cache key of a scene segment: changes whenever anything it shows does.
+    """
+    raw = json.dumps([
+        image_path, _file_state(image_path),
+        audio_path, _file_state(audio_path),
+        round(duration, 3), settings, FADE_S,
+    ], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def segment_command(image_path, output_path, duration, settings=PREVIEW_SETTINGS):
+    """
+    Video-only preview segment of exactly scene_frames(duration, fps) frames.
+    """
+    width, height = settings["size"]
+    fps = settings["fps"]
+    fade_out = max(duration - FADE_S, 0)
+
+    if image_path and os.path.exists(image_path):
+        source = ["-loop", "1", "-framerate", str(fps), "-t", f"{duration:.3f}", "-i", image_path]
+        frame = (
+            f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},"
+        )
+    else:
+        # Placeholder for scenes whose image is not generated yet
+        source = ["-f", "lavfi", "-i", f"color=c=gray:s={width}x{height}:r={fps}:d={duration:.3f}"]
+        frame = ""
+
+    return [
+        "ffmpeg", "-y", *source,
+        "-vf", (
+            f"{frame}fade=t=in:st=0:d={FADE_S},"
+            f"fade=t=out:st={fade_out:.3f}:d={FADE_S},format=yuv420p"
+        ),
+        "-frames:v", str(scene_frames(duration, fps)),
+        "-c:v", "libx264", "-preset", settings["preset"], "-tune", "stillimage",
+        "-crf", str(settings["crf"]), "-r", str(fps),
+        "-an", "-f", "mp4", output_path,
+    ]
+
+
+def render_segment(scene_num, image_path, audio_path, duration, queued_at=None):
+    """
+    Render a scene's segment unless a current one is cached.
+
+    Returns (segment_path, rendered).
+    """
+    key = segment_key(image_path, audio_path, duration)
+    prefix = f"scene_{scene_num:02d}."
+    segment_path = os.path.join(SEGMENT_DIR, f"{prefix}{key}.mp4")
+    if os.path.exists(segment_path):
+        return segment_path, False
+
+    part_path = f"{segment_path}.part"
+    run_ffmpeg(
+        segment_command(image_path, part_path, duration),
+        "preview_segment", stage="preview", scene=scene_num,
+        duration=duration, queued_at=queued_at, live=False,
+    )
+    os.replace(part_path, segment_path)
+
+    # Drop this scene's superseded segments
+    for name in os.listdir(SEGMENT_DIR):
+        if name.startswith(prefix) and name.endswith(".mp4") and name != os.path.basename(segment_path):
+            os.remove(os.path.join(SEGMENT_DIR, name))
+    return segment_path, True
+
+
+def final_command(subtitle_path, settings=PREVIEW_SETTINGS):
+    """
+    The single pass over the whole preview: concat segments, burn
+    subtitles, encode the narration.
+    """
+    return [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0", "-i", CONCAT_FILE,
+        "-i", PREVIEW_NARRATION,
+        "-map", "0:v", "-map", "1:a",
+        "-vf", f"subtitles='{subtitle_path}'",
+        "-c:v", "libx264", "-preset", settings["preset"], "-crf", str(settings["crf"]),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "+faststart",
+        PREVIEW_VIDEO,
+    ]
+
+
+def render_preview(jobs=STILL_RENDER_JOBS):
+    os.makedirs(SEGMENT_DIR, exist_ok=True)
+
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        scenes = json.load(f)["Scenes"]
+
+    fps = PREVIEW_SETTINGS["fps"]
+    plan, planned_scenes = [], []
+    for scene in scenes:
+        scene_num = int(scene["scene_id"])
+        audio_path = scene["audio_file"].replace("\\", "/")
+        if not os.path.exists(audio_path):
+            print(f" Missing audio: {audio_path}")
+            continue
+        duration = wav_duration(audio_path) if audio_path.lower().endswith(".wav") \
+            else scene.get("audio_duration", 0)
+        if duration <= 0:
+            continue
+        image_path = os.path.join(IMAGE_DIR, f"scene_{scene_num:02d}.png")
+        plan.append((scene_num, image_path, audio_path, duration, scene_gain(scene),
+                     scene_ambience(scene)))
+        # Cues follow the segments: same scenes, same whole-frame lengths
+        planned_scenes.append({**scene, "audio_duration": scene_frames(duration, fps) / fps})
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+            lambda item: render_segment(item[0], item[1], item[2], item[3], queued_at=started),
+            plan,
+        ))
+    rendered = sum(1 for _, fresh in results if fresh)
+    print(f" Segments: {rendered} rendered, {len(results) - rendered} unchanged")
+
+    with open(CONCAT_FILE, "w", encoding="utf-8") as f:
+        for segment_path, _ in results:
+            f.write(f"file '{os.path.abspath(segment_path)}'\n".replace("\\", "/"))
+
+    with span("narration_track", stage="preview"):
+        seconds = build_narration_track(
+            [(audio, scene_frames(duration, fps), gain, ambience)
+             for _, _, audio, duration, gain, ambience in plan],
+            PREVIEW_NARRATION, fps,
+        )
+
+    with SubtitleWriter(PREVIEW_SRT) as writer:
+        for cue in iter_cues(planned_scenes):
+            writer.write(cue)
+    print(f" Subtitles: {writer.count} cues → {PREVIEW_SRT}")
+    run_ffmpeg(final_command(PREVIEW_SRT.replace("\\", "/")), "preview_final",
+               stage="preview", duration=seconds)
+
+    wall = time.time() - started
+    print(f" Preview ({seconds:.1f}s of video) in {wall:.1f}s, "
+          f"{seconds / wall:.1f}x real time → {PREVIEW_VIDEO}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a fast low-resolution review preview")
+    parser.add_argument("--jobs", type=int, default=STILL_RENDER_JOBS,
+                        help="concurrent segment encodes")
+    args = parser.parse_args()
+
+    try:
+        render_preview(args.jobs)
+    finally:
+        export_trace("preview")
+
+
+if __name__ == "__main__":
+    main()
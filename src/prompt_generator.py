@@ -1,26 +1,47 @@
 # src/prompt_generator.py
-from src.util_prompt import validate_scene
+from src.util_prompt import validate_scene, validate_scenes
+
+# global style for consistency (VERY IMPORTANT)
+GLOBAL_STYLE = (
+    "cinematic storytelling, ultra realistic, consistent characters, "
+    "natural proportions, no face distortion, sharp focus, film color grading"
+)
+LIGHTING = "Lighting is soft and cinematic, realistic shadows."
+QUALITY = "High detail, 4K quality."
+COMPOSITION_LABEL = "Visual composition:"
+
+# Wording shared by every prompt; src/prompt_similarity.py leaves it out
+# when comparing scenes
+TEMPLATE_PHRASES = (COMPOSITION_LABEL, LIGHTING, QUALITY, f"{GLOBAL_STYLE}.")
+
 
 class PromptGenerator:
     def __init__(self):
-        # global style for consistency (VERY IMPORTANT)
-        self.global_style = (
-            "cinematic storytelling, ultra realistic, consistent characters, "
-            "natural proportions, no face distortion, sharp focus, film color grading"
-        )
+        self.global_style = GLOBAL_STYLE
 
     def generate(self, scene):
         validate_scene(scene)
+        return self._build(scene)
+
+    def generate_all(self, scenes):
+        # Lazy: takes any iterable of scenes (e.g. src.scene_stream readers)
+        # and yields one prompt record per scene as it is consumed
+        for scene in validate_scenes(scenes):
+            yield {
+                "scene_id": scene["scene_id"],
+                "image_prompt": self._build(scene)
+            }
 
+    def _build(self, scene):
         scene_id = scene["scene_id"]
         description = scene["description"]
         visual_focus = scene["visual_focus"]
 
         prompt = (
             f"Scene {scene_id}: {description} "
-            f"Visual composition: {visual_focus}. "
-            f"Lighting is soft and cinematic, realistic shadows. "
-            f"High detail, 4K quality. "
+            f"{COMPOSITION_LABEL} {visual_focus}. "
+            f"{LIGHTING} "
+            f"{QUALITY} "
             f"{self.global_style}."
         )
 
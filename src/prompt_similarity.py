@@ -0,0 +1,351 @@
+"""
+prompt_similarity.py
+====================
+
+Near-Duplicate Prompt Index
+
+LLM scene breakdowns often describe the same shot more than once ("the
+village at dawn" three times). Every image request costs quota and
+SLEEP_BETWEEN_REQUESTS seconds, so image_generation.py asks this index
+first. A scene reuses the image of an earlier prompt when the two are at
+least PROMPT_DEDUP_THRESHOLD similar. The earlier prompt can be from the
+same job or from any image generated before (PROMPT_INDEX).
+
+Prompts are compared on their content words. The "Scene N:" prefix, the
+wording every PromptGenerator prompt shares (TEMPLATE_PHRASES) and
+stopwords are dropped. What remains is turned into word and word-pair
+shingles. Similarity is the Jaccard index of two shingle sets, estimated
+from 128-value MinHash signatures. Candidates come from locality-sensitive
+hashing over bands of the signature, so a lookup touches only the few
+indexed prompts that share a band rather than the whole cache.
+
+The index is a JSON Lines file with one generated image per line: its
+path, file state, scene and signature. Entries whose image has since been
+deleted or replaced are ignored.
+
+Usage (dry run over image_prompts.json: which scenes would be reused):
+    python -m src.prompt_similarity [--threshold 0.6]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.Config import (
+    OUTPUT_DIR,
+    PROMPT_DEDUP_THRESHOLD,
+    PROMPT_DEDUP_VARY,
+    PROMPT_FILE,
+    PROMPT_INDEX,
+)
+from src.prompt_generator import TEMPLATE_PHRASES
+from src.scene_stream import iter_records
+
+NUM_PERM = 128
+BANDS = 32            # 4 rows per band: pairs above ~0.45 share a band almost surely
+
+#: Fraction of each side kept by the "crop" variant
+CROP_KEEP = 0.92
+
+_PRIME = (1 << 31) - 1
+_EMPTY = np.iinfo(np.uint64).max
+_SCENE_PREFIX = re.compile(r"^\s*scene\s+\d+\s*:\s*", re.IGNORECASE)
+_WORD = re.compile(r"[a-z0-9]+")
+_TEMPLATE = re.compile("|".join(re.escape(phrase) for phrase in TEMPLATE_PHRASES), re.IGNORECASE)
+
+_STOPWORDS = frozenset("""
+    a an the and or but of in on at to for from by with without into onto over under
+    above below across through is are was were be been being his her hers its their
+    them they he she it this that these those as while up down out off than then
+    there here very
+""".split())
+
+
+def content_words(prompt: str) -> List[str]:
+    """
+    Lowercase content words of a prompt, with plurals folded.
+    """
+    text = _TEMPLATE.sub(" ", _SCENE_PREFIX.sub("", prompt))
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def shingles(prompt: str) -> Set[str]:
+    """
+    Words and adjacent word pairs of the prompt's content.
+    """
+    words = content_words(prompt)
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class MinHasher:
+    """
+    MinHash signatures of shingle sets: the minimum of `num_perm` universal
+    hashes (a*x + b mod 2^31-1) over the shingles.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.num_perm = num_perm
+
+    def signature(self, items: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=4).digest(), "little")
+             for item in items),
+            dtype=np.uint64,
+        )
+        if not hashes.size:
+            return np.full(self.num_perm, _EMPTY, dtype=np.uint64)
+        # a, b < 2^31 and x < 2^32: a*x + b fits in 64 bits
+        return ((self.a * (hashes % _PRIME) + self.b) % _PRIME).min(axis=1)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard index of the shingle sets behind two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+def _file_state(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class PromptIndex:
+    """
+    Images by the MinHash signature of their prompt, with LSH buckets for
+    lookup.
+
+    Parameters
+    ----------
+    path : path or None
+        JSONL file of indexed images, loaded now and appended to by add();
+        None keeps the index in memory only.
+    threshold : float
+        Minimum similarity for match().
+    """
+
+    def __init__(self, path=PROMPT_INDEX, threshold: float = PROMPT_DEDUP_THRESHOLD,
+                 num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError(f"{num_perm} permutations do not split into {bands} bands")
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.entries: List[Dict] = []
+        self.images: Set[str] = set()
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        #: Entries loaded from the file, as opposed to added by this run
+        self.cached = 0
+        if self.path and self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        latest: Dict[str, Dict] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                latest[entry["image"]] = entry
+        for entry in latest.values():
+            # Deleted, or overwritten by an image for another prompt
+            if _file_state(entry["image"]) != entry["state"]:
+                continue
+            self._insert(entry["image"], np.array(entry["signature"], dtype=np.uint64),
+                         entry.get("scene_id"), cached=True)
+        self.cached = len(self.entries)
+
+    def signature(self, prompt: str) -> Optional[np.ndarray]:
+        """
+        Signature of `prompt`, None if it has no content words to compare.
+        """
+        items = shingles(prompt)
+        return self.hasher.signature(items) if items else None
+
+    def _bands(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _insert(self, image: str, signature: np.ndarray, scene_id, cached: bool) -> None:
+        index = len(self.entries)
+        self.entries.append({"image": image, "signature": signature, "scene_id": scene_id,
+                             "cached": cached})
+        self.images.add(image)
+        for key in self._bands(signature):
+            self.buckets.setdefault(key, []).append(index)
+
+    def match(self, signature: Optional[np.ndarray],
+              require_image: bool = True) -> Optional[Tuple[Dict, float]]:
+        """
+        Most similar indexed image at or above the threshold whose file is
+        still there (unless `require_image` is False), as (entry,
+        similarity); None if there is none.
+        """
+        if signature is None:
+            return None
+        candidates = {i for key in self._bands(signature) for i in self.buckets.get(key, ())}
+        best = None
+        for i in candidates:
+            score = similarity(signature, self.entries[i]["signature"])
+            if score >= self.threshold and (best is None or score > best[1]):
+                if not require_image or os.path.exists(self.entries[i]["image"]):
+                    best = (self.entries[i], score)
+        return best
+
+    def add(self, image, signature: Optional[np.ndarray], scene_id=None) -> None:
+        """
+        Index the generated `image` under its prompt's signature.
+        """
+        if signature is None:
+            return
+        image = str(Path(image).resolve())
+        self._insert(image, signature, scene_id, cached=False)
+        if self.path:
+            record = {
+                "image": image,
+                "state": _file_state(image),
+                "scene_id": scene_id,
+                "signature": signature.tolist(),
+                "time": round(time.time(), 3),
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def indexed(self, image) -> bool:
+        return str(Path(image).resolve()) in self.images
+
+
+def reuse_image(source, destination, vary: str = PROMPT_DEDUP_VARY) -> None:
+    """
+    Write the image for a near-duplicate scene from `source`: a copy, or
+    with vary="crop" a centre crop of CROP_KEEP scaled back to full size, so
+    consecutive scenes do not show the exact same frame.
+    """
+    if vary == "copy":
+        shutil.copyfile(source, destination)
+        return
+    if vary != "crop":
+        raise ValueError(f"Unknown image variation {vary!r}")
+
+    from PIL import Image
+
+    with Image.open(source) as image:
+        width, height = image.size
+        crop_w, crop_h = round(width * CROP_KEEP), round(height * CROP_KEEP)
+        left, top = (width - crop_w) // 2, (height - crop_h) // 2
+        image.crop((left, top, left + crop_w, top + crop_h)) \
+            .resize((width, height), Image.LANCZOS) \
+            .save(destination)
+
+
+class DedupReport:
+    """
+    Tally of generated and reused images, written as JSON at the end of a run.
+    """
+
+    def __init__(self):
+        self.generated = 0
+        self.reused: List[Dict] = []
+
+    def add_reuse(self, scene_id, image, match: Dict, score: float) -> None:
+        self.reused.append({
+            "scene_id": scene_id,
+            "image": str(image),
+            "source": match["image"],
+            "source_scene_id": match["scene_id"],
+            "from_cache": match["cached"],
+            "similarity": round(score, 3),
+        })
+
+    def summary(self, seconds_per_call: float) -> Dict:
+        from_cache = sum(1 for reuse in self.reused if reuse["from_cache"])
+        return {
+            "generated": self.generated,
+            "reused": len(self.reused),
+            "reused_within_job": len(self.reused) - from_cache,
+            "reused_from_cache": from_cache,
+            "calls_saved": len(self.reused),
+            "seconds_saved": round(len(self.reused) * seconds_per_call, 1),
+        }
+
+    def write(self, path, seconds_per_call: float) -> Dict:
+        summary = self.summary(seconds_per_call)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**summary, "reuses": self.reused}, f, indent=2)
+        return summary
+
+
+def find_duplicates(prompts: Iterable[Dict], threshold: float = PROMPT_DEDUP_THRESHOLD,
+                    index_path=PROMPT_INDEX, image_dir=OUTPUT_DIR) -> List[Dict]:
+    """
+    Dry run of image_generation.py's reuse: for each prompt record, in
+    order, the earlier scene or cached image it would reuse. Scenes that
+    already have an image in `image_dir` are skipped, as they would be by
+    image_generation.py. Nothing is written.
+    """
+    index = PromptIndex(index_path, threshold)
+    index.path = None
+    duplicates = []
+    for record in prompts:
+        scene_id = record["scene_id"]
+        image = Path(image_dir) / f"scene_{scene_id:02d}.png"
+        signature = index.signature(record["image_prompt"])
+        if image.exists():
+            if not index.indexed(image):
+                index.add(image, signature, scene_id)
+            continue
+        found = index.match(signature, require_image=False)
+        if found:
+            entry, score = found
+            duplicates.append({"scene_id": scene_id, "source": entry["image"],
+                               "source_scene_id": entry["scene_id"],
+                               "from_cache": entry["cached"], "similarity": round(score, 3)})
+        else:
+            index.add(image, signature, scene_id)
+    return duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate image prompts")
+    parser.add_argument("--prompts", default=str(PROMPT_FILE))
+    parser.add_argument("--threshold", type=float, default=PROMPT_DEDUP_THRESHOLD)
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"compare within the prompt file only, not with {PROMPT_INDEX}")
+    args = parser.parse_args()
+
+    duplicates = find_duplicates(iter_records(args.prompts), args.threshold,
+                                 None if args.no_cache else PROMPT_INDEX)
+    for dup in duplicates:
+        source = f"cached {dup['source']}" if dup["from_cache"] else f"scene {dup['source_scene_id']}"
+        print(f" scene {dup['scene_id']:>4} ← {source} (similarity {dup['similarity']:.2f})")
+    print(f" {len(duplicates)} image requests would be saved at threshold {args.threshold}")
+
+
+if __name__ == "__main__":
+    main()
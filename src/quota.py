@@ -0,0 +1,295 @@
+"""
+quota.py
+========
+
+Host-Wide Provider Quotas
+
+One token bucket per provider (Hugging Face, Google TTS, OpenRouter) kept in
+a SQLite database that every pipeline process on the host shares, so
+concurrent runs draw from the same budget instead of each sleeping on its
+own. Budgets are `PROVIDER_QUOTAS` in Config.py.
+
+A 429 seen by any process pauses that provider for every process
+(`backoff`), using the server's Retry-After when it sends one.
+
+Usage:
+    from src.quota import acquire, backoff, is_rate_limited
+
+    acquire("hf")
+    try:
+        ...
+    except Exception as e:
+        if is_rate_limited(e):
+            backoff("hf", retry_after(e))
+
+`python -m src.quota` prints the current utilization of every provider.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from src.Config import PROVIDER_QUOTAS, QUOTA_BACKOFF_SECONDS, QUOTA_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    provider      TEXT PRIMARY KEY,
+    tokens        REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS grants (
+    provider TEXT NOT NULL,
+    at       REAL NOT NULL,
+    pid      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grants_at ON grants (provider, at);
+CREATE TABLE IF NOT EXISTS throttles (
+    provider TEXT NOT NULL,
+    at       REAL NOT NULL
+);
+"""
+
+#: Seconds of grant history kept for utilization
+WINDOW = 60.0
+
+#: Longest single sleep while waiting, so budget changes are picked up
+MAX_SLEEP = 5.0
+
+
+class QuotaCoordinator:
+    """
+    Token buckets in a shared SQLite file. Every method runs in its own
+    short transaction, so instances in different processes (or threads)
+    coordinate through the database alone.
+    """
+
+    def __init__(self, path=QUOTA_DB, quotas: Dict[str, Dict] = PROVIDER_QUOTAS):
+        self.path = str(path)
+        self.quotas = quotas
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        # Local, host-only database: WAL keeps readers from blocking and a
+        # lost grant on power failure does not matter
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _quota(self, provider: str) -> Dict:
+        try:
+            return self.quotas[provider]
+        except KeyError:
+            raise ValueError(f"No quota configured for provider '{provider}'") from None
+
+    def _refill(self, conn, provider: str, now: float):
+        """
+        Current (tokens, blocked_until) of a bucket, refilled up to `now`.
+        """
+        quota = self._quota(provider)
+        row = conn.execute(
+            "SELECT tokens, updated_at, blocked_until FROM buckets WHERE provider = ?",
+            (provider,),
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO buckets (provider, tokens, updated_at) VALUES (?, ?, ?)",
+                (provider, quota["burst"], now),
+            )
+            return float(quota["burst"]), 0.0
+
+        tokens, updated_at, blocked_until = row
+        # Tokens do not accrue while the provider is paused after a 429
+        accrue_from = max(updated_at, min(blocked_until, now))
+        tokens = min(quota["burst"], tokens + max(now - accrue_from, 0.0) * quota["per_minute"] / 60)
+        return tokens, blocked_until
+
+    def try_acquire(self, provider: str, tokens: float = 1.0) -> float:
+        """
+        Take `tokens` if available. Returns 0 on success, otherwise the
+        seconds until they could be.
+        """
+        quota = self._quota(provider)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            available, blocked_until = self._refill(conn, provider, now)
+
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif available >= tokens:
+                available -= tokens
+                wait = 0.0
+                conn.execute("INSERT INTO grants (provider, at, pid) VALUES (?, ?, ?)",
+                             (provider, now, os.getpid()))
+                conn.execute("DELETE FROM grants WHERE provider = ? AND at < ?",
+                             (provider, now - WINDOW))
+            else:
+                wait = (tokens - available) * 60 / quota["per_minute"]
+
+            conn.execute("UPDATE buckets SET tokens = ?, updated_at = ? WHERE provider = ?",
+                         (available, now, provider))
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, provider: str, tokens: float = 1.0,
+                timeout: Optional[float] = None) -> float:
+        """
+        Block until `tokens` are granted. Returns the seconds waited.
+
+        Raises
+        ------
+        ValueError
+            If `tokens` exceeds the provider's burst: the bucket never
+            holds that many.
+        TimeoutError
+            If `timeout` seconds pass first.
+        """
+        burst = self._quota(provider)["burst"]
+        if tokens > burst:
+            raise ValueError(f"{provider}: {tokens} tokens requested, the burst is {burst}")
+        started = time.time()
+        while True:
+            wait = self.try_acquire(provider, tokens)
+            if wait <= 0:
+                return time.time() - started
+            if timeout is not None and time.time() - started + wait > timeout:
+                raise TimeoutError(f"{provider} quota not available within {timeout}s")
+            time.sleep(min(wait, MAX_SLEEP))
+
+    def backoff(self, provider: str, seconds: Optional[float] = None) -> None:
+        """
+        Pause `provider` for every process, after a 429 response.
+        """
+        seconds = QUOTA_BACKOFF_SECONDS if seconds is None else seconds
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._refill(conn, provider, now)
+            conn.execute(
+                "UPDATE buckets SET tokens = 0, updated_at = ?, "
+                "blocked_until = MAX(blocked_until, ?) WHERE provider = ?",
+                (now, now + seconds, provider),
+            )
+            conn.execute("INSERT INTO throttles (provider, at) VALUES (?, ?)", (provider, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def utilization(self) -> Dict[str, Dict]:
+        """
+        Per provider: requests granted in the last minute against the
+        budget, tokens available now, pause remaining and recent 429s.
+        """
+        now = time.time()
+        report = {}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for provider, quota in self.quotas.items():
+                tokens, blocked_until = self._refill(conn, provider, now)
+                granted = conn.execute(
+                    "SELECT COUNT(*), COUNT(DISTINCT pid) FROM grants WHERE provider = ? AND at >= ?",
+                    (provider, now - WINDOW),
+                ).fetchone()
+                throttled = conn.execute(
+                    "SELECT COUNT(*) FROM throttles WHERE provider = ? AND at >= ?",
+                    (provider, now - WINDOW),
+                ).fetchone()[0]
+                report[provider] = {
+                    "per_minute": quota["per_minute"],
+                    "granted_last_minute": granted[0],
+                    "processes": granted[1],
+                    "utilization": round(granted[0] / quota["per_minute"], 3),
+                    "tokens_available": round(tokens, 3),
+                    "blocked_for_s": round(max(blocked_until - now, 0.0), 1),
+                    "throttled_last_minute": throttled,
+                }
+            conn.execute("DELETE FROM throttles WHERE at < ?", (now - WINDOW,))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return report
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        response = getattr(exc, "response", None)
+        code = getattr(response, "status_code", None)
+    return code
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """
+    True for a 429 from requests, huggingface_hub or the OpenAI client.
+    """
+    return _status_code(exc) == 429
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    The Retry-After header (seconds) of a rate-limit error, if present.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+_COORDINATOR: Optional[QuotaCoordinator] = None
+
+
+def coordinator() -> QuotaCoordinator:
+    global _COORDINATOR
+    if _COORDINATOR is None:
+        _COORDINATOR = QuotaCoordinator()
+    return _COORDINATOR
+
+
+def acquire(provider: str, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+    return coordinator().acquire(provider, tokens, timeout)
+
+
+def backoff(provider: str, seconds: Optional[float] = None) -> None:
+    coordinator().backoff(provider, seconds)
+
+
+def utilization() -> Dict[str, Dict]:
+    return coordinator().utilization()
+
+
+if __name__ == "__main__":
+    for name, usage in utilization().items():
+        print(
+            f" {name:<11} {usage['granted_last_minute']:>4}/{usage['per_minute']:g} per min "
+            f"({usage['utilization']:.0%}) from {usage['processes']} processes, "
+            f"{usage['tokens_available']:g} tokens ready"
+            + (f", paused {usage['blocked_for_s']}s" if usage["blocked_for_s"] else "")
+            + (f", {usage['throttled_last_minute']} x 429" if usage["throttled_last_minute"] else "")
+        )
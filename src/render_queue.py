@@ -0,0 +1,588 @@
+"""
+render_queue.py
+===============
+
+Distributed Scene Rendering
+
+A SQLite-backed work queue that lets any number of worker processes, on
+this machine or on other machines that share the project directory, render
+the scenes of one job. The coordinator enqueues one job per scene; workers
+lease jobs, keep the lease alive with heartbeats while rendering, and move
+the clip into the shared output directory once the queue confirms they
+still hold the job. A lease that is not renewed (a worker crashed or lost
+its node) expires and the job is handed to another worker, up to
+`RENDER_MAX_ATTEMPTS` attempts; the worker that lost it kills its encode.
+Jobs are claimed longest predicted render first (src/scheduler.py), and
+the coordinator refits the cost model from the measured job times when
+the run ends.
+
+Both renderers are supported:
+- effect   scene_video_ffmpeg_with_animation.py (optionally --video-only)
+- still    create_scene_videos.py direct FFmpeg path
+
+Usage:
+    python -m src.render_queue coordinate --renderer effect   # enqueue + wait
+    python -m src.render_queue worker                         # on every node
+    python -m src.render_queue local --workers 4              # both, one host
+    python -m src.render_queue status
+
+The database path is `RENDER_QUEUE_DB`. SQLite relies on file locks, so
+the shared filesystem must support them (NFSv4, SMB); every write is a
+short `BEGIN IMMEDIATE` transaction to keep lock hold times small.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.Config import RENDER_LEASE_SECONDS, RENDER_MAX_ATTEMPTS, RENDER_QUEUE_DB
+from src.ambience import scene_ambience
+from src.encoder_tuning import encoder_settings
+from src.ffmpeg_progress import allow_encodes, cancel_encodes
+from src.loudness import scene_gain
+from src.preprocess_images import frame_source, prepare_images
+from src.scene_video_ffmpeg_with_animation import (
+    EFFECTS,
+    OUTPUT_DIR,
+    SCENES_JSON,
+    keep_clip,
+    plan_scenes,
+    render_animated_scene,
+    write_narration_track,
+)
+from src.scheduler import CostModel, audio_seconds, schedule
+from src.timing import export_trace
+from src.utils import read_stamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY,
+    job_key       TEXT UNIQUE NOT NULL,
+    scene         INTEGER NOT NULL,
+    priority      REAL NOT NULL DEFAULT 0,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    worker        TEXT,
+    lease_expires REAL,
+    enqueued_at   REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    result        TEXT,
+    error         TEXT
+)
+"""
+
+#: Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL = 2.0
+
+#: Subdirectory of the clip directory that workers render into
+PART_DIR = ".parts"
+
+
+class RenderQueue:
+    """
+    Job table with leases. Every method opens its own short-lived
+    connection, so one instance can be shared by a worker and its
+    heartbeat thread.
+    """
+
+    def __init__(self, path=RENDER_QUEUE_DB,
+                 lease_seconds: float = RENDER_LEASE_SECONDS,
+                 max_attempts: int = RENDER_MAX_ATTEMPTS):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "priority" not in columns:
+                # Queue databases created before cost-aware scheduling
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            # Nothing to roll back if BEGIN itself failed (database locked)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def enqueue(self, jobs: List[Dict]) -> int:
+        """
+        Add jobs ({"key", "scene", "payload", optional "priority"}). Workers
+        claim the highest priority first. A job with an existing key is
+        reset to pending unless a worker currently holds it.
+        """
+        now = time.time()
+
+        def insert(conn):
+            for job in jobs:
+                conn.execute(
+                    """
+                    INSERT INTO jobs (job_key, scene, priority, payload, max_attempts, enqueued_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(job_key) DO UPDATE SET
+                        priority = excluded.priority,
+                        payload = excluded.payload,
+                        status = 'pending',
+                        attempts = 0,
+                        max_attempts = excluded.max_attempts,
+                        worker = NULL,
+                        lease_expires = NULL,
+                        enqueued_at = excluded.enqueued_at,
+                        started_at = NULL,
+                        finished_at = NULL,
+                        result = NULL,
+                        error = NULL
+                    WHERE jobs.status != 'leased'
+                    """,
+                    (job["key"], job["scene"], job.get("priority", 0), json.dumps(job["payload"]),
+                     self.max_attempts, now),
+                )
+            return len(jobs)
+
+        return self._transaction(insert)
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """
+        Lease the next pending job, or a job whose lease has expired.
+        """
+        def lease(conn):
+            now = time.time()
+            # Expired leases with no attempts left are given up for good
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = 'lease expired, no attempts left'
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts
+                """,
+                (now,),
+            )
+            row = conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY priority DESC, id LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'leased', worker = ?, attempts = attempts + 1,
+                                lease_expires = ?, started_at = ?
+                WHERE id = ?
+                """,
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"])
+            job["attempts"] += 1
+            return job
+
+        return self._transaction(lease)
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Extend a lease. False means the lease was lost to another worker.
+        """
+        def extend(conn):
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(extend)
+
+    def complete(self, job_id: int, worker: str, result: Dict) -> bool:
+        def finish(conn):
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, error = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result), time.time(), job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(finish)
+
+    def fail(self, job_id: int, worker: str, error: str) -> None:
+        """
+        Release a failed job: back to pending while attempts remain.
+        """
+        def release(conn):
+            conn.execute(
+                """
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                    worker = NULL, lease_expires = NULL, error = ?, finished_at = ?
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                """,
+                (error, time.time(), job_id, worker),
+            )
+
+        self._transaction(release)
+
+    def counts(self, keys=None) -> Dict[str, int]:
+        """
+        Jobs per status, over the whole queue or only the jobs in `keys`.
+        """
+        with self._connect() as conn:
+            if keys is None:
+                rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+                return {status: count for status, count in rows}
+            rows = conn.execute("SELECT job_key, status FROM jobs").fetchall()
+        counts: Dict[str, int] = {}
+        for key, status in rows:
+            if key in keys:
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def jobs(self, status: Optional[str] = None) -> List[Dict]:
+        query = "SELECT * FROM jobs"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY scene", params).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"])
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            jobs.append(job)
+        return jobs
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renews a job's lease every third of the lease period while it renders,
+    and kills the job's encodes once the lease is lost.
+    """
+
+    def __init__(self, queue: RenderQueue, job_id: int, worker: str):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.queue.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker):
+                    self.lost = True
+                    cancel_encodes()
+                    return
+            except sqlite3.OperationalError as e:
+                # Busy shared storage: try again on the next beat
+                print(f" Heartbeat for job {self.job_id} failed: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def scene_jobs(renderer: str, model: CostModel, video_only: bool = False) -> List[Dict]:
+    """
+    One queue job per scene of SCENES_JSON for the given renderer, with the
+    predicted render time as its priority (longest first).
+    """
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        scenes = json.load(f)["Scenes"]
+
+    jobs = []
+    gains = {int(scene["scene_id"]): scene_gain(scene) for scene in scenes}
+    ambiences = {int(scene["scene_id"]): scene_ambience(scene) for scene in scenes}
+    for scene_num, image_path, audio_path, effect in plan_scenes(scenes):
+        kind = effect.__name__ if renderer == "effect" else "still"
+        payload = {
+            "renderer": renderer,
+            "image": image_path,
+            "audio": audio_path,
+            "kind": kind,
+            "audio_s": audio_seconds(audio_path),
+            "gain_db": gains[scene_num],
+            "ambience": ambiences[scene_num],
+        }
+        if renderer == "effect":
+            payload.update(effect=effect.__name__, video_only=video_only)
+        jobs.append({
+            "key": f"{renderer}:{scene_num}",
+            "scene": scene_num,
+            "priority": model.predict(kind, payload["audio_s"]),
+            "payload": payload,
+        })
+    return jobs
+
+
+def part_path(output_path: str, worker: str) -> str:
+    """
+    Where `worker` renders `output_path`. The clip is moved into place only
+    once the queue confirms the worker still holds the job, so a worker
+    whose lease expired never overwrites the clip of the one that took over.
+    """
+    directory, name = os.path.split(output_path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, PART_DIR, f"{stem}.{worker}{ext}")
+
+
+def execute(job: Dict, worker: str) -> Optional[Dict]:
+    """
+    Render one leased job to the worker's part_path(). Returns the result
+    stored on the job, with the clip path to publish it to, or None if the
+    scene could not be rendered.
+    """
+    payload = job["payload"]
+    scene_num = job["scene"]
+    queued_at = job["enqueued_at"]
+
+    if payload["renderer"] == "effect":
+        output_path = os.path.join(OUTPUT_DIR, f"scene_{scene_num:02d}.mp4")
+
+        def render(path):
+            prepare_images({payload["image"]: [payload["effect"]]}, workers=1)
+            frames = render_animated_scene(
+                scene_num, payload["image"], payload["audio"], EFFECTS[payload["effect"]],
+                video_only=payload["video_only"], queued_at=queued_at,
+                gain_db=payload.get("gain_db"), ambience=payload.get("ambience"), output_path=path,
+            )
+            return {"frames": frames, "audio": payload["audio"]} if frames else None
+    else:
+        # Imported here: only still-path workers need MoviePy for the fallback
+        from src import create_scene_videos as still
+
+        output_path = os.path.join(still.OUTPUT_DIR, f"scene_{scene_num:02d}.mp4")
+        if not (os.path.exists(payload["image"]) and os.path.exists(payload["audio"])):
+            print(f" Missing inputs for scene_{scene_num:02d}")
+            return None
+
+        def render(path):
+            prepare_images({payload["image"]: ["still"]}, workers=1)
+            route = still.render_scene_fast(
+                scene_num, frame_source(payload["image"], "still"), payload["audio"],
+                path, queued_at=queued_at, live=False, gain_db=payload.get("gain_db"),
+                ambience=payload.get("ambience"),
+            )
+            return {"route": route}
+
+    part = part_path(output_path, worker)
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    result = None
+    try:
+        result = render(part)
+    finally:
+        if result is None:
+            discard(part)
+    return dict(result, clip=output_path) if result else None
+
+
+def discard(part: str) -> None:
+    """
+    Delete a part file that will not be published, and its stamp.
+    """
+    for path in (part, f"{part}.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def publish(job: Dict, part: str, output_path: str) -> None:
+    """
+    Move a confirmed job's clip into place and record it in the workspace.
+    """
+    os.replace(part, output_path)
+    if job["payload"]["renderer"] == "effect":
+        keep_clip(output_path, job["payload"]["video_only"])
+    else:
+        from src.create_scene_videos import keep_clip as keep_still_clip
+
+        # render_scene_fast stamped the part; the stamp moves with the clip
+        keep_still_clip(output_path, **read_stamp(part))
+        os.remove(f"{part}.json")
+
+
+def run_worker(queue: RenderQueue, worker: str, exit_when_idle: bool = True) -> int:
+    """
+    Lease and render jobs until the queue has nothing pending or leased.
+    Returns the number of jobs this worker completed.
+    """
+    completed = 0
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            counts = queue.counts()
+            if exit_when_idle and not counts.get("pending") and not counts.get("leased"):
+                break
+            # Others may still hold leases that could expire: keep polling
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        print(f" [{worker}] scene_{job['scene']:02d} (attempt {job['attempts']})")
+        allow_encodes()
+        heartbeat = Heartbeat(queue, job["id"], worker)
+        heartbeat.start()
+        try:
+            result = execute(job, worker)
+            error = None if result else "render failed"
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        finally:
+            heartbeat.stop()
+
+        part = part_path(result["clip"], worker) if result else None
+        if heartbeat.lost:
+            print(f" [{worker}] lost lease on scene_{job['scene']:02d}, result discarded")
+        elif result:
+            if queue.complete(job["id"], worker, result):
+                publish(job, part, result["clip"])
+                part = None
+                completed += 1
+            else:
+                print(f" [{worker}] scene_{job['scene']:02d} was reassigned, result discarded")
+        else:
+            queue.fail(job["id"], worker, error)
+        if part:
+            discard(part)
+
+    export_trace(f"render_worker_{worker}")
+    return completed
+
+
+def wait_for_queue(queue: RenderQueue, keys, poll: float = POLL_INTERVAL) -> Dict[str, int]:
+    """
+    Block until none of this run's jobs (`keys`) is pending or leased,
+    printing progress.
+    """
+    while True:
+        counts = queue.counts(keys)
+        active = counts.get("pending", 0) + counts.get("leased", 0)
+        print(
+            f" queue: {counts.get('done', 0)} done, {counts.get('leased', 0)} rendering, "
+            f"{counts.get('pending', 0)} pending, {counts.get('failed', 0)} failed"
+        )
+        if not active:
+            return counts
+        time.sleep(poll)
+
+
+def finish_job(queue: RenderQueue, keys, model: CostModel, video_only: bool) -> None:
+    """
+    Coordinator epilogue: refine the cost model from the measured job times
+    and build the narration track for video-only runs.
+    """
+    done = [job for job in queue.jobs("done") if job["job_key"] in keys]
+    for job in done:
+        payload = job["payload"]
+        model.observe(payload.get("kind"), payload.get("audio_s"),
+                      job["finished_at"] - job["started_at"])
+    model.save()
+
+    if video_only:
+        write_narration_track([
+            (job["scene"], job["result"]["audio"], job["result"]["frames"],
+             job["payload"].get("gain_db"), job["payload"].get("ambience"))
+            for job in done
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed scene rendering")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("coordinate", "local"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--renderer", choices=["effect", "still"], default="effect")
+        cmd.add_argument("--video-only", action="store_true",
+                         help="effect renderer only: render without audio, "
+                              "then build the narration track")
+        if name == "local":
+            cmd.add_argument("--workers", type=int,
+                             help="worker processes (default: this host's encoder profile)")
+        else:
+            cmd.add_argument("--workers", type=int, default=1,
+                             help="number of worker processes expected, for the ETA")
+
+    worker_cmd = sub.add_parser("worker")
+    worker_cmd.add_argument("--worker-id",
+                            default=f"{socket.gethostname()}-{os.getpid()}")
+    worker_cmd.add_argument("--forever", action="store_true",
+                            help="keep polling when the queue is empty")
+
+    sub.add_parser("status")
+    args = parser.parse_args()
+
+    queue = RenderQueue()
+
+    if args.command == "worker":
+        done = run_worker(queue, args.worker_id, exit_when_idle=not args.forever)
+        print(f" [{args.worker_id}] completed {done} jobs")
+        return
+
+    if args.command == "status":
+        for job in queue.jobs():
+            print(
+                f" {job['job_key']:<12} {job['status']:<8} attempts={job['attempts']} "
+                f"worker={job['worker'] or '-'} {job['error'] or ''}"
+            )
+        print(f" {queue.counts()}")
+        return
+
+    if args.workers is None:
+        args.workers = encoder_settings(args.renderer)["jobs"]
+    video_only = args.video_only and args.renderer == "effect"
+    model = CostModel()
+    jobs = scene_jobs(args.renderer, model, video_only)
+    _, eta = schedule(jobs, lambda job: job["priority"], args.workers)
+    count = queue.enqueue(jobs)
+    print(f" Enqueued {count} {args.renderer} jobs → {queue.path}, "
+          f"ETA {eta:.0f}s on {args.workers} workers")
+    started = time.time()
+
+    workers = []
+    if args.command == "local":
+        # Local processes stand in for worker nodes
+        host = socket.gethostname()
+        workers = [
+            subprocess.Popen([sys.executable, "-m", "src.render_queue", "worker",
+                              "--worker-id", f"{host}-local{i}"])
+            for i in range(args.workers)
+        ]
+
+    keys = {job["key"] for job in jobs}
+    counts = wait_for_queue(queue, keys)
+    for proc in workers:
+        proc.wait()
+
+    finish_job(queue, keys, model, video_only)
+    export_trace("render_coordinator")
+    print(f" Render job finished in {time.time() - started:.0f}s "
+          f"(predicted {eta:.0f}s): {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+scene_revisions.py
+==================
+
+Scene Matching Across Script Revisions
+
+After a script edit, ScriptAnalyzer renumbers the scenes, so artifacts
+keyed by `scene_{id:02d}` no longer line up with their scenes. This stage
+aligns the new scene list with the one from the previous run and moves the
+artifacts of unchanged scenes to their new numbers; only inserted or
+changed scenes go back through image generation, TTS and rendering.
+
+Alignment is a global sequence alignment (Needleman-Wunsch) of the two
+lists, scoring scene pairs by fuzzy text similarity, so an edited scene
+lines up with its old version and scene order is respected. Each artifact
+kind is then carried over only when the text it was made from is unchanged:
+
+- image   description + visual focus
+- audio   narration (the description when there is no narration yet)
+- clip    both of the above
+
+Artifacts that are not carried over are moved aside to
+output/revisions/<timestamp>/stale rather than deleted.
+
+Usage (after analyzer_main.py has written output/scenes.json):
+    python -m src.scene_revisions [--dry-run]
+"""
+
+import argparse
+import difflib
+import glob
+import json
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.Config import REVISION_MATCH_THRESHOLD
+
+SCENES_JSON = "output/scenes.json"
+REVISION_DIR = "output/revisions"
+SNAPSHOT = os.path.join(REVISION_DIR, "scenes.previous.json")
+REPORT = os.path.join(REVISION_DIR, "revision.json")
+
+#: Files each artifact kind consists of, per scene number
+ARTIFACTS = {
+    "image": ["all_images/scene_{id:02d}.png", "all_images/scene_{id:02d}.*.bmp"],
+    "audio": ["audio/scene_{id:02d}.wav", "audio/scene_{id:02d}.wav.json"],
+    "clip": ["output/scene_videos/scene_{id:02d}.mp4",
+             "output/scene_videos/scene_{id:02d}.mp4.json",
+             "output/scene_videos_fixed/scene_{id:02d}.mp4",
+             "output/scene_videos_fixed/scene_{id:02d}.mp4.json"],
+}
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(text: Optional[str]) -> str:
+    text = _NON_WORD.sub(" ", (text or "").lower())
+    return _SPACE.sub(" ", text).strip()
+
+
+def scene_texts(scene: Dict) -> Dict[str, str]:
+    """
+    Normalized text behind each artifact kind of a scene.
+    """
+    image = normalize(f"{scene.get('description', '')} {scene.get('visual_focus', '')}")
+    audio = normalize(scene.get("narration") or scene.get("description"))
+    return {"image": image, "audio": audio, "clip": f"{image}\n{audio}"}
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    difflib ratio, skipping the full comparison when the cheap upper
+    bounds already rule out a match.
+    """
+    if a == b:
+        return 1.0
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < REVISION_MATCH_THRESHOLD:
+        return 0.0
+    if matcher.quick_ratio() < REVISION_MATCH_THRESHOLD:
+        return 0.0
+    return matcher.ratio()
+
+
+def align(old: List[str], new: List[str]) -> List[Tuple[Optional[int], Optional[int], float]]:
+    """
+    Global alignment of two scene text lists.
+
+    Pairs score their similarity above REVISION_MATCH_THRESHOLD; gaps
+    (inserted or deleted scenes) score zero. Returns (old_index, new_index,
+    similarity) in order, with None for the missing side of a gap.
+    """
+    n, m = len(old), len(new)
+    sims = [[similarity(old[i], new[j]) for j in range(m)] for i in range(n)]
+
+    score = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            best = max(score[i - 1][j], score[i][j - 1])
+            sim = sims[i - 1][j - 1]
+            if sim >= REVISION_MATCH_THRESHOLD:
+                best = max(best, score[i - 1][j - 1] + sim - REVISION_MATCH_THRESHOLD + 1e-9)
+            score[i][j] = best
+
+    pairs = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        sim = sims[i - 1][j - 1] if i > 0 and j > 0 else 0.0
+        if (sim >= REVISION_MATCH_THRESHOLD
+                and score[i][j] == score[i - 1][j - 1] + sim - REVISION_MATCH_THRESHOLD + 1e-9):
+            pairs.append((i - 1, j - 1, sim))
+            i, j = i - 1, j - 1
+        elif i > 0 and (j == 0 or score[i][j] == score[i - 1][j]):
+            pairs.append((i - 1, None, 0.0))
+            i -= 1
+        else:
+            pairs.append((None, j - 1, 0.0))
+            j -= 1
+    return pairs[::-1]
+
+
+def plan_revision(old_scenes: List[Dict], new_scenes: List[Dict]) -> Dict:
+    """
+    Match new scenes to old ones and decide which artifacts carry over.
+    """
+    old_texts = [scene_texts(s) for s in old_scenes]
+    new_texts = [scene_texts(s) for s in new_scenes]
+    pairs = align([t["clip"] for t in old_texts], [t["clip"] for t in new_texts])
+
+    scenes, deleted = [], []
+    for old_i, new_i, sim in pairs:
+        if new_i is None:
+            deleted.append(int(old_scenes[old_i]["scene_id"]))
+            continue
+        entry = {"scene_id": int(new_scenes[new_i]["scene_id"]), "previous_id": None,
+                 "similarity": round(sim, 3), "carry": [], "status": "inserted"}
+        if old_i is not None:
+            entry["previous_id"] = int(old_scenes[old_i]["scene_id"])
+            entry["carry"] = [
+                kind for kind in ARTIFACTS
+                if old_texts[old_i][kind] == new_texts[new_i][kind]
+            ]
+            entry["status"] = "unchanged" if "clip" in entry["carry"] else "changed"
+        scenes.append(entry)
+    return {"scenes": scenes, "deleted": deleted}
+
+
+def artifact_files(kind: str, scene_id: int) -> List[str]:
+    files = []
+    for pattern in ARTIFACTS[kind]:
+        files.extend(glob.glob(pattern.format(id=scene_id)))
+    return files
+
+
+def _renamed(path: str, old_id: int, new_id: int) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, name.replace(f"scene_{old_id:02d}", f"scene_{new_id:02d}", 1))
+
+
+def apply_revision(plan: Dict, old_ids: List[int], dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move carried artifacts to their new scene numbers, and everything else
+    that belonged to the old scene list into a stale directory.
+
+    Files are first parked in a `.revision-<stamp>` directory next to them,
+    then moved into place, so renumbering never overwrites an artifact that
+    is still to be moved and stays on one filesystem. If a move fails, the
+    moves made so far are undone. Stale files then go to
+    output/revisions/<stamp>/stale.
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    staging = os.path.join(REVISION_DIR, stamp)
+    carried = {}
+    for entry in plan["scenes"]:
+        for kind in entry["carry"]:
+            for path in artifact_files(kind, entry["previous_id"]):
+                carried[path] = _renamed(path, entry["previous_id"], entry["scene_id"])
+
+    moves = []
+    for scene_id in old_ids:
+        for kind in ARTIFACTS:
+            for path in artifact_files(kind, scene_id):
+                directory, name = os.path.split(path)
+                parked = os.path.join(directory, f".revision-{stamp}", name)
+                moves.append((path, parked, carried.get(path)))
+
+    counts = {"carried": sum(1 for *_, target in moves if target),
+              "stale": sum(1 for *_, target in moves if not target)}
+    if dry_run:
+        return counts
+
+    done = []
+
+    def move(source, destination):
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        shutil.move(source, destination)
+        done.append((source, destination))
+
+    try:
+        for path, parked, _ in moves:
+            move(path, parked)
+        for _, parked, target in moves:
+            if target:
+                move(parked, target)
+    except OSError:
+        for source, destination in reversed(done):
+            shutil.move(destination, source)
+        _remove_parking(moves)
+        raise
+
+    for path, parked, target in moves:
+        if not target:
+            try:
+                move(parked, os.path.join(staging, "stale", path))
+            except OSError as e:
+                print(f" Could not move stale {path} aside ({e}), left in {os.path.dirname(parked)}")
+    _remove_parking(moves)
+    return counts
+
+
+def _remove_parking(moves) -> None:
+    for parking in {os.path.dirname(parked) for _, parked, _ in moves}:
+        try:
+            os.rmdir(parking)
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carry scene artifacts over a script revision")
+    parser.add_argument("--dry-run", action="store_true", help="report the plan, move nothing")
+    args = parser.parse_args()
+
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        new_scenes = json.load(f)["Scenes"]
+
+    os.makedirs(REVISION_DIR, exist_ok=True)
+    if not os.path.exists(SNAPSHOT):
+        print(f" No previous scene list, recording {SNAPSHOT}")
+        if not args.dry_run:
+            shutil.copyfile(SCENES_JSON, SNAPSHOT)
+        return
+
+    with open(SNAPSHOT, "r", encoding="utf-8") as f:
+        old_scenes = json.load(f)["Scenes"]
+
+    plan = plan_revision(old_scenes, new_scenes)
+    counts = apply_revision(plan, [int(s["scene_id"]) for s in old_scenes], args.dry_run)
+
+    for entry in plan["scenes"]:
+        previous = f"← {entry['previous_id']:>3} ({entry['similarity']:.2f})" \
+            if entry["previous_id"] is not None else ""
+        carry = f" keeps {', '.join(entry['carry'])}" if entry["carry"] and entry["status"] != "unchanged" else ""
+        print(f" scene {entry['scene_id']:>3} {entry['status']:<9} {previous}{carry}")
+    if plan["deleted"]:
+        print(f" deleted: {plan['deleted']}")
+
+    statuses = [entry["status"] for entry in plan["scenes"]]
+    print(
+        f" {statuses.count('unchanged')} unchanged, {statuses.count('changed')} changed, "
+        f"{statuses.count('inserted')} inserted, {len(plan['deleted'])} deleted; "
+        f"{counts['carried']} files carried over, {counts['stale']} moved aside"
+    )
+
+    if args.dry_run:
+        return
+    with open(REPORT, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    shutil.copyfile(SCENES_JSON, SNAPSHOT)
+
+
+if __name__ == "__main__":
+    main()
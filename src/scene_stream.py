@@ -0,0 +1,250 @@
+"""
+scene_stream.py
+===============
+
+Streaming Scene and Prompt Files
+
+Readers and a writer that keep one record in memory at a time, for scene
+lists too large to `json.load` and re-dump in one go:
+
+- iter_json_array   records of a JSON array, either the whole document or
+                    the array under a top-level key ("Scenes"), parsed
+                    incrementally from fixed-size chunks
+- iter_jsonl        records of a JSON Lines file
+- iter_records      either of the above, by file extension
+- JsonlWriter       appends one record per line and flushes it, writing to
+                    `<path>.part` and renaming to `<path>` when complete
+- follow_jsonl      reads a JSONL file while its JsonlWriter is still
+                    writing it, so a downstream stage can start on the
+                    first records
+"""
+
+import json
+import os
+import time
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+#: Bytes read per chunk by the incremental parser
+CHUNK_SIZE = 1 << 16
+
+#: Seconds between polls while following a file that is being written
+FOLLOW_POLL_S = 0.5
+
+_WHITESPACE = " \t\r\n"
+_NUMBER_TAIL = ".eE+-"
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    """
+    Text buffer over a file, refilled on demand and trimmed as it is consumed.
+    """
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+
+    def fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Next non-whitespace character ("" at end of file), not consumed.
+        """
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON stream, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next complete JSON value, reading more chunks while it
+        is cut off at the end of the buffer.
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number cut off by the end of the buffer ("12", "1.", "3e")
+            # may continue in the next chunk
+            if (not isinstance(obj, (dict, list, str))
+                    and (end == len(self.text) or self.text[end] in _NUMBER_TAIL)
+                    and self.fill()):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(path: str, key: Union[str, Sequence[str], None] = None,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """
+    Yield the elements of a JSON array one at a time.
+
+    Parameters
+    ----------
+    path : str
+        JSON file.
+    key : str or sequence of str, optional
+        Top-level object key holding the array (the first of several that
+        is present); None if the document itself is the array. Other
+        top-level values are decoded and discarded.
+
+    Raises
+    ------
+    KeyError
+        If `key` is not in the document.
+    ValueError
+        If the document is not shaped as expected.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = _Buffer(f, chunk_size)
+
+        if key is not None:
+            keys = (key,) if isinstance(key, str) else tuple(key)
+            buffer.expect("{")
+            while True:
+                if buffer.peek() == "}":
+                    raise KeyError(key)
+                name = buffer.value()
+                buffer.expect(":")
+                if name in keys:
+                    break
+                buffer.value()
+                if buffer.expect(",}") == "}":
+                    raise KeyError(key)
+
+        buffer.expect("[")
+        if buffer.peek() == "]":
+            return
+        while True:
+            yield buffer.value()
+            if buffer.expect(",]") == "]":
+                return
+
+
+def iter_jsonl(path: str) -> Iterator:
+    """
+    Yield the records of a JSON Lines file, skipping blank lines.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_records(path: str, key: Union[str, Sequence[str], None] = None) -> Iterator:
+    """
+    Records of a `.jsonl` file, or of the JSON array (under `key`) otherwise.
+    """
+    if str(path).endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path, key)
+
+
+def part_path(path: str) -> str:
+    return f"{path}.part"
+
+
+class JsonlWriter:
+    """
+    Write records as JSON Lines to `<path>.part`, renamed to `path` on a
+    clean close. Every line is flushed as it is written, so follow_jsonl
+    readers see it at once.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            # A finished file would otherwise end followers before we do
+            os.remove(self.path)
+        self._file = open(part_path(self.path), "w", encoding="utf-8")
+        return self
+
+    def write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(part_path(self.path), self.path)
+        return False
+
+
+def follow_jsonl(path: str, poll: float = FOLLOW_POLL_S,
+                 idle_timeout: Optional[float] = 300.0) -> Iterator:
+    """
+    Yield the records of a JSONL file written by JsonlWriter, including
+    records appended while it is still being written.
+
+    Reads `path` if it is complete, otherwise follows `<path>.part` until the
+    writer renames it to `path`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If neither file exists.
+    TimeoutError
+        If the file in progress does not grow for `idle_timeout` seconds
+        (the writer most likely died).
+    """
+    path = str(path)
+    if os.path.exists(path):
+        yield from iter_jsonl(path)
+        return
+
+    try:
+        f = open(part_path(path), "r", encoding="utf-8")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Neither {path} nor {part_path(path)} exists") from None
+
+    with f:
+        pending = ""
+        last_growth = time.monotonic()
+        while True:
+            # Check before reading, so nothing written before the rename is missed
+            finished = not os.path.exists(part_path(path))
+            chunk = f.readline()
+            while chunk:
+                pending += chunk
+                if pending.endswith("\n"):
+                    if pending.strip():
+                        yield json.loads(pending)
+                    pending = ""
+                    last_growth = time.monotonic()
+                chunk = f.readline()
+
+            if finished:
+                if pending.strip():
+                    yield json.loads(pending)
+                return
+            if idle_timeout is not None and time.monotonic() - last_growth > idle_timeout:
+                raise TimeoutError(f"{part_path(path)} stopped growing")
+            time.sleep(poll)
@@ -1,24 +1,34 @@
 import os
 import json
+import argparse
 import subprocess
 import random
+import time
+
+from src.ambience import mix_scene, scene_ambience
+from src.encoder_tuning import encoder_settings, x264_args
+from src.preprocess_images import frame_source, prepare_images, summarize
+from src.ffmpeg_progress import run_ffmpeg
+from src.loudness import scene_gain
+from src.narration_track import build_narration_track, clip_list_path, scene_frames
+from src.scheduler import CostModel, audio_seconds
+from src.timing import export_trace, span
+from src.utils import is_up_to_date, read_stamp, save_json, write_stamp
+from src.workspace import workspace
 
 # PATHS 
 SCENES_JSON = "output/scenes_with_audio.json"
 IMAGE_DIR = "all_images"
 OUTPUT_DIR = "output/scene_videos_fixed"
-
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# LOAD SCENES 
-with open(SCENES_JSON, "r", encoding="utf-8") as f:
-    scenes = json.load(f)["Scenes"]
+NARRATION_WAV = "output/narration.wav"
+FPS = 30
 
 # HELPERS 
-def run(cmd):
+def run(cmd, scene=None, duration=None, queued_at=None, input_data=None):
     try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
+        run_ffmpeg(cmd, "ffmpeg_encode", stage="render", scene=scene,
+                   duration=duration, queued_at=queued_at, input_data=input_data)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
         print(f" FFmpeg failed: {e}")
         return False
     return True
@@ -33,124 +43,268 @@ def get_audio_duration(audio_path):
         audio_path
     ]
     try:
-        duration = float(subprocess.check_output(cmd).decode().strip())
+        with span("ffprobe", stage="render", path=audio_path):
+            duration = float(subprocess.check_output(cmd).decode().strip())
         return max(duration, 0.1)  # prevent zero duration
     except Exception as e:
         print(f" Could not get duration for {audio_path}: {e}")
         return None
 
 # EFFECTS 
+# Every effect takes the output frame rate and size; the defaults are the
+# production settings, other values are used by benchmark_render.py.
+# With audio=None the clip is rendered video-only and cut to exactly
+# scene_frames(duration, fps) frames, for muxing with narration_track.py.
+# gain_db is the scene's loudness normalization (src/loudness.py).
+# audio_input replaces `-i audio` with other input options, e.g. the
+# ambience mix on stdin (src/ambience.py), which has the gain applied.
+# x264 preset and threads come from this host's encoder profile
+# (src/encoder_tuning.py) unless `encoder` gives the x264 options to use.
 
-def ken_burns(image, audio, output, duration):
-    return [
+def encode_command(image, audio, output, duration, fps, graph, gain_db=None, audio_input=None,
+                   encoder=None):
+    cmd = [
         "ffmpeg", "-y",
         "-loop", "1", "-t", str(duration), "-i", image,
-        "-i", audio,
-        "-filter_complex",
-        (
-            "[0:v]fps=30,scale=2400:2400,"
-            "zoompan=z='min(1+on*0.0006,1.08)':"
-            "x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
-            "s=1920x1080,"
-            "fade=t=in:st=0:d=1,"
-            f"fade=t=out:st={duration-1}:d=1[v]"
-        ),
-        "-map", "[v]", "-map", "1:a",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-shortest",
-        output
     ]
-
-def slide_pan(image, audio, output, duration):
-    total_frames = int(duration * 30)
-    return [
-        "ffmpeg", "-y",
-        "-loop", "1", "-t", str(duration), "-i", image,
-        "-i", audio,
-        "-filter_complex",
-        (
-            f"[0:v]fps=30,scale=2600:1460,zoompan=z=1:x='on*(iw-1920)/{total_frames}':y=0:"
-            f"s=1920x1080,fade=t=in:st=0:d=1,fade=t=out:st={duration-1}:d=1[v]"
-        ),
-        "-map", "[v]", "-map", "1:a",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-shortest",
-        output
+    if audio:
+        cmd += audio_input or ["-i", audio]
+    cmd += [
+        "-filter_complex", graph,
+        "-map", "[v]",
     ]
+    if audio:
+        cmd += ["-map", "1:a"]
+        if gain_db:
+            cmd += ["-af", f"volume={gain_db:.2f}dB"]
+    if encoder is None:
+        settings = encoder_settings("effect")
+        encoder = x264_args(settings["preset"], settings["threads"])
+    cmd += ["-c:v", "libx264", *encoder, "-pix_fmt", "yuv420p"]
+    if audio:
+        cmd += ["-c:a", "aac", "-shortest"]
+    else:
+        cmd += ["-an", "-frames:v", str(scene_frames(duration, fps))]
+    return cmd + [output]
 
-def rotate_zoom(image, audio, output, duration):
-    return [
-        "ffmpeg", "-y",
-        "-loop", "1", "-t", str(duration), "-i", image,
-        "-i", audio,
-        "-filter_complex",
-        (
-            "[0:v]fps=30,scale=2400:2400,"
-            "rotate=0.01*sin(2*PI*on/150):c=black@0,"
-            "crop=1920:1080,fade=t=in:st=0:d=1,"
-            f"fade=t=out:st={duration-1}:d=1[v]"
-        ),
-        "-map", "[v]", "-map", "1:a",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-shortest",
-        output
-    ]
+def ken_burns(image, audio, output, duration, fps=30, size=(1920, 1080), gain_db=None,
+              audio_input=None, encoder=None):
+    width, height = size
+    return encode_command(image, audio, output, duration, fps, (
+        f"[0:v]fps={fps},scale=2400:2400,"
+        "zoompan=z='min(1+on*0.0006,1.08)':"
+        "x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
+        f"s={width}x{height}:fps={fps},"
+        "fade=t=in:st=0:d=1,"
+        f"fade=t=out:st={duration-1}:d=1[v]"
+    ), gain_db, audio_input, encoder)
 
-def cinematic_overlay(image, audio, output, duration):
-    return [
-        "ffmpeg", "-y",
-        "-loop", "1", "-t", str(duration), "-i", image,
-        "-i", audio,
-        "-filter_complex",
-        (
-            "[0:v]fps=30,scale=2400:2400,zoompan="
-            "z='min(1+on*0.0005,1.07)':"
-            "x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
-            "s=1920x1080,drawbox=x=0:y=0:w=iw:h=ih:color=black@0.25:t=fill,"
-            "fade=t=in:st=0:d=1,"
-            f"fade=t=out:st={duration-1}:d=1[v]"
-        ),
-        "-map", "[v]", "-map", "1:a",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-shortest",
-        output
-    ]
+def slide_pan(image, audio, output, duration, fps=30, size=(1920, 1080), gain_db=None,
+              audio_input=None, encoder=None):
+    width, height = size
+    total_frames = int(duration * fps)
+    return encode_command(image, audio, output, duration, fps, (
+        f"[0:v]fps={fps},scale=2600:1460,zoompan=z=1:x='on*(iw-{width})/{total_frames}':y=0:"
+        f"s={width}x{height}:fps={fps},fade=t=in:st=0:d=1,fade=t=out:st={duration-1}:d=1[v]"
+    ), gain_db, audio_input, encoder)
+
+def rotate_zoom(image, audio, output, duration, fps=30, size=(1920, 1080), gain_db=None,
+                audio_input=None, encoder=None):
+    width, height = size
+    return encode_command(image, audio, output, duration, fps, (
+        f"[0:v]fps={fps},scale=2400:2400,"
+        "rotate=0.01*sin(2*PI*n/150):c=black@0,"
+        f"crop={width}:{height},fade=t=in:st=0:d=1,"
+        f"fade=t=out:st={duration-1}:d=1[v]"
+    ), gain_db, audio_input, encoder)
+
+def cinematic_overlay(image, audio, output, duration, fps=30, size=(1920, 1080), gain_db=None,
+                      audio_input=None, encoder=None):
+    width, height = size
+    return encode_command(image, audio, output, duration, fps, (
+        f"[0:v]fps={fps},scale=2400:2400,zoompan="
+        "z='min(1+on*0.0005,1.07)':"
+        "x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
+        f"s={width}x{height}:fps={fps},drawbox=x=0:y=0:w=iw:h=ih:color=black@0.25:t=fill,"
+        "fade=t=in:st=0:d=1,"
+        f"fade=t=out:st={duration-1}:d=1[v]"
+    ), gain_db, audio_input, encoder)
 
 # PROCESS 
 effects = [ken_burns, slide_pan, rotate_zoom, cinematic_overlay]
+EFFECTS = {effect.__name__: effect for effect in effects}
+
+
+def plan_scenes(scenes):
+    """
+    Pick an effect for every scene up front, so each image is pre-sized
+    once, for its effect. Returns (scene_num, image_path, audio_path, effect).
+    """
+    plan = []
+    for scene in scenes:
+        scene_num = int(scene["scene_id"])
+        image_path = os.path.join(IMAGE_DIR, f"scene_{scene_num:02d}.png")
+        audio_path = scene["audio_file"].replace("\\", "/")
+        plan.append((scene_num, image_path, audio_path, random.choice(effects)))
+    return plan
+
+
+def keep_clip(output_path, video_only):
+    """
+    Record a finished clip in the workspace, with the mode it was rendered
+    in: --incremental only keeps clips that rendered in the same mode.
+    """
+    workspace().record("scene_videos_fixed", output_path)
+    workspace().record("scene_videos_fixed", write_stamp(output_path, video_only=video_only))
 
-for scene in scenes:
-    scene_id = f"scene_{int(scene['scene_id']):02d}"
 
-    image_path = os.path.join(IMAGE_DIR, f"{scene_id}.png")
-    audio_path = scene["audio_file"].replace("\\", "/")
-    output_path = os.path.join(OUTPUT_DIR, f"{scene_id}.mp4")
+def render_animated_scene(scene_num, image_path, audio_path, effect,
+                          video_only=False, queued_at=None, gain_db=None, ambience=None,
+                          output_path=None):
+    """
+    Render one scene with `effect`, falling back to Ken Burns. The narration
+    is mixed with the `ambience` preset's bed in memory and piped into the
+    encode. In video-only mode `gain_db` and `ambience` are left to the
+    narration track instead.
+
+    The clip goes to OUTPUT_DIR unless `output_path` is given; the caller
+    then moves it into place and calls keep_clip().
+
+    Returns the number of video frames written, or None if the scene was
+    skipped or failed.
+    """
+    scene_id = f"scene_{scene_num:02d}"
+    clip_path = os.path.join(OUTPUT_DIR, f"{scene_id}.mp4")
+    output_path = output_path or clip_path
 
     if not os.path.exists(image_path):
         print(f" Missing image: {image_path}")
-        continue
+        return None
 
     if not os.path.exists(audio_path):
         print(f" Missing audio: {audio_path}")
-        continue
+        return None
 
     duration = get_audio_duration(audio_path)
     if duration is None or duration <= 0:
         print(f" Invalid audio duration for {scene_id}")
-        continue
+        return None
 
-    effect = random.choice(effects)
     print(f" Rendering {scene_id} | Effect: {effect.__name__}")
 
-    success = run(effect(image_path, audio_path, output_path, duration))
+    scene_audio = None if video_only else audio_path
+    gain_db = None if video_only else gain_db
+    mixed = None if video_only else mix_scene(audio_path, ambience, gain_db, scene=scene_num)
+    if mixed:
+        audio_options = {"gain_db": None, "audio_input": mixed.input_args()}
+    else:
+        audio_options = {"gain_db": gain_db}
+    input_data = mixed.data if mixed else None
+
+    source = frame_source(image_path, effect.__name__)
+    success = run(effect(source, scene_audio, output_path, duration, fps=FPS, **audio_options),
+                  scene=scene_num, duration=duration, queued_at=queued_at, input_data=input_data)
     if success:
         print(f" Created {output_path}")
     else:
         print(f" Failed {scene_id}, trying Ken Burns as fallback")
         # fallback to ken_burns if random effect fails
-        run(ken_burns(image_path, audio_path, output_path, duration))
+        source = frame_source(image_path, ken_burns.__name__)
+        success = run(ken_burns(source, scene_audio, output_path, duration, fps=FPS,
+                                **audio_options),
+                      scene=scene_num, duration=duration, input_data=input_data)
         print(f" Fallback done {output_path}")
 
-print(" ALL SCENES ATTEMPTED")
+    if output_path == clip_path:
+        if success:
+            keep_clip(clip_path, video_only)
+        elif os.path.exists(f"{clip_path}.json"):
+            os.remove(f"{clip_path}.json")
+    return scene_frames(duration, FPS) if success else None
+
+
+def write_narration_track(rendered):
+    """
+    Join the narration of rendered scenes, given as (scene_num, audio_path,
+    frames, gain_db, ambience), in the same order as stitch_final_video.py:
+    by scene number. The clips it covers are listed next to it, for
+    stitch_final_video.py to concatenate exactly those.
+    """
+    rendered = sorted(rendered)
+    with span("narration_track", stage="render") as s:
+        seconds = build_narration_track(
+            [(audio, frames, gain_db, ambience) for _, audio, frames, gain_db, ambience in rendered],
+            NARRATION_WAV, FPS,
+        )
+        s.set(audio_s=round(seconds, 3), bytes_written=workspace().record("narration", NARRATION_WAV))
+    save_json(clip_list_path(NARRATION_WAV), {
+        "narration": NARRATION_WAV,
+        "clips": [os.path.join(OUTPUT_DIR, f"scene_{scene_num:02d}.mp4") for scene_num, *_ in rendered],
+    })
+    workspace().record("narration", clip_list_path(NARRATION_WAV))
+    print(f" Narration track ({seconds:.2f}s) → {NARRATION_WAV}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render animated scene videos")
+    parser.add_argument("--video-only", action="store_true",
+                        help=f"render clips without audio and write the narration "
+                             f"once to {NARRATION_WAV} for the final mux")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip scenes whose clip is newer than its image and audio")
+    args = parser.parse_args()
+
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        scenes = json.load(f)["Scenes"]
+
+    # Clips are intermediates, tracked in the workspace ledger
+    workspace().stage_dir(OUTPUT_DIR, "scene_videos_fixed")
+
+    gains = {int(scene["scene_id"]): scene_gain(scene) for scene in scenes}
+    ambiences = {int(scene["scene_id"]): scene_ambience(scene) for scene in scenes}
+
+    # Scenes render one after another in scene order; the cost model only
+    # predicts how long that takes
+    model = CostModel()
+    plan = plan_scenes(scenes)
+    eta = sum(model.predict(effect.__name__, audio_seconds(audio_path))
+              for _, _, audio_path, effect in plan)
+    print(f" Rendering {len(plan)} scenes, ETA {eta:.0f}s")
+    queued_at = time.time()
+
+    prepared = summarize(prepare_images(
+        {image: [effect.__name__] for _, image, _, effect in plan}
+    ))
+    print(
+        f" Pre-sized {prepared['frames_written']} images "
+        f"({prepared['frames_cached']} cached)"
+    )
+
+    rendered = []
+    for scene_num, image_path, audio_path, effect in plan:
+        output_path = os.path.join(OUTPUT_DIR, f"scene_{scene_num:02d}.mp4")
+        duration = audio_seconds(audio_path)
+        if (args.incremental and duration is not None
+                and is_up_to_date(output_path, image_path, audio_path)
+                and read_stamp(output_path).get("video_only") == args.video_only):
+            print(f" Unchanged scene_{scene_num:02d}, skipping")
+            rendered.append((scene_num, audio_path, scene_frames(duration, FPS), gains[scene_num],
+                             ambiences[scene_num]))
+            continue
+        frames = model.timed(effect.__name__, audio_seconds(audio_path),
+                             render_animated_scene, scene_num, image_path, audio_path, effect,
+                             video_only=args.video_only, queued_at=queued_at,
+                             gain_db=gains[scene_num], ambience=ambiences[scene_num])
+        if frames:
+            rendered.append((scene_num, audio_path, frames, gains[scene_num], ambiences[scene_num]))
+
+    print(" ALL SCENES ATTEMPTED")
+    model.save()
+
+    if args.video_only:
+        write_narration_track(rendered)
+    export_trace("scene_render")
 
 
+if __name__ == "__main__":
+    main()
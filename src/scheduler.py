@@ -0,0 +1,166 @@
+"""
+scheduler.py
+============
+
+Cost-Aware Scene Scheduling
+
+Predicts how long each scene will take to render and dispatches scenes
+longest-first (LPT) so a long scene never starts last while the other
+workers sit idle. The same predictions give an up-front ETA for the job.
+
+Cost model, per render kind (effect name, or "still"):
+
+    seconds = overhead + rate * audio_seconds
+
+It starts from `RENDER_COST_PRIORS` and is refit by weighted least squares
+after every run from the measured scene times, persisted in
+`RENDER_HISTORY`. Older runs fade out by `RENDER_HISTORY_DECAY` per run, so
+the model follows hardware and setting changes.
+
+Usage:
+    model = CostModel()
+    jobs, eta = schedule(jobs, lambda job: model.predict("still", job.audio_s), workers=4)
+    ...
+    model.observe("still", audio_s, seconds)
+    model.save()
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.Config import RENDER_COST_PRIORS, RENDER_HISTORY, RENDER_HISTORY_DECAY
+from src.utils import wav_duration
+
+#: Prior for kinds that are not in RENDER_COST_PRIORS
+DEFAULT_PRIOR = (1.0, 1.5)
+
+
+def audio_seconds(audio_path: str, default: Optional[float] = None) -> Optional[float]:
+    """
+    Narration length of a scene from its WAV header, or `default`.
+    """
+    if audio_path.lower().endswith(".wav") and os.path.exists(audio_path):
+        try:
+            return wav_duration(audio_path)
+        except Exception:
+            pass
+    return default
+
+
+class CostModel:
+    """
+    Per-kind linear render cost model with persisted, decaying history.
+    """
+
+    def __init__(self, path=RENDER_HISTORY, decay: float = RENDER_HISTORY_DECAY):
+        self.path = str(path)
+        self.decay = decay
+        # kind -> weighted sums {"w", "x", "y", "xx", "xy"} of (audio_s, seconds)
+        self.history: Dict[str, Dict[str, float]] = {}
+        self.observations: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.history = json.load(f).get("kinds", {})
+
+    def coefficients(self, kind: str) -> Tuple[float, float]:
+        """
+        (overhead_s, rate) for `kind`: fitted from history when there is
+        enough spread in scene lengths, otherwise the prior overhead with a
+        rate scaled to the observed mean.
+        """
+        overhead, rate = RENDER_COST_PRIORS.get(kind, DEFAULT_PRIOR)
+        sums = self.history.get(kind)
+        if not sums or sums["w"] <= 0:
+            return overhead, rate
+
+        w, x, y = sums["w"], sums["x"], sums["y"]
+        denominator = w * sums["xx"] - x * x
+        if w >= 2 and denominator > 1e-6 * w * w:
+            slope = (w * sums["xy"] - x * y) / denominator
+            intercept = (y - slope * x) / w
+            if slope >= 0 and intercept >= 0:
+                return intercept, slope
+
+        if x > 0:
+            rate = max((y - overhead * w) / x, 0.0)
+        return overhead, rate
+
+    def predict(self, kind: str, audio_s: Optional[float]) -> float:
+        overhead, rate = self.coefficients(kind)
+        return overhead + rate * (audio_s or 0.0)
+
+    def observe(self, kind: str, audio_s: Optional[float], seconds: float) -> None:
+        """
+        Record a measured scene time. Applied to the model by `save()`.
+        """
+        if audio_s is None or seconds <= 0:
+            return
+        with self._lock:
+            self.observations.append((kind, audio_s, seconds))
+
+    def timed(self, kind: str, audio_s: Optional[float], fn: Callable, *args, **kwargs):
+        """
+        Call `fn(*args, **kwargs)` and observe how long it took. Failed
+        calls (a falsy result) are not observed.
+        """
+        started = time.time()
+        result = fn(*args, **kwargs)
+        if result:
+            self.observe(kind, audio_s, time.time() - started)
+        return result
+
+    def save(self) -> None:
+        """
+        Fold this run's observations into the history and persist it.
+        """
+        with self._lock:
+            observations, self.observations = self.observations, []
+        if not observations:
+            return
+
+        for kind in {kind for kind, _, _ in observations}:
+            sums = self.history.get(kind)
+            if sums:
+                for key in sums:
+                    sums[key] *= self.decay
+        for kind, x, y in observations:
+            sums = self.history.setdefault(kind, {"w": 0.0, "x": 0.0, "y": 0.0, "xx": 0.0, "xy": 0.0})
+            sums["w"] += 1
+            sums["x"] += x
+            sums["y"] += y
+            sums["xx"] += x * x
+            sums["xy"] += x * y
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        model = {kind: dict(zip(("overhead_s", "rate"), self.coefficients(kind)))
+                 for kind in self.history}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"kinds": self.history, "model": model}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def estimate_makespan(costs: Sequence[float], workers: int) -> float:
+    """
+    Wall time of running `costs` in the given order on `workers` workers,
+    each job going to whichever worker frees up first.
+    """
+    finish = [0.0] * max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+
+def schedule(jobs: List, cost: Callable, workers: int) -> Tuple[List, float]:
+    """
+    Order jobs longest predicted cost first.
+
+    Returns the ordered jobs and the predicted wall time on `workers`.
+    """
+    costed = sorted(((cost(job), job) for job in jobs), key=lambda item: item[0], reverse=True)
+    return [job for _, job in costed], estimate_makespan([c for c, _ in costed], workers)
@@ -1,47 +1,227 @@
 import os
+import json
+import argparse
 import subprocess
 
+from src.Config import RENDITIONS
+from src.encoder_tuning import encoder_settings, x264_args
+from src.ffmpeg_progress import run_ffmpeg
+from src.narration_track import clip_list_path
+from src.timing import export_trace, span
+from src.workspace import MB, print_usage, workspace
+
+SCENES_JSON = "output/scenes_with_audio.json"
 SCENE_VIDEO_DIR = "output/scene_videos_fixed"
 SUBTITLE_FILE = "output/subtitles2.srt"
 FINAL_DIR = "output/final_video2_animation"
 FINAL_VIDEO = os.path.join(FINAL_DIR, "final2.mp4")
-CONCAT_FILE = "scene_list2.txt"
+CONCAT_NAME = "scene_list2.txt"   # scratch file, in the workspace
+
+#: Workspace stages this stitch reads, deleted after a verified stitch with --gc
+CONSUMED_STAGES = ("scene_videos_fixed", "narration")
+
+#: Allowed difference between the final video and the narration length, in
+#: seconds (at least 1% of the length)
+VERIFY_TOLERANCE_S = 1.0
+
+#: Single output at scene size, used when no renditions are requested
+DEFAULT_RENDITION = {"size": None, "crop": None, "crf": 18, "subtitle_style": None}
+
+
+def expected_duration():
+    """
+    Total narration length from the scenes JSON, used for the stitch ETA.
+    """
+    if not os.path.exists(SCENES_JSON):
+        return None
+    with open(SCENES_JSON, "r", encoding="utf-8") as f:
+        scenes = json.load(f)["Scenes"]
+    return sum(scene.get("audio_duration", 0) for scene in scenes) or None
+
+
+def rendition_filter(rendition, subtitle_path):
+    """
+    Per-rendition video chain: centre crop, scale, then burn subtitles at
+    the output resolution with the rendition's style.
+    """
+    steps = []
+    if rendition.get("crop"):
+        num, den = rendition["crop"].split(":")
+        steps.append(
+            f"crop=w='min(iw,ih*{num}/{den})':h='min(ih,iw*{den}/{num})'"
+        )
+    if rendition.get("size"):
+        width, height = rendition["size"]
+        steps.append(f"scale={width}:{height}")
+
+    subtitles = f"subtitles='{subtitle_path}'"
+    if rendition.get("subtitle_style"):
+        subtitles += f":force_style='{rendition['subtitle_style']}'"
+    steps.append(subtitles)
+    return ",".join(steps)
+
+
+def build_command(outputs, subtitle_path, concat_file, narration=None):
+    """
+    One ffmpeg command that decodes the concatenated scenes once and encodes
+    every rendition from a `split` of that decode.
+
+    Parameters
+    ----------
+    outputs : list of (path, rendition dict)
+    subtitle_path : str
+    concat_file : str
+        Concat demuxer list of the scene clips.
+    narration : str, optional
+        Narration WAV to mux instead of the scene clips' own audio.
+    """
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", concat_file,
+    ]
+    if narration:
+        # Audio is encoded only at this final mux
+        cmd += ["-i", narration]
+    audio_map = "1:a" if narration else "0:a"
 
-os.makedirs(FINAL_DIR, exist_ok=True)
+    count = len(outputs)
+    branches = "".join(f"[s{i}]" for i in range(count))
+    graph = [f"[0:v]split={count}{branches}"]
+    for i, (_, rendition) in enumerate(outputs):
+        graph.append(f"[s{i}]{rendition_filter(rendition, subtitle_path)}[v{i}]")
+    cmd += ["-filter_complex", ";".join(graph)]
 
-# Create FFmpeg concat file (ordered)
-videos = sorted(
-    os.listdir(SCENE_VIDEO_DIR),
-    key=lambda x: int(x.split("_")[-1].split(".")[0])
-)
+    # Preset and threads: this host's encoder profile (src/encoder_tuning.py)
+    settings = encoder_settings("stitch")
+    for i, (path, rendition) in enumerate(outputs):
+        cmd += [
+            "-map", f"[v{i}]",
+            "-map", audio_map,
+            "-c:v", "libx264",
+            *x264_args(settings["preset"], settings["threads"]),
+            "-crf", str(rendition["crf"]),
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            path,
+        ]
+    return cmd
 
-with open(CONCAT_FILE, "w", encoding="utf-8") as f:
-    for video in videos:
-        if video.endswith(".mp4"):
-            video_path = os.path.join(SCENE_VIDEO_DIR, video).replace("\\", "/")
+
+def verify_video(path, duration=None, tolerance=VERIFY_TOLERANCE_S):
+    """
+    True if ffprobe finds a video and an audio stream in `path` and, given
+    the expected `duration`, a length within `tolerance` of it.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration:stream=codec_type",
+        "-of", "json",
+        path,
+    ]
+    try:
+        with span("ffprobe", stage="stitch", path=path):
+            info = json.loads(subprocess.check_output(cmd))
+        streams = {stream.get("codec_type") for stream in info.get("streams", [])}
+        actual = float(info["format"]["duration"])
+    except (OSError, subprocess.CalledProcessError, KeyError, ValueError) as e:
+        print(f" Could not verify {path}: {e}")
+        return False
+
+    if not {"video", "audio"} <= streams:
+        print(f" {path} is missing a stream (found {sorted(s for s in streams if s)})")
+        return False
+    if duration and abs(actual - duration) > max(tolerance, 0.01 * duration):
+        print(f" {path} is {actual:.2f}s long, expected {duration:.2f}s")
+        return False
+    return True
+
+
+def scene_clips(narration=None):
+    """
+    Scene clips to concatenate, in playback order: every clip in
+    SCENE_VIDEO_DIR, or with a narration track exactly the clips it was
+    built for, so video and narration cannot drift apart.
+    """
+    if not narration:
+        videos = sorted(
+            (name for name in os.listdir(SCENE_VIDEO_DIR) if name.endswith(".mp4")),
+            key=lambda x: int(x.split("_")[-1].split(".")[0])
+        )
+        return [os.path.join(SCENE_VIDEO_DIR, video) for video in videos]
+
+    clip_list = clip_list_path(narration)
+    if not os.path.exists(clip_list):
+        raise SystemExit(f" No clip list {clip_list} for {narration}: re-run "
+                         f"scene_video_ffmpeg_with_animation.py --video-only")
+    with open(clip_list, "r", encoding="utf-8") as f:
+        clips = json.load(f)["clips"]
+    missing = [clip for clip in clips if not os.path.exists(clip)]
+    if missing:
+        raise SystemExit(f" {narration} covers clips that no longer exist: {missing}")
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stitch scene videos into the final video")
+    parser.add_argument("--narration", metavar="WAV",
+                        help="mux this narration track (from scene_video_ffmpeg_with_animation.py "
+                             "--video-only) instead of the scene clips' own audio")
+    parser.add_argument("--renditions", nargs="+", choices=sorted(RENDITIONS),
+                        help="encode these renditions (Config.RENDITIONS) from one decode "
+                             f"instead of the single {FINAL_VIDEO}")
+    parser.add_argument("--gc", action="store_true",
+                        help="delete the scene clips and narration track after a verified "
+                             "stitch (they are needed to re-stitch or render --incremental)")
+    args = parser.parse_args()
+
+    os.makedirs(FINAL_DIR, exist_ok=True)
+
+    # Create FFmpeg concat file (ordered)
+    videos = scene_clips(args.narration)
+
+    # Absolute paths: the concat demuxer resolves relative ones against the
+    # list's own directory, which is in the scratch workspace
+    concat_file = workspace().temp_path(CONCAT_NAME)
+    with open(concat_file, "w", encoding="utf-8") as f:
+        for video in videos:
+            video_path = os.path.abspath(video).replace("\\", "/")
             f.write(f"file '{video_path}'\n")
 
-print("scene_list.txt created")
+    print(f"{concat_file} created")
+
+    # Escape subtitle path
+    subtitle_path = SUBTITLE_FILE.replace("\\", "/")
+
+    if args.renditions:
+        stem = os.path.splitext(FINAL_VIDEO)[0]
+        outputs = [(f"{stem}_{name}.mp4", RENDITIONS[name]) for name in args.renditions]
+    else:
+        outputs = [(FINAL_VIDEO, DEFAULT_RENDITION)]
 
-# Escape subtitle path
-subtitle_path = SUBTITLE_FILE.replace("\\", "/")
+    cmd = build_command(outputs, subtitle_path, concat_file, args.narration)
+    duration = expected_duration()
 
-cmd = [
-    "ffmpeg",
-    "-y",
-    "-f", "concat",
-    "-safe", "0",
-    "-i", CONCAT_FILE,
-    "-vf", f"subtitles='{subtitle_path}'",
-    "-c:v", "libx264",
-    "-preset", "medium",
-    "-crf", "18",
-    "-c:a", "aac",
-    "-movflags", "+faststart",
-    FINAL_VIDEO
-]
+    try:
+        run_ffmpeg(cmd, "stitch", stage="stitch", duration=duration)
+        for path, _ in outputs:
+            print(" Final video created successfully:", path)
 
-subprocess.run(cmd, check=True)
+        ws = workspace()
+        print_usage(ws)
+        # Intermediates go only once every output is known to be good
+        if not all(verify_video(path, duration) for path, _ in outputs):
+            print(" Final video not verified, intermediates kept")
+        elif args.gc:
+            print(f" Verified, removed intermediates ({ws.collect(CONSUMED_STAGES) / MB:.1f} MB)")
+        else:
+            print(f" Verified, removed scratch files ({ws.collect(()) / MB:.1f} MB)")
+    finally:
+        export_trace("stitch")
 
-print(" Final video created successfully:", FINAL_VIDEO)
 
+if __name__ == "__main__":
+    main()
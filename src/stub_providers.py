@@ -0,0 +1,268 @@
+"""
+stub_providers.py
+=================
+
+Local Stand-Ins for the LLM, Image and TTS Providers
+
+One HTTP server that imitates the three external APIs closely enough for
+the pipeline's own clients to talk to it unchanged:
+
+    POST /v1/chat/completions       OpenAI-compatible chat (ScriptAnalyzer,
+                                    batched narration)
+    POST /hf/<model>                HF-style text-to-image, returns a PNG
+    POST /v1/text:synthesize        Google TTS-style, base64 LINEAR16 WAV
+
+Each provider ("llm", "image", "tts") has its own behaviour:
+
+    latency      median response time in seconds (log-normal, so there is a tail)
+    error_rate   fraction of requests answered with HTTP 500
+    rps          sustained requests/second before answering 429 + Retry-After
+                 (0 = unlimited)
+
+`GET /stats` returns request, error and 429 counts per provider.
+
+Usage:
+    python -m src.stub_providers --port 8765 --llm-latency 1.5 --image-rps 0.5
+
+and point the pipeline at it:
+    OPENROUTER_API_BASE=http://127.0.0.1:8765/v1
+    HF_INFERENCE_URL=http://127.0.0.1:8765/hf/stub-model
+    GOOGLE_TTS_ENDPOINT=http://127.0.0.1:8765/v1/text:synthesize
+"""
+
+import argparse
+import base64
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from PIL import Image
+
+#: Default behaviour per provider
+DEFAULT_BEHAVIOUR = {
+    "llm": {"latency": 1.0, "error_rate": 0.0, "rps": 0.0},
+    "image": {"latency": 3.0, "error_rate": 0.0, "rps": 0.0},
+    "tts": {"latency": 0.5, "error_rate": 0.0, "rps": 0.0},
+}
+
+#: Spread of the log-normal latency distribution
+LATENCY_SIGMA = 0.5
+
+#: Synthetic speech rate, matches improve_scenes.WORDS_PER_SECOND
+WORDS_PER_SECOND = 2.2
+TTS_SAMPLE_RATE = 24000
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+class ProviderState:
+    """
+    Behaviour and counters of one stub provider.
+    """
+
+    def __init__(self, latency: float, error_rate: float, rps: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rps = rps
+        self.tokens = max(rps, 1.0)
+        self.updated_at = time.monotonic()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def admit(self) -> str:
+        """
+        Decide the fate of one request: "ok", "error" or "throttled".
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rps:
+                now = time.monotonic()
+                self.tokens = min(max(self.rps, 1.0), self.tokens + (now - self.updated_at) * self.rps)
+                self.updated_at = now
+                if self.tokens < 1:
+                    self.stats["throttled"] += 1
+                    return "throttled"
+                self.tokens -= 1
+            if random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return "error"
+            self.stats["ok"] += 1
+            return "ok"
+
+    def delay(self) -> None:
+        if self.latency > 0:
+            time.sleep(random.lognormvariate(math.log(self.latency), LATENCY_SIGMA))
+
+
+def _scenes_from_script(prompt: str):
+    script = prompt.split("SCRIPT:", 1)[-1]
+    sentences = [s.strip() for s in _SENTENCE.split(script) if len(s.split()) >= 4]
+    return [
+        {
+            "scene_id": i,
+            "description": " ".join(sentence.split()[:15]),
+            "visual_focus": "Wide shot, natural light, calm mood",
+        }
+        for i, sentence in enumerate(sentences, start=1)
+    ]
+
+
+def chat_reply(body: Dict) -> str:
+    """
+    Content of the assistant message for a chat request.
+    """
+    prompt = body["messages"][-1]["content"]
+    if body.get("response_format", {}).get("type") == "json_schema":
+        # Batched narration request (src/narration_llm.py)
+        scenes = json.loads(prompt)["scenes"]
+        return json.dumps({"narrations": [
+            {"scene_id": s["scene_id"], "narration": f"{s['description'].rstrip('.')}, as the story moves on."}
+            for s in scenes
+        ]})
+    return json.dumps({"Scenes": _scenes_from_script(prompt)})
+
+
+_PNG_CACHE: Dict[tuple, bytes] = {}
+
+
+def image_bytes(width: int, height: int) -> bytes:
+    key = (width, height)
+    if key not in _PNG_CACHE:
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), (90, 110, 130)).save(buffer, format="PNG")
+        _PNG_CACHE[key] = buffer.getvalue()
+    return _PNG_CACHE[key]
+
+
+def speech_wav(text: str) -> bytes:
+    """
+    Silent 16-bit mono WAV as long as `text` would take to read.
+    """
+    seconds = max(len(text.split()) / WORDS_PER_SECOND, 0.5)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(TTS_SAMPLE_RATE)
+        wav.writeframes(b"\x00\x00" * int(seconds * TTS_SAMPLE_RATE))
+    return buffer.getvalue()
+
+
+def make_handler(providers: Dict[str, ProviderState]):
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data: Dict, headers=None):
+            self._send(status, json.dumps(data).encode("utf-8"), headers=headers)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._json(200, {name: state.stats for name, state in providers.items()})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+
+            path = self.path.split("?", 1)[0]
+            if path.endswith("/chat/completions"):
+                provider = "llm"
+            elif path.startswith("/hf/"):
+                provider = "image"
+            elif path.endswith("text:synthesize"):
+                provider = "tts"
+            else:
+                self._json(404, {"error": "not found"})
+                return
+
+            state = providers[provider]
+            fate = state.admit()
+            if fate == "throttled":
+                retry = max(1, math.ceil(1 / state.rps))
+                self._json(429, {"error": {"code": 429, "message": "rate limited"}},
+                           headers={"Retry-After": str(retry)})
+                return
+            state.delay()
+            if fate == "error":
+                self._json(500, {"error": {"code": 500, "message": "stub failure"}})
+                return
+
+            body = json.loads(raw or b"{}")
+            if provider == "llm":
+                self._json(200, {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": chat_reply(body)},
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+            elif provider == "image":
+                parameters = body.get("parameters") or {}
+                self._send(200, image_bytes(int(parameters.get("width", 512)),
+                                            int(parameters.get("height", 512))),
+                           content_type="image/png")
+            else:
+                audio = base64.b64encode(speech_wav(body["input"]["text"])).decode("ascii")
+                self._json(200, {"audioContent": audio})
+
+    return StubHandler
+
+
+def serve(port: int, behaviour: Dict[str, Dict]) -> None:
+    providers = {name: ProviderState(**settings) for name, settings in behaviour.items()}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(providers))
+    server.daemon_threads = True
+    print(f" Stub providers on http://127.0.0.1:{port}", flush=True)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-ins for the LLM, image and TTS APIs")
+    parser.add_argument("--port", type=int, default=8765)
+    for name, defaults in DEFAULT_BEHAVIOUR.items():
+        parser.add_argument(f"--{name}-latency", type=float, default=defaults["latency"],
+                            help="median seconds")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=defaults["error_rate"])
+        parser.add_argument(f"--{name}-rps", type=float, default=defaults["rps"],
+                            help="requests/second before 429s (0 = unlimited)")
+    args = parser.parse_args()
+
+    behaviour = {
+        name: {
+            "latency": getattr(args, f"{name}_latency"),
+            "error_rate": getattr(args, f"{name}_error_rate"),
+            "rps": getattr(args, f"{name}_rps"),
+        }
+        for name in DEFAULT_BEHAVIOUR
+    }
+    serve(args.port, behaviour)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+timing.py
+=========
+
+Pipeline Timing Instrumentation
+
+Records how long every stage of the pipeline takes, per stage and per
+scene: LLM calls, image and TTS requests, ffprobe, ffmpeg encodes and the
+final stitch. Each span keeps:
+
+- work_s          time spent doing the work
+- wait_s          time the job sat queued before it started (if known)
+- cpu_s           CPU seconds of the subprocess it ran (if any)
+- bytes_written   size of the file it produced (if any)
+
+Spans live in memory and are exported per script run as
+
+    output/traces/<name>.trace.json    plain JSON spans + per-stage summary
+    output/traces/<name>.chrome.json   Chrome trace / Perfetto format
+
+`python -m src.timing` merges every `*.trace.json` in the trace directory
+into one `pipeline.chrome.json` so a whole job can be viewed on one timeline.
+
+Usage:
+    from src.timing import span, run_traced, export_trace
+
+    with span("image_request", stage="image", scene=3) as s:
+        ...
+        s.set(bytes_written=file_size(path))
+
+    export_trace("image_generation")
+"""
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from src.Config import TRACE_DIR
+
+
+class Span:
+    """
+    One timed unit of work. Timestamps are wall-clock epoch seconds so spans
+    from different processes line up on the same timeline.
+    """
+
+    def __init__(self, name: str, stage: Optional[str] = None,
+                 scene: Optional[int] = None, queued_at: Optional[float] = None,
+                 **attrs):
+        self.name = name
+        self.stage = stage or name
+        self.scene = scene
+        self.queued_at = queued_at
+        self.start = time.time()
+        self.end = None
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        """
+        Attach extra fields (cpu_s, bytes_written, ...) to the span.
+        """
+        self.attrs.update(attrs)
+
+    @property
+    def work_s(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    @property
+    def wait_s(self) -> float:
+        if self.queued_at is None:
+            return 0.0
+        return max(self.start - self.queued_at, 0.0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "stage": self.stage,
+            "scene": self.scene,
+            "pid": self.pid,
+            "tid": self.tid,
+            "queued_at": self.queued_at,
+            "start": self.start,
+            "end": self.end,
+            "work_s": round(self.work_s, 4),
+            "wait_s": round(self.wait_s, 4),
+            **self.attrs,
+        }
+
+
+class Tracer:
+    """
+    Thread-safe, in-memory collection of spans for one process.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def _add(self, s: Span) -> None:
+        with self._lock:
+            self.spans.append(s)
+
+    @contextmanager
+    def span(self, name: str, stage: Optional[str] = None,
+             scene: Optional[int] = None, queued_at: Optional[float] = None,
+             **attrs):
+        """
+        Time the enclosed block. Exceptions are recorded on the span and
+        re-raised.
+        """
+        s = Span(name, stage, scene, queued_at, **attrs)
+        try:
+            yield s
+        except BaseException as e:
+            s.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            s.end = time.time()
+            self._add(s)
+
+    def record(self, name: str, start: float, end: float,
+               stage: Optional[str] = None, scene: Optional[int] = None,
+               queued_at: Optional[float] = None, **attrs) -> Span:
+        """
+        Add a span measured elsewhere, e.g. inside a worker process.
+        """
+        s = Span(name, stage, scene, queued_at, **attrs)
+        s.start, s.end = start, end
+        self._add(s)
+        return s
+
+    def export(self, name: str, directory=TRACE_DIR) -> Tuple[str, str]:
+        """
+        Write this process's spans as JSON and Chrome-trace files.
+        """
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{name}.trace.json")
+        chrome_path = os.path.join(directory, f"{name}.chrome.json")
+
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"spans": spans, "summary": summarize(spans)}, f, indent=2)
+        with open(chrome_path, "w", encoding="utf-8") as f:
+            json.dump(to_chrome_trace(spans), f)
+
+        return json_path, chrome_path
+
+
+def summarize(spans: List[Dict]) -> Dict:
+    """
+    Totals per stage/name: count, work, queue wait, CPU and bytes written.
+    """
+    summary: Dict[str, Dict] = {}
+    for s in spans:
+        key = f"{s['stage']}/{s['name']}"
+        entry = summary.setdefault(key, {
+            "count": 0, "work_s": 0.0, "wait_s": 0.0,
+            "cpu_s": 0.0, "bytes_written": 0, "errors": 0,
+        })
+        entry["count"] += 1
+        entry["work_s"] += s["work_s"]
+        entry["wait_s"] += s["wait_s"]
+        entry["cpu_s"] += s.get("cpu_s") or 0.0
+        entry["bytes_written"] += s.get("bytes_written") or 0
+        entry["errors"] += 1 if s.get("error") else 0
+
+    for entry in summary.values():
+        for field in ("work_s", "wait_s", "cpu_s"):
+            entry[field] = round(entry[field], 3)
+    return summary
+
+
+def to_chrome_trace(spans: List[Dict]) -> Dict:
+    """
+    Convert spans to the Chrome trace event format (also read by Perfetto).
+    Queue wait is drawn as an async slice ending where the work starts.
+    """
+    events = []
+    for index, s in enumerate(spans):
+        args = {k: v for k, v in s.items()
+                if k not in ("name", "pid", "tid", "start", "end", "queued_at")}
+        events.append({
+            "name": s["name"] if s["scene"] is None else f"{s['name']} #{s['scene']}",
+            "cat": s["stage"],
+            "ph": "X",
+            "ts": int(s["start"] * 1e6),
+            "dur": int(s["work_s"] * 1e6),
+            "pid": s["pid"],
+            "tid": s["tid"],
+            "args": args,
+        })
+        if s["wait_s"] > 0:
+            # Async begin/end pair: queue waits overlap, so they get own tracks
+            wait = {
+                "name": f"{s['name']} (queued)",
+                "cat": "queue",
+                "id": index,
+                "pid": s["pid"],
+                "tid": s["tid"],
+                "args": {"scene": s["scene"]},
+            }
+            events.append({**wait, "ph": "b", "ts": int(s["queued_at"] * 1e6)})
+            events.append({**wait, "ph": "e", "ts": int(s["start"] * 1e6)})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def file_size(path: Optional[str]) -> int:
+    """
+    Size of `path` in bytes, 0 if it does not exist.
+    """
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+
+def poll_rusage(proc: subprocess.Popen, block: bool = False
+                ) -> Optional[Tuple[int, Optional[float], Optional[float]]]:
+    """
+    Reap `proc` and return (returncode, cpu_s, peak_rss_mb), or None if it
+    is still running and `block` is False.
+
+    CPU and memory come from the child's own rusage via `os.wait4`; both
+    are None on platforms without it.
+    """
+    if not hasattr(os, "wait4"):
+        returncode = proc.wait() if block else proc.poll()
+        return None if returncode is None else (returncode, None, None)
+
+    pid, status, usage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    cpu_s = round(usage.ru_utime + usage.ru_stime, 3)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return proc.returncode, cpu_s, round(usage.ru_maxrss / scale, 1)
+
+
+def wait_rusage(proc: subprocess.Popen) -> Tuple[int, Optional[float], Optional[float]]:
+    """
+    Wait for `proc` and return (returncode, cpu_s, peak_rss_mb).
+    """
+    return poll_rusage(proc, block=True)
+
+
+def run_traced(cmd: List[str], name: str, stage: Optional[str] = None,
+               scene: Optional[int] = None, output: Optional[str] = None,
+               queued_at: Optional[float] = None, check: bool = True,
+               **popen_kwargs) -> int:
+    """
+    Run a subprocess inside a span that records its CPU time, peak RSS and
+    the bytes written to `output`. Raises CalledProcessError when `check`
+    is set and the command fails.
+    """
+    with span(name, stage=stage, scene=scene, queued_at=queued_at) as s:
+        proc = subprocess.Popen(cmd, **popen_kwargs)
+        returncode, cpu_s, peak_rss_mb = wait_rusage(proc)
+        s.set(returncode=returncode, cpu_s=cpu_s, peak_rss_mb=peak_rss_mb,
+              bytes_written=file_size(output))
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+    return returncode
+
+
+#: Process-wide tracer used by every stage
+TRACER = Tracer()
+span = TRACER.span
+record = TRACER.record
+export_trace = TRACER.export
+
+
+def merge_traces(directory=TRACE_DIR, name: str = "pipeline") -> str:
+    """
+    Merge every exported `*.trace.json` into one Chrome trace and summary.
+    """
+    spans = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.trace.json"))):
+        if os.path.basename(path) == f"{name}.trace.json":
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            spans.extend(json.load(f)["spans"])
+
+    with open(os.path.join(directory, f"{name}.trace.json"), "w", encoding="utf-8") as f:
+        json.dump({"spans": spans, "summary": summarize(spans)}, f, indent=2)
+
+    chrome_path = os.path.join(directory, f"{name}.chrome.json")
+    with open(chrome_path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(spans), f)
+    return chrome_path
+
+
+if __name__ == "__main__":
+    merged = merge_traces()
+    with open(os.path.join(TRACE_DIR, "pipeline.trace.json"), "r", encoding="utf-8") as f:
+        totals = json.load(f)["summary"]
+
+    for key, entry in sorted(totals.items(), key=lambda kv: -kv[1]["work_s"]):
+        print(
+            f" {key:<32} n={entry['count']:<5} work={entry['work_s']:>9.2f}s "
+            f"wait={entry['wait_s']:>8.2f}s cpu={entry['cpu_s']:>8.2f}s "
+            f"written={entry['bytes_written'] / 1e6:.1f}MB"
+        )
+    print(f" Merged trace → {merged}")
@@ -12,3 +12,13 @@ def validate_scene(scene):
             raise ValueError(f"Missing required scene field: {key}")
         if not isinstance(scene[key], expected_type):
             raise TypeError(f"{key} must be {expected_type}")
+
+
+def validate_scenes(scenes):
+    """
+    Validate scenes one at a time as they are consumed, yielding each
+    scene that passes (works on any iterable, including streamed ones).
+    """
+    for scene in scenes:
+        validate_scene(scene)
+        yield scene
@@ -1,6 +1,8 @@
 import os
 import json
+import hashlib
 import logging
+import wave
 
 
 def load_script(file_path: str) -> str:
@@ -24,3 +26,51 @@ def save_json(file_path: str, data) -> None:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
     logging.info(f"Saved JSON → {file_path}")
+
+
+def wav_duration(audio_path: str) -> float:
+    """
+    Duration of a PCM WAV file in seconds, read from its header.
+    """
+    with wave.open(audio_path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def is_up_to_date(output_path: str, *input_paths: str) -> bool:
+    """
+    True if `output_path` exists and is newer than every existing input.
+    """
+    if not os.path.exists(output_path):
+        return False
+    output_mtime = os.path.getmtime(output_path)
+    return all(
+        os.path.getmtime(path) <= output_mtime
+        for path in input_paths if os.path.exists(path)
+    )
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def read_stamp(path: str) -> dict:
+    """
+    The settings `path` was made with, from its `<path>.json` sidecar;
+    empty if there is none (made by an older run) or it is unreadable.
+    """
+    try:
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def write_stamp(path: str, **stamp) -> str:
+    """
+    Record the settings `path` was made with next to it. Returns the
+    sidecar path.
+    """
+    stamp_path = f"{path}.json"
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        json.dump(stamp, f)
+    return stamp_path
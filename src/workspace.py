@@ -0,0 +1,296 @@
+"""
+workspace.py
+============
+
+Scratch Workspace for Intermediates
+
+Scene clips, the narration WAV, the concat list and MoviePy's temp audio
+are only needed until the final video has been stitched. The workspace
+keeps a ledger of the bytes every stage writes and deletes them on request
+once stitch_final_video.py has verified the final video. Scratch files
+that only the writing process reads go on a RAM-backed filesystem
+(WORKSPACE_RAM_DIR, /dev/shm on Linux) when it has room and on disk
+otherwise.
+
+- stage_dir(path, stage)
+    The directory a stage writes its files to. It stays a plain directory
+    in the project tree: render_queue.py workers on other machines share
+    it, and a host-local RAM directory would be invisible to them.
+- temp_path(name, expected_bytes)
+    A scratch file path, on the RAM tier if the file fits.
+- record(stage, path)
+    Adds a finished file to the ledger.
+- collect(stages)
+    Deletes the recorded files of `stages` (every stage if None), the
+    scratch files and the RAM directory.
+
+A tier has room when its free space minus WORKSPACE_RAM_RESERVE_MB (left
+for the encoders) covers the expected bytes. The ledger,
+WORKSPACE_DISK_DIR/<job>/manifest.jsonl, gets one line appended per file, so
+concurrent render threads and processes can share it. The job key defaults
+to one derived from BASE_DIR, so load-test runs never share a workspace.
+
+Usage:
+    python -m src.workspace              # footprint per stage and tier
+    python -m src.workspace --collect    # delete the intermediates now
+    python -m src.workspace --collect scene_videos   # only this stage's files
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from src.Config import (
+    BASE_DIR,
+    WORKSPACE_DISK_DIR,
+    WORKSPACE_JOB,
+    WORKSPACE_RAM_DIR,
+    WORKSPACE_RAM_RESERVE_MB,
+)
+
+RAM = "ram"
+DISK = "disk"
+
+MB = 1 << 20
+
+
+def default_job() -> str:
+    base = Path(BASE_DIR).resolve()
+    return f"{base.name}-{hashlib.sha1(str(base).encode('utf-8')).hexdigest()[:8]}"
+
+
+def _is_within(path: Path, root: Optional[Path]) -> bool:
+    if root is None:
+        return False
+    try:
+        Path(os.path.realpath(path)).relative_to(os.path.realpath(root))
+        return True
+    except ValueError:
+        return False
+
+
+class Workspace:
+    """
+    Per-job scratch space on a RAM tier with a disk tier to spill to.
+
+    Parameters
+    ----------
+    job : str, optional
+        Workspace key; default_job() if None.
+    ram_root : str or None
+        Directory on a RAM-backed filesystem; None or "" disables the tier.
+    disk_root : path
+        Directory on disk for the ledger and spilled scratch files.
+    ram_reserve : int
+        Bytes of free RAM-tier space never used for scratch files.
+    """
+
+    def __init__(self, job: Optional[str] = WORKSPACE_JOB, ram_root: Optional[str] = WORKSPACE_RAM_DIR,
+                 disk_root=WORKSPACE_DISK_DIR, ram_reserve: int = WORKSPACE_RAM_RESERVE_MB * MB):
+        self.job = job or default_job()
+        self.ram_dir = Path(ram_root) / self.job if ram_root else None
+        self.disk_dir = Path(disk_root) / self.job
+        self.ram_reserve = ram_reserve
+        self.manifest = self.disk_dir / "manifest.jsonl"
+        self._lock = threading.Lock()
+
+    # -- placement -----------------------------------------------------------
+
+    def ram_free(self) -> int:
+        """
+        Bytes the RAM tier can still take (0 if it is unavailable).
+        """
+        if self.ram_dir is None:
+            return 0
+        # The workspace directory may not exist yet: measure its nearest ancestor
+        probe = self.ram_dir
+        while not probe.exists():
+            if probe.parent == probe:
+                return 0
+            probe = probe.parent
+        if not os.access(probe, os.W_OK):
+            return 0
+        return max(0, shutil.disk_usage(probe).free - self.ram_reserve)
+
+    def fits_in_ram(self, expected_bytes: int) -> bool:
+        return self.ram_dir is not None and self.ram_free() >= max(expected_bytes, 1)
+
+    def stage_dir(self, path, stage: str) -> str:
+        """
+        Create the directory `path` for `stage` and add it to the ledger.
+        Returns `path`.
+        """
+        path = Path(path)
+        if path.is_symlink():
+            # Linked into a RAM directory by an earlier version: bring the
+            # clips that are still there back into a plain directory
+            target = Path(os.path.realpath(path))
+            path.unlink()
+            os.makedirs(path, exist_ok=True)
+            if target.is_dir():
+                for name in os.listdir(target):
+                    shutil.move(str(target / name), str(path / name))
+        os.makedirs(path, exist_ok=True)
+
+        self._append({"stage": stage, "dir": str(path), "tier": DISK})
+        print(f" Workspace: {stage} → {path}")
+        return str(path)
+
+    def temp_path(self, name: str, expected_bytes: int = 0) -> str:
+        """
+        Path for a scratch file, in `<tier>/<job>/tmp/`. Scratch files are
+        deleted by collect() whether or not they were recorded.
+        """
+        root = (self.ram_dir if self.fits_in_ram(expected_bytes) else self.disk_dir) / "tmp"
+        os.makedirs(root, exist_ok=True)
+        return str(root / name)
+
+    # -- ledger --------------------------------------------------------------
+
+    def _append(self, entry: Dict) -> None:
+        entry["time"] = round(time.time(), 3)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # One write per line: O_APPEND keeps lines whole across processes
+            with open(self.manifest, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def record(self, stage: str, path) -> int:
+        """
+        Add the finished file `path` to the ledger. Returns its size.
+        """
+        size = os.path.getsize(path)
+        tier = RAM if _is_within(Path(path), self.ram_dir) else DISK
+        self._append({"stage": stage, "path": str(path), "tier": tier, "bytes": size})
+        return size
+
+    def entries(self) -> List[Dict]:
+        if not self.manifest.exists():
+            return []
+        entries = []
+        with open(self.manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut off by a crash
+                    continue
+        return entries
+
+    def usage(self) -> Dict[str, Dict]:
+        """
+        Per stage: files and bytes held now (by tier) and bytes written in
+        total, re-renders included.
+        """
+        latest: Dict[str, Dict] = {}
+        stages: Dict[str, Dict] = {}
+        for entry in self.entries():
+            stats = stages.setdefault(entry["stage"], {"files": 0, RAM: 0, DISK: 0, "written": 0})
+            if "path" in entry:
+                stats["written"] += entry["bytes"]
+                latest[entry["path"]] = entry
+        for path, entry in latest.items():
+            if os.path.exists(path):
+                stats = stages[entry["stage"]]
+                stats["files"] += 1
+                stats[entry["tier"]] += entry["bytes"]
+        return stages
+
+    # -- cleanup -------------------------------------------------------------
+
+    def collect(self, stages: Optional[Iterable[str]] = None) -> int:
+        """
+        Delete the recorded files of `stages` (every stage if None), the
+        scratch files and the job's RAM directory. Stage directories are
+        removed if nothing else is left in them; other stages stay in the
+        ledger. Returns the bytes freed.
+        """
+        stages = None if stages is None else set(stages)
+        freed = 0
+        stage_dirs, kept = [], []
+        for entry in self.entries():
+            if stages is not None and entry["stage"] not in stages:
+                kept.append(entry)
+            elif "dir" in entry:
+                stage_dirs.append(Path(entry["dir"]))
+            else:
+                try:
+                    size = os.path.getsize(entry["path"])
+                    os.remove(entry["path"])
+                    freed += size
+                except FileNotFoundError:
+                    pass
+
+        for path in dict.fromkeys(stage_dirs):
+            try:
+                path.rmdir()
+            except OSError:
+                # Holds files this workspace did not write
+                pass
+
+        for root in (self.ram_dir, self.disk_dir / "tmp"):
+            if root is not None and root.exists():
+                freed += sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+                shutil.rmtree(root, ignore_errors=True)
+
+        with self._lock:
+            if kept:
+                partial = self.manifest.with_suffix(".jsonl.part")
+                with open(partial, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in kept)
+                os.replace(partial, self.manifest)
+                return freed
+            if self.manifest.exists():
+                self.manifest.unlink()
+        try:
+            self.disk_dir.rmdir()
+        except OSError:
+            pass
+        return freed
+
+
+_workspace: Optional[Workspace] = None
+
+
+def workspace() -> Workspace:
+    global _workspace
+    if _workspace is None:
+        _workspace = Workspace()
+    return _workspace
+
+
+def print_usage(ws: Workspace) -> None:
+    stages = ws.usage()
+    if not stages:
+        print(f" Workspace {ws.job}: nothing recorded")
+        return
+    print(f" Workspace {ws.job} (RAM tier: {ws.ram_dir or 'disabled'}, "
+          f"{ws.ram_free() / MB:.0f} MB free)")
+    print(f" {'stage':<22} {'files':>6} {'ram MB':>9} {'disk MB':>9} {'written MB':>11}")
+    for stage, stats in stages.items():
+        print(f" {stage:<22} {stats['files']:>6} {stats[RAM] / MB:>9.1f} "
+              f"{stats[DISK] / MB:>9.1f} {stats['written'] / MB:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scratch workspace usage")
+    parser.add_argument("--collect", nargs="*", metavar="STAGE",
+                        help="delete the intermediates of these stages (all if none given) "
+                             "without waiting for a verified stitch")
+    args = parser.parse_args()
+
+    ws = workspace()
+    print_usage(ws)
+    if args.collect is not None:
+        print(f" Collected {ws.collect(args.collect or None) / MB:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
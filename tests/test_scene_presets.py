@@ -0,0 +1,22 @@
+from src.scene_presets import KeywordClassifier, load_presets
+
+
+def test_phrase_does_not_hide_higher_priority_keyword():
+    background = load_presets()["background_audio"]
+    # "factory district" (city, 48) starts with "factory" (workshop, 50)
+    assert background.preset_name("Smoke drifts over the factory district") == "workshop"
+    assert background.preset_names(["Smoke drifts over the factory district"]) == ["workshop"]
+
+
+def test_keyword_starting_inside_a_match_counts():
+    classifier = KeywordClassifier(
+        [("street", 10, ["old factory"]), ("district", 20, ["factory district"])], "default"
+    )
+    text = "the old factory district at night"
+    assert classifier.classify(text) == "district"
+    assert classifier.classify_all(["quiet fields", text]) == ["default", "district"]
+
+
+def test_whole_words_only():
+    classifier = KeywordClassifier([("workshop", 50, ["mill"])], "default")
+    assert classifier.classify_all(["a windmill turns", "the mill turns"]) == ["default", "workshop"]